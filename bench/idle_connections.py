@@ -0,0 +1,175 @@
+# bench/idle_connections.py
+"""
+Connection lifecycle benchmark (offline, fake Telegram client).
+
+Runs the join scheduler over --sessions sessions with --links links each
+and samples RSS and open file descriptors while the sessions wait out
+their join delay. Each mode runs in a fresh interpreter:
+
+- always:  clients never disconnect (like one connected coroutine per session)
+- idle:    clients disconnect when their next join is > --idle-disconnect away
+
+The fake client holds a socketpair (2 fds), a --buffer-kib receive buffer
+and a reader task per connection, standing in for Telethon's socket,
+buffers and update loop. Times are scaled down (seconds instead of the
+real 90 s delay).
+
+Usage:
+    python -m bench.idle_connections --sessions 400
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+_PAGE = os.sysconf("SC_PAGE_SIZE")
+
+
+def _rss_mib() -> float:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * _PAGE / 2**20
+
+
+def _fds() -> int:
+    return len(os.listdir("/proc/self/fd"))
+
+
+class _FakeSession:
+    def __init__(self, s: str):
+        self.s = s
+
+    def save(self) -> str:
+        return self.s
+
+
+class FakeClient:
+    buffer_bytes = 256 * 1024
+    rpc_seconds = 0.05
+
+    def __init__(self, session_string: str):
+        self.session = _FakeSession(session_string)
+        self._socks = None
+        self._buf = None
+        self._reader = None
+
+    def is_connected(self) -> bool:
+        return self._socks is not None
+
+    async def connect(self) -> None:
+        await asyncio.sleep(0.01)
+        self._socks = socket.socketpair()
+        self._buf = bytearray(self.buffer_bytes)
+        self._buf[::4096] = b"x" * len(self._buf[::4096])  # touch pages
+        self._reader = asyncio.create_task(self._updates())
+
+    async def _updates(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._socks[0].setblocking(False)
+        while True:
+            await loop.sock_recv(self._socks[0], 4096)
+
+    async def disconnect(self) -> None:
+        if self._reader:
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        if self._socks:
+            for s in self._socks:
+                s.close()
+        self._socks = self._buf = self._reader = None
+
+    async def __call__(self, request):
+        await asyncio.sleep(self.rpc_seconds)
+
+
+async def _run(args) -> dict:
+    from bot import db
+    from bot.scheduler import run_join_scheduler
+
+    db.init_db()
+    for i in range(args.sessions):
+        db.add_session(f"bench-session-{i:05d}".ljust(120, "x"))
+    db.add_links([f"https://t.me/bench{i}" for i in range(args.sessions * args.links)], "bench")
+    with db.get_conn() as conn:
+        ids = [r[0] for r in conn.execute("SELECT id FROM sessions ORDER BY id")]
+    for sid in ids:
+        db.assign_unassigned_links(sid, args.links)
+
+    FakeClient.buffer_bytes = args.buffer_kib * 1024
+    samples = []
+    done = asyncio.Event()
+
+    async def sampler():
+        while not done.is_set():
+            samples.append((_rss_mib(), _fds()))
+            await asyncio.sleep(0.2)
+
+    base = (_rss_mib(), _fds())
+    sampler_task = asyncio.create_task(sampler())
+    idle = float("inf") if args.mode == "always" else args.idle_disconnect
+    t0 = time.monotonic()
+    res = await run_join_scheduler(
+        [(sid, f"s{sid}") for sid in ids],
+        max_active=args.max_active,
+        idle_disconnect=idle,
+        join_delay=args.join_delay,
+        client_factory=FakeClient,
+    )
+    wall = time.monotonic() - t0
+    done.set()
+    await sampler_task
+
+    return {
+        "mode": args.mode,
+        "wall": wall,
+        "joined": sum(r["success"] for r in res),
+        "base_rss": base[0],
+        "base_fds": base[1],
+        "peak_rss": max(s[0] for s in samples),
+        "mean_rss": sum(s[0] for s in samples) / len(samples),
+        "peak_fds": max(s[1] for s in samples),
+        "mean_fds": sum(s[1] for s in samples) / len(samples),
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sessions", type=int, default=400)
+    ap.add_argument("--links", type=int, default=3)
+    ap.add_argument("--max-active", type=int, default=50)
+    ap.add_argument("--join-delay", type=float, default=3.0)
+    ap.add_argument("--idle-disconnect", type=float, default=1.0)
+    ap.add_argument("--buffer-kib", type=int, default=256)
+    ap.add_argument("--mode", choices=("always", "idle"))
+    args = ap.parse_args(argv)
+
+    if args.mode:
+        os.environ["DB_PATH"] = os.path.join(tempfile.mkdtemp(prefix="idle-bench-"), "bench.db")
+        print(json.dumps(asyncio.run(_run(args))))
+        return 0
+
+    results = []
+    for mode in ("always", "idle"):
+        cmd = [sys.executable, "-m", "bench.idle_connections", "--mode", mode] + list(argv or sys.argv[1:])
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    for r in results:
+        print(
+            f"{r['mode']:>6}: joined {r['joined']} in {r['wall']:.1f}s | "
+            f"RSS peak {r['peak_rss']:.1f} MiB (+{r['peak_rss'] - r['base_rss']:.1f}), "
+            f"mean +{r['mean_rss'] - r['base_rss']:.1f} | "
+            f"fds peak {r['peak_fds']} (+{r['peak_fds'] - r['base_fds']}), mean {r['mean_fds']:.0f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+# bench/ingest.py
+"""
+Link ingestion benchmark (re-extraction of already-known links).
+
+Fills a scratch DB with --existing links, then re-ingests --batch links of
+which --known-ratio are already stored, via db.add_links() in chunks of
+1000 (like extraction / file import). Compares:
+- filter:   known-link filter on (default)
+- nofilter: filter off, every link goes to INSERT OR IGNORE
+- per-row: one INSERT OR IGNORE per link (add_links before the filter)
+
+Usage:
+    python -m bench.ingest --existing 1000000 --batch 200000 --known-ratio 0.95
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+CHUNK = 1000
+
+
+def _links(start: int, count: int) -> list[str]:
+    return [f"https://t.me/+bench{i:010d}" for i in range(start, start + count)]
+
+
+def _per_row_add(db, links: list[str], source: str) -> int:
+    from bot.utils import link_key
+
+    added = 0
+    with db.get_conn() as conn:
+        cur = conn.cursor()
+        for link in links:
+            cur.execute(
+                "INSERT OR IGNORE INTO links(kind, value, source_channel, status) VALUES(?,?,?, 'active')",
+                (*link_key(link), source),
+            )
+            added += cur.rowcount > 0
+        conn.commit()
+    return added
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--existing", type=int, default=200_000)
+    ap.add_argument("--batch", type=int, default=100_000)
+    ap.add_argument("--known-ratio", type=float, default=0.95)
+    args = ap.parse_args(argv)
+
+    tmp = tempfile.mkdtemp(prefix="ingest-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+
+    from bot import db
+
+    db.init_db()
+    existing = _links(0, args.existing)
+    for i in range(0, len(existing), 10_000):
+        with db.get_conn() as conn:
+            conn.executemany(
+                "INSERT INTO links(kind, value, source_channel, status) VALUES(2, ?, 'seed', 'active')",
+                [(l.rsplit("+", 1)[1],) for l in existing[i:i + 10_000]],
+            )
+            conn.commit()
+
+    n_known = int(args.batch * args.known_ratio)
+    batch = random.Random(1).sample(existing, n_known)
+
+    new_start = args.existing
+    results = {}
+    for mode in ("per-row", "nofilter", "filter"):
+        fresh = _links(new_start, args.batch - n_known)
+        new_start += len(fresh)
+        links = batch + fresh
+        random.Random(2).shuffle(links)
+
+        db.LINK_FILTER_ENABLED = mode == "filter"
+        load_s = 0.0
+        if mode == "filter":
+            t = time.perf_counter()
+            with db.get_conn() as conn:
+                db._known_links = db.KnownLinks(db._iter_all_links(conn))
+            load_s = time.perf_counter() - t
+
+        added = 0
+        t = time.perf_counter()
+        for i in range(0, len(links), CHUNK):
+            chunk = links[i:i + CHUNK]
+            if mode == "per-row":
+                added += _per_row_add(db, chunk, "bench")
+            else:
+                added += db.add_links(chunk, "bench")
+        elapsed = time.perf_counter() - t
+        results[mode] = elapsed
+
+        extra = ""
+        if mode == "filter":
+            known = db._known_links
+            extra = f" | filter load {load_s:.2f}s, {len(known)} links, {known.size_bytes / 1e6:.2f} MB"
+        print(f"{mode:>8}: {elapsed:.2f}s for {len(links)} links, added {added}{extra}")
+
+    print(f"speedup filter vs per-row: {results['per-row'] / results['filter']:.1f}x, "
+          f"vs nofilter: {results['nofilter'] / results['filter']:.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# bench/link_storage.py
+"""
+Link storage benchmark: old URL format vs (kind, value) + join_log.link_id.
+
+Builds a scratch DB in the old format (links.link TEXT UNIQUE, join_log
+copying the URL) with --links links (70% invite, 25% username, 5% folder)
+and --log-rows join_log rows, then runs db.init_db(), which converts it,
+and db.vacuum_full() (owner /vacuum) to shrink the file.
+Reports:
+- file size and per-table / per-index size (dbstat) before and after
+- migration time (startup) and vacuum time (separate, on demand)
+- per-join link handling: parse_link_type(url) (old joiner) vs reading
+  the stored kind code
+
+Usage:
+    python -m bench.link_storage --links 1000000 --log-rows 1000000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+
+def _urls(n: int):
+    rnd = random.Random(1)
+    for i in range(n):
+        r = rnd.random()
+        if r < 0.70:
+            yield f"https://t.me/+{rnd.getrandbits(96):024x}"[:38]
+        elif r < 0.95:
+            yield f"https://t.me/channel_{i:08d}"
+        else:
+            yield f"https://t.me/addlist/{rnd.getrandbits(64):016x}"
+
+
+def _build_old(path: str, args) -> None:
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        PRAGMA journal_mode=WAL;
+        CREATE TABLE sessions (
+          id INTEGER PRIMARY KEY AUTOINCREMENT, session_string TEXT UNIQUE NOT NULL,
+          phone TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, status TEXT DEFAULT 'active');
+        CREATE TABLE links (
+          id INTEGER PRIMARY KEY AUTOINCREMENT, link TEXT UNIQUE NOT NULL,
+          source_channel TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          status TEXT DEFAULT 'active', dead_reason TEXT, last_checked_at TIMESTAMP);
+        CREATE TABLE assignments (
+          link_id INTEGER UNIQUE NOT NULL, session_id INTEGER NOT NULL,
+          assigned_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, join_status TEXT DEFAULT 'pending',
+          join_attempts INTEGER DEFAULT 0, last_error TEXT, joined_at TIMESTAMP,
+          PRIMARY KEY(link_id));
+        CREATE TABLE join_log (
+          id INTEGER PRIMARY KEY AUTOINCREMENT, session_id INTEGER, link TEXT,
+          status TEXT, error_message TEXT, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP);
+    """)
+    urls = list(_urls(args.links))
+    conn.executemany(
+        "INSERT OR IGNORE INTO links(link, source_channel) VALUES(?, 'https://t.me/source_channel')",
+        ((u,) for u in urls),
+    )
+    n = min(args.links, args.sessions * 1000)
+    conn.executemany(
+        "INSERT INTO assignments(link_id, session_id, join_status) VALUES(?,?,?)",
+        ((i + 1, i // 1000 + 1, "pending" if i % 3 else "success") for i in range(n)),
+    )
+    conn.executemany(
+        "INSERT INTO join_log(session_id, link, status, error_message) VALUES(?,?,?,'')",
+        ((i % args.sessions + 1, urls[i % len(urls)], "success") for i in range(args.log_rows)),
+    )
+    conn.commit()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("VACUUM")
+    conn.close()
+
+
+def _sizes(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name").fetchall()
+    conn.close()
+    out = {name: size for name, size in rows if not name.startswith("sqlite_s")}
+    out["(file)"] = os.path.getsize(path)
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--links", type=int, default=500_000)
+    ap.add_argument("--sessions", type=int, default=300)
+    ap.add_argument("--log-rows", type=int, default=500_000)
+    args = ap.parse_args(argv)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="link-storage-bench-"), "bench.db")
+    os.environ["DB_PATH"] = path
+    t0 = time.perf_counter()
+    _build_old(path, args)
+    print(f"built old-format DB in {time.perf_counter() - t0:.1f}s")
+    before = _sizes(path)
+
+    from bot import db
+    from bot.utils import parse_link_type
+
+    t0 = time.perf_counter()
+    db.init_db()
+    migrate_s = time.perf_counter() - t0
+    db.wal_checkpoint("TRUNCATE")
+    migrated_bytes = os.path.getsize(path)
+    t0 = time.perf_counter()
+    db.vacuum_full()
+    vacuum_s = time.perf_counter() - t0
+    after = _sizes(path)
+
+    print(f"migration: {migrate_s:.1f}s (file {migrated_bytes / 2**20:.1f} MiB until vacuumed)")
+    print(f"vacuum_full: {vacuum_s:.1f}s")
+    print(f"{'object':<36}{'old MiB':>10}{'new MiB':>10}")
+    for name in sorted(set(before) | set(after), key=lambda k: -max(before.get(k, 0), after.get(k, 0))):
+        print(f"{name:<36}{before.get(name, 0) / 2**20:>10.1f}{after.get(name, 0) / 2**20:>10.1f}")
+
+    sample = [u for u, _ in zip(_urls(args.links), range(100_000))]
+    t0 = time.perf_counter()
+    for u in sample:
+        parse_link_type(u)
+    parse_us = (time.perf_counter() - t0) / len(sample) * 1e6
+    rows = db.get_pending_links_for_session(1, 1000)
+    print(f"per join: parse_link_type {parse_us:.2f} us -> 0 (kind stored; {len(rows)} pending rows read as "
+          f"(id, kind, value))")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,179 @@
+# bench/sqlite_profile.py
+"""
+SQLite storage profile benchmark (offline, synthetic DB).
+
+Builds a scratch DB with --links links, --sessions sessions (1000
+assignments each) and --log-rows join_log rows, then times the bot's hot
+DB operations with:
+
+- baseline: new connection per call, journal_mode=WAL + synchronous=NORMAL
+  only (old get_conn)
+- profile:  per-thread connection + storage profile (mmap, cache,
+  temp_store, WAL limits)
+
+Reads: get_pending_links_for_session, count_links_unassigned_active,
+get_stats(no per-session), get_session_stats_page.
+Writes: log_join, mark_join_success (one connection + commit each).
+
+Then a WAL growth check: --burst log_join writes while a reader keeps a
+read transaction open (checkpoints cannot complete), the WAL size after
+the reader is gone and 1000 more writes (autocheckpoint only), and after
+one maintenance pass (bot.maintenance.run_once(full=True)).
+
+Each mode runs in a fresh interpreter against the same DB file.
+
+Usage:
+    python -m bench.sqlite_profile --links 1000000 --log-rows 1000000
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def _build(path: str, args) -> None:
+    os.environ["DB_PATH"] = path
+    from bot import db
+
+    db.init_db()
+    with db.get_conn() as conn:
+        conn.executemany(
+            "INSERT INTO sessions(session_string) VALUES(?)",
+            ((f"bench-{i:06d}".ljust(300, "x"),) for i in range(args.sessions)),
+        )
+        conn.executemany(
+            "INSERT INTO links(kind, value, source_channel, status) VALUES(2, ?, 'bench', 'active')",
+            ((f"bench{i:010d}",) for i in range(args.links)),
+        )
+        assigned = min(args.links, args.sessions * 1000)
+        statuses = ("pending", "success", "failed", "requested")
+        conn.executemany(
+            "INSERT INTO assignments(link_id, session_id, join_status) VALUES(?,?,?)",
+            ((i + 1, i // 1000 + 1, statuses[i % 4]) for i in range(assigned)),
+        )
+        conn.executemany(
+            "INSERT INTO join_log(session_id, link_id, status, error_message) VALUES(?,?,?,?)",
+            (
+                (i % args.sessions + 1, i % args.links + 1, "success", "")
+                for i in range(args.log_rows)
+            ),
+        )
+        conn.commit()
+    db.wal_checkpoint("TRUNCATE")
+
+
+def _pcts(samples) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": statistics.median(samples) * 1000,
+        "p95_ms": samples[int(len(samples) * 0.95) - 1] * 1000,
+    }
+
+
+def _time(fn, n: int) -> dict:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        out.append(time.perf_counter() - t0)
+    return _pcts(out)
+
+
+def _run(path: str, mode: str, args) -> dict:
+    os.environ["DB_PATH"] = path
+    from bot import db, maintenance
+
+    if mode == "baseline":
+        db._CONN_PRAGMAS = db._CONN_PRAGMAS[:2]
+        db._REUSE_CONNECTIONS = False
+
+    rnd = random.Random(1)
+    sessions = args.sessions
+    res = {"mode": mode}
+
+    # warm-up (page cache / mmap)
+    db.get_stats(include_per_session=False)
+
+    res["get_pending_links_for_session"] = _time(
+        lambda: db.get_pending_links_for_session(rnd.randint(1, sessions), 1000), args.reads
+    )
+    res["count_links_unassigned_active"] = _time(db.count_links_unassigned_active, max(args.reads // 10, 5))
+    res["get_stats"] = _time(lambda: db.get_stats(include_per_session=False), max(args.reads // 10, 5))
+    res["get_session_stats_page"] = _time(
+        lambda: db.get_session_stats_page(rnd.randint(0, sessions - 20), "next", 20), args.reads
+    )
+    res["log_join"] = _time(
+        lambda: db.log_join(rnd.randint(1, sessions), rnd.randint(1, args.links), "success", ""), args.writes
+    )
+    res["mark_join_success"] = _time(
+        lambda: db.mark_join_success((lid := rnd.randint(1, sessions * 1000)) // 1000 + 1, lid), args.writes
+    )
+
+    # WAL growth under a long-running reader, then one maintenance pass
+    db.wal_checkpoint("TRUNCATE")
+    reader = sqlite3.connect(path)
+    reader.execute("BEGIN")
+    reader.execute("SELECT COUNT(*) FROM join_log").fetchone()
+    for _ in range(args.burst):
+        db.log_join(rnd.randint(1, sessions), rnd.randint(1, args.links), "failed", "x" * 200)
+    res["wal_after_burst_mib"] = db.storage_info()["wal_bytes"] / 2**20
+    reader.rollback()
+    reader.close()
+    for _ in range(1000):
+        db.log_join(rnd.randint(1, sessions), rnd.randint(1, args.links), "failed", "")
+    res["wal_after_reader_mib"] = db.storage_info()["wal_bytes"] / 2**20
+    m = maintenance.run_once(full=True)
+    res["wal_after_maintenance_mib"] = m["wal_bytes"] / 2**20
+    res["maintenance_s"] = sum(m["timings"].values())
+    return res
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--links", type=int, default=500_000)
+    ap.add_argument("--sessions", type=int, default=300)
+    ap.add_argument("--log-rows", type=int, default=500_000)
+    ap.add_argument("--reads", type=int, default=200)
+    ap.add_argument("--writes", type=int, default=500)
+    ap.add_argument("--burst", type=int, default=20_000)
+    ap.add_argument("--mode", choices=("baseline", "profile"))
+    ap.add_argument("--db")
+    args = ap.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(_run(args.db, args.mode, args)))
+        return 0
+
+    path = os.path.join(tempfile.mkdtemp(prefix="sqlite-bench-"), "bench.db")
+    t0 = time.perf_counter()
+    _build(path, args)
+    print(f"built {os.path.getsize(path) / 2**20:.0f} MiB DB in {time.perf_counter() - t0:.1f}s")
+
+    passthrough = list(argv if argv is not None else sys.argv[1:])
+    results = []
+    for mode in ("baseline", "profile"):
+        cmd = [sys.executable, "-m", "bench.sqlite_profile", "--mode", mode, "--db", path] + passthrough
+        out = subprocess.run(cmd, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(out.strip().splitlines()[-1]))
+
+    ops = [k for k, v in results[0].items() if isinstance(v, dict)]
+    print(f"{'op':<32}" + "".join(f"{r['mode'] + ' p50/p95 ms':>26}" for r in results))
+    for op in ops:
+        print(f"{op:<32}" + "".join(f"{r[op]['p50_ms']:>14.3f} / {r[op]['p95_ms']:<9.3f}" for r in results))
+    for r in results:
+        print(
+            f"{r['mode']:>8}: WAL after {args.burst} writes with an open reader "
+            f"{r['wal_after_burst_mib']:.1f} MiB, reader gone {r['wal_after_reader_mib']:.1f} MiB, "
+            f"after maintenance {r['wal_after_maintenance_mib']:.1f} MiB ({r['maintenance_s']:.2f}s)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
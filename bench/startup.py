@@ -0,0 +1,126 @@
+# bench/startup.py
+"""
+Startup import-time budget check.
+
+Runs `python -X importtime -c "import bot.main, <backend module>"` in a
+fresh interpreter (best of N runs) and fails if:
+- cumulative import time exceeds the budget, or
+- a lazily-imported module (TL request modules, the other MTProto
+  stack, profilers) was imported.
+
+The forbidden-import part is deterministic and runs in every deploy build
+(render.yaml buildCommand, --imports-only), so an eager Telethon import
+fails the build. The time budget depends on the machine and is checked
+when run by hand.
+
+Usage:
+    python -m bench.startup                      # pyrogram backend
+    python -m bench.startup --backend telethon --budget-ms 400
+    python -m bench.startup --imports-only       # build check: no timing
+
+Exit code 0 = within budget, 1 = over budget / forbidden import.
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = int(os.getenv("STARTUP_IMPORT_BUDGET_MS", "900"))
+
+BACKEND_MODULES = {
+    "pyrogram": "bot.control_pyrogram",
+    "telethon": "bot.control_telethon",
+}
+
+# Must NOT be imported just by starting the control bot.
+# (importing telethon itself loads every TL module, so the TL request
+# modules are only checked for the pyrogram backend)
+_ALWAYS_FORBIDDEN = ("cProfile", "pstats")
+FORBIDDEN_AT_STARTUP = {
+    "pyrogram": _ALWAYS_FORBIDDEN + ("telethon", "telethon.tl.functions.chatlists"),
+    "telethon": _ALWAYS_FORBIDDEN + ("pyrogram",),
+}
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)\s*$")
+
+# dummy credentials so config values parse; validation is not run on import
+_ENV = {
+    "API_ID": "1",
+    "API_HASH": "x",
+    "BOT_TOKEN": "1:x",
+    "OWNER_ID": "1",
+    "DB_PATH": os.path.join("data", "startup-bench.db"),
+}
+
+
+def measure(modules: list[str]) -> tuple[float, set[str]]:
+    """
+    Returns (cumulative_ms_for_all_modules, imported_module_names).
+    """
+    env = dict(os.environ)
+    for k, v in _ENV.items():
+        env.setdefault(k, v)
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"import {modules} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative_us = 0
+    found = set()
+    imported: set[str] = set()
+    for line in proc.stderr.splitlines():
+        m = _LINE_RE.match(line)
+        if not m:
+            continue
+        name = m.group(4)
+        imported.add(name)
+        if name in modules:
+            cumulative_us += int(m.group(2))
+            found.add(name)
+
+    if found != set(modules):
+        raise RuntimeError(f"{set(modules) - found} not found in -X importtime output")
+
+    return cumulative_us / 1000.0, imported
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--backend", choices=sorted(BACKEND_MODULES), default="pyrogram")
+    ap.add_argument("--budget-ms", type=int, default=DEFAULT_BUDGET_MS)
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--imports-only", action="store_true", help="check forbidden imports only (one run, no budget)")
+    args = ap.parse_args(argv)
+    if args.imports_only:
+        args.runs = 1
+
+    modules = ["bot.main", BACKEND_MODULES[args.backend]]
+
+    best = None
+    imported: set[str] = set()
+    for _ in range(max(args.runs, 1)):
+        ms, imported = measure(modules)
+        best = ms if best is None else min(best, ms)
+
+    forbidden = sorted(m for m in FORBIDDEN_AT_STARTUP[args.backend] if m in imported)
+
+    budget = "not checked" if args.imports_only else f"{args.budget_ms} ms"
+    print(f"{' + '.join(modules)}: {best:.1f} ms cumulative import (budget {budget}, best of {args.runs})")
+    if forbidden:
+        print(f"FAIL: imported at startup: {', '.join(forbidden)}")
+        return 1
+    if best > args.budget_ms and not args.imports_only:
+        print("FAIL: over budget")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
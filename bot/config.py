@@ -13,6 +13,14 @@ OWNER_ID = int(os.getenv("OWNER_ID", "0"))
 # Default changed from 60 -> 90 to reduce FloodWait probability
 JOIN_DELAY_SECONDS = int(os.getenv("JOIN_DELAY_SECONDS", "90"))
 
+# Transient join failures (timeouts, server errors, connection drops) are
+# retried with exponential backoff: JOIN_RETRY_BASE_SECONDS, x2 per retry,
+# capped at JOIN_RETRY_MAX_SECONDS; the link is marked failed after
+# JOIN_MAX_ATTEMPTS transient failures
+JOIN_MAX_ATTEMPTS = int(os.getenv("JOIN_MAX_ATTEMPTS", "5"))
+JOIN_RETRY_BASE_SECONDS = int(os.getenv("JOIN_RETRY_BASE_SECONDS", "120"))
+JOIN_RETRY_MAX_SECONDS = int(os.getenv("JOIN_RETRY_MAX_SECONDS", "3600"))
+
 # Link reserve pool:
 # Always keep at least this many active, unassigned links in DB as backup
 # used for immediate replacement of dead/expired links.
@@ -23,21 +31,192 @@ RESERVE_LINKS = int(os.getenv("RESERVE_LINKS", "500"))
 # >0 = extract last N messages only
 EXTRACT_MESSAGES_LIMIT = int(os.getenv("EXTRACT_MESSAGES_LIMIT", "0"))
 
+# Run extraction inside a Telegram takeout (data export) session:
+# bulk-export limits for huge channels; falls back to normal history
+# when Telegram refuses the takeout (the account must confirm it once)
+EXTRACT_USE_TAKEOUT = os.getenv("EXTRACT_USE_TAKEOUT", "0").strip() in ("1", "true", "yes")
+
+# Background extraction workers (each job uses one session at a time)
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "1"))
+
+# Join scheduler: max sessions connected / joining at the same time
+# (sessions waiting for their delay or FloodWait hold no connection)
+MAX_ACTIVE_SESSIONS = int(os.getenv("MAX_ACTIVE_SESSIONS", "50"))
+
+# Disconnect a session while it waits longer than this (join delay,
+# FloodWait) and reconnect just before its next join; shorter waits keep
+# the connection. 0 = always disconnect between turns
+IDLE_DISCONNECT_SECONDS = int(os.getenv("IDLE_DISCONNECT_SECONDS", "30"))
+
+# Continuous pipeline mode (extract -> ingest -> join without batch runs):
+# - PIPELINE_QUEUE_BATCHES: bounded queue of extracted batches waiting to be
+#   stored (extraction pauses when full)
+# - PIPELINE_REFILL_LINKS: links assigned to a session each time it runs out
+PIPELINE_QUEUE_BATCHES = int(os.getenv("PIPELINE_QUEUE_BATCHES", "64"))
+PIPELINE_REFILL_LINKS = int(os.getenv("PIPELINE_REFILL_LINKS", "100"))
+
+# Graceful stop: max seconds to let in-flight joins finish after 🛑
+# before the join tasks are cancelled
+STOP_GRACE_SECONDS = int(os.getenv("STOP_GRACE_SECONDS", "30"))
+
+# Throughput snapshots (per-minute join rates, ETA in stats):
+# flush interval and how long snapshots are kept
+RATE_SNAPSHOT_SECONDS = int(os.getenv("RATE_SNAPSHOT_SECONDS", "60"))
+RATE_RETENTION_HOURS = int(os.getenv("RATE_RETENTION_HOURS", "72"))
+
 # Database path
 DB_PATH = os.getenv("DB_PATH", "data/sessions.db")
 
-# Safety checks
-if API_ID == 0 or not API_HASH or not BOT_TOKEN or OWNER_ID == 0:
-    raise RuntimeError(
-        "Missing required env vars: API_ID, API_HASH, BOT_TOKEN, OWNER_ID"
-    )
+# SQLite storage profile (per connection):
+# - SQLITE_MMAP_MB: memory-mapped reads (0 = off)
+# - SQLITE_CACHE_MB: page cache
+# - SQLITE_WAL_AUTOCHECKPOINT: WAL pages before an automatic checkpoint
+# - SQLITE_JOURNAL_SIZE_LIMIT_MB: WAL file is truncated back to this after a checkpoint
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "32"))
+SQLITE_WAL_AUTOCHECKPOINT = int(os.getenv("SQLITE_WAL_AUTOCHECKPOINT", "1000"))
+SQLITE_JOURNAL_SIZE_LIMIT_MB = int(os.getenv("SQLITE_JOURNAL_SIZE_LIMIT_MB", "64"))
+
+# Background DB maintenance (WAL checkpoint, PRAGMA optimize, incremental
+# vacuum) every N seconds; heavy steps only while no join run / extraction
+# is active. 0 = disabled
+DB_MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("DB_MAINTENANCE_INTERVAL_SECONDS", "900"))
+
+# join_log retention (bot/retention.py, run by DB maintenance): raw rows
+# older than JOIN_LOG_RETENTION_DAYS are counted into daily per-session
+# rollups, written to gzipped NDJSON files in JOIN_LOG_ARCHIVE_DIR (empty =
+# no archive) and deleted, JOIN_LOG_PRUNE_BATCH rows per transaction.
+# 0 days = keep everything
+JOIN_LOG_RETENTION_DAYS = int(os.getenv("JOIN_LOG_RETENTION_DAYS", "30"))
+JOIN_LOG_ARCHIVE_DIR = os.getenv("JOIN_LOG_ARCHIVE_DIR", "data/archive").strip()
+JOIN_LOG_PRUNE_BATCH = int(os.getenv("JOIN_LOG_PRUNE_BATCH", "5000"))
+
+# Owner bot MTProto backend:
+# "pyrogram" (default) or "telethon" (single MTProto stack: less RAM, faster start)
+CONTROL_BOT_BACKEND = os.getenv("CONTROL_BOT_BACKEND", "pyrogram").strip().lower()
+
+# Session validation (connect + get_me): max concurrent checks
+SESSION_CHECK_CONCURRENCY = int(os.getenv("SESSION_CHECK_CONCURRENCY", "10"))
+SESSION_CHECK_TIMEOUT = int(os.getenv("SESSION_CHECK_TIMEOUT", "30"))
+
+# Known-link filter: in-memory fingerprints of stored links, so already
+# known links are dropped before any DB write (~8 MB per million links)
+LINK_FILTER_ENABLED = os.getenv("LINK_FILTER_ENABLED", "1").strip() not in ("0", "false", "no")
+
+# Live progress message: minimum seconds between edits
+PROGRESS_UPDATE_SECONDS = int(os.getenv("PROGRESS_UPDATE_SECONDS", "20"))
+
+# Owner-bot notification outbox (bot/outbox.py): texts posted within
+# OUTBOX_WINDOW_SECONDS are merged into one message; at most one message
+# per OUTBOX_MIN_INTERVAL_SECONDS
+OUTBOX_WINDOW_SECONDS = float(os.getenv("OUTBOX_WINDOW_SECONDS", "3"))
+OUTBOX_MIN_INTERVAL_SECONDS = float(os.getenv("OUTBOX_MIN_INTERVAL_SECONDS", "1"))
+
+# Logging (written by a background thread, see bot/logs.py)
+# LOG_FORMAT: "text" or "json" (one object per line)
+# LOG_SUCCESS_SAMPLE: keep 1 in N routine join success lines (1 = all)
+# LOG_QUEUE_SIZE: queued records before new ones are dropped
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").strip().lower()
+LOG_SUCCESS_SAMPLE = int(os.getenv("LOG_SUCCESS_SAMPLE", "1"))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# Prometheus metrics exporter (GET /metrics):
+# 0 = disabled
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+
+
+# ---------------- validation ----------------
+def validate() -> None:
+    """
+    Called once by the entry point (not at import time), so importing
+    bot modules stays cheap and side-effect free.
+    """
+    # Safety checks
+    if API_ID == 0 or not API_HASH or not BOT_TOKEN or OWNER_ID == 0:
+        raise RuntimeError(
+            "Missing required env vars: API_ID, API_HASH, BOT_TOKEN, OWNER_ID"
+        )
+
+    # Validate numeric settings
+    if JOIN_DELAY_SECONDS < 0:
+        raise RuntimeError("JOIN_DELAY_SECONDS must be >= 0")
+
+    if JOIN_MAX_ATTEMPTS < 1:
+        raise RuntimeError("JOIN_MAX_ATTEMPTS must be >= 1")
+
+    if JOIN_RETRY_BASE_SECONDS < 1 or JOIN_RETRY_MAX_SECONDS < JOIN_RETRY_BASE_SECONDS:
+        raise RuntimeError("JOIN_RETRY_BASE_SECONDS must be >= 1 and <= JOIN_RETRY_MAX_SECONDS")
+
+    if MAX_ACTIVE_SESSIONS < 1:
+        raise RuntimeError("MAX_ACTIVE_SESSIONS must be >= 1")
+
+    if IDLE_DISCONNECT_SECONDS < 0:
+        raise RuntimeError("IDLE_DISCONNECT_SECONDS must be >= 0")
+
+    if PIPELINE_QUEUE_BATCHES < 1:
+        raise RuntimeError("PIPELINE_QUEUE_BATCHES must be >= 1")
+
+    if PIPELINE_REFILL_LINKS < 1:
+        raise RuntimeError("PIPELINE_REFILL_LINKS must be >= 1")
+
+    if STOP_GRACE_SECONDS < 0:
+        raise RuntimeError("STOP_GRACE_SECONDS must be >= 0")
+
+    if RESERVE_LINKS < 0:
+        raise RuntimeError("RESERVE_LINKS must be >= 0")
+
+    if EXTRACT_MESSAGES_LIMIT < 0:
+        raise RuntimeError("EXTRACT_MESSAGES_LIMIT must be >= 0")
+
+    if EXTRACT_WORKERS < 1:
+        raise RuntimeError("EXTRACT_WORKERS must be >= 1")
+
+    if RATE_SNAPSHOT_SECONDS < 10:
+        raise RuntimeError("RATE_SNAPSHOT_SECONDS must be >= 10")
+
+    if RATE_RETENTION_HOURS < 1:
+        raise RuntimeError("RATE_RETENTION_HOURS must be >= 1")
+
+    if SQLITE_MMAP_MB < 0 or SQLITE_CACHE_MB < 1 or SQLITE_JOURNAL_SIZE_LIMIT_MB < 0:
+        raise RuntimeError("SQLITE_MMAP_MB / SQLITE_JOURNAL_SIZE_LIMIT_MB must be >= 0, SQLITE_CACHE_MB >= 1")
+
+    if SQLITE_WAL_AUTOCHECKPOINT < 0:
+        raise RuntimeError("SQLITE_WAL_AUTOCHECKPOINT must be >= 0")
+
+    if DB_MAINTENANCE_INTERVAL_SECONDS < 0:
+        raise RuntimeError("DB_MAINTENANCE_INTERVAL_SECONDS must be >= 0")
+
+    if JOIN_LOG_RETENTION_DAYS < 0:
+        raise RuntimeError("JOIN_LOG_RETENTION_DAYS must be >= 0")
+
+    if JOIN_LOG_PRUNE_BATCH < 100:
+        raise RuntimeError("JOIN_LOG_PRUNE_BATCH must be >= 100")
+
+    if CONTROL_BOT_BACKEND not in ("pyrogram", "telethon"):
+        raise RuntimeError("CONTROL_BOT_BACKEND must be 'pyrogram' or 'telethon'")
+
+    if SESSION_CHECK_CONCURRENCY < 1:
+        raise RuntimeError("SESSION_CHECK_CONCURRENCY must be >= 1")
+
+    if SESSION_CHECK_TIMEOUT < 1:
+        raise RuntimeError("SESSION_CHECK_TIMEOUT must be >= 1")
+
+    if PROGRESS_UPDATE_SECONDS < 3:
+        raise RuntimeError("PROGRESS_UPDATE_SECONDS must be >= 3")
+
+    if OUTBOX_WINDOW_SECONDS < 0 or OUTBOX_MIN_INTERVAL_SECONDS < 0:
+        raise RuntimeError("OUTBOX_WINDOW_SECONDS / OUTBOX_MIN_INTERVAL_SECONDS must be >= 0")
+
+    if LOG_LEVEL not in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        raise RuntimeError("LOG_LEVEL must be DEBUG, INFO, WARNING, ERROR or CRITICAL")
 
-# Validate numeric settings
-if JOIN_DELAY_SECONDS < 0:
-    raise RuntimeError("JOIN_DELAY_SECONDS must be >= 0")
+    if LOG_FORMAT not in ("text", "json"):
+        raise RuntimeError("LOG_FORMAT must be 'text' or 'json'")
 
-if RESERVE_LINKS < 0:
-    raise RuntimeError("RESERVE_LINKS must be >= 0")
+    if LOG_SUCCESS_SAMPLE < 1 or LOG_QUEUE_SIZE < 100:
+        raise RuntimeError("LOG_SUCCESS_SAMPLE must be >= 1 and LOG_QUEUE_SIZE >= 100")
 
-if EXTRACT_MESSAGES_LIMIT < 0:
-    raise RuntimeError("EXTRACT_MESSAGES_LIMIT must be >= 0")
+    if not (0 <= METRICS_PORT <= 65535):
+        raise RuntimeError("METRICS_PORT must be between 0 and 65535")
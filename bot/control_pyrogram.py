@@ -0,0 +1,76 @@
+# bot/control_pyrogram.py
+from typing import Optional
+
+from pyrogram import Client, filters
+from pyrogram.handlers import CallbackQueryHandler, MessageHandler
+from pyrogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot.config import API_ID, API_HASH, BOT_TOKEN
+from bot import handlers
+
+# Default control-bot backend: pyrogram (+ tgcrypto).
+
+
+def _markup(keyboard: Optional[handlers.Keyboard]) -> Optional[InlineKeyboardMarkup]:
+    if keyboard is None:
+        return None
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(text, callback_data=data) for text, data in row]
+        for row in keyboard
+    ])
+
+
+class _Message:
+    def __init__(self, msg):
+        self._msg = msg
+        self.user_id = msg.from_user.id if msg.from_user else 0
+        self.text = msg.text or msg.caption or ""
+        self.document_name = (msg.document.file_name or "upload.txt") if msg.document else None
+
+    async def reply_text(self, text: str, keyboard=None) -> "_Message":
+        return _Message(await self._msg.reply_text(text, reply_markup=_markup(keyboard)))
+
+    async def edit_text(self, text: str, keyboard=None) -> None:
+        await self._msg.edit_text(text, reply_markup=_markup(keyboard))
+
+    async def reply_document(self, fileobj, file_name: str, caption: str = "") -> None:
+        await self._msg.reply_document(document=fileobj, file_name=file_name, caption=caption)
+
+    async def download(self, path: str) -> str:
+        return await self._msg.download(file_name=path)
+
+
+class _Callback:
+    def __init__(self, cq):
+        self._cq = cq
+        self.user_id = cq.from_user.id
+        self.data = cq.data or ""
+        self.message = _Message(cq.message)
+
+    async def answer(self, text: str = "", alert: bool = False) -> None:
+        await self._cq.answer(text, show_alert=alert)
+
+
+async def _on_message(client: Client, message) -> None:
+    await handlers.handle_message(_Message(message))
+
+
+async def _on_callback(client: Client, cq) -> None:
+    await handlers.handle_callback(_Callback(cq))
+
+
+async def start() -> Client:
+    bot = Client(
+        "multi_session_joiner_bot",
+        api_id=API_ID,
+        api_hash=API_HASH,
+        bot_token=BOT_TOKEN,
+    )
+    bot.add_handler(MessageHandler(_on_message, filters.private))
+    bot.add_handler(CallbackQueryHandler(_on_callback))
+    await bot.start()
+    return bot
+
+
+async def stop(bot: Client) -> None:
+    await bot.stop()
@@ -0,0 +1,87 @@
+# bot/control_telethon.py
+import io
+from typing import Optional
+
+from telethon import Button, TelegramClient, events
+
+from bot.config import API_ID, API_HASH, BOT_TOKEN
+from bot import handlers
+
+# Optional control-bot backend (CONTROL_BOT_BACKEND=telethon):
+# runs the owner bot on Telethon so the process loads a single MTProto
+# stack (sessions already use Telethon) instead of pyrogram + Telethon.
+
+
+def _buttons(keyboard: Optional[handlers.Keyboard]):
+    if keyboard is None:
+        return None
+    return [
+        [Button.inline(text, data=data.encode("utf-8")) for text, data in row]
+        for row in keyboard
+    ]
+
+
+class _Message:
+    """
+    A message in a chat, addressed by (chat_id, msg_id), so it works both
+    for received messages and for the message behind a callback query.
+    """
+
+    def __init__(self, client: TelegramClient, chat_id: int, msg_id: int, user_id: int = 0, raw=None):
+        self._client = client
+        self._raw = raw
+        self.chat_id = chat_id
+        self.msg_id = msg_id
+        self.user_id = user_id
+        self.text = (raw.message or "") if raw is not None else ""
+        self.document_name = None
+        if raw is not None and raw.document:
+            self.document_name = raw.file.name or "upload.txt"
+
+    async def reply_text(self, text: str, keyboard=None) -> "_Message":
+        sent = await self._client.send_message(self.chat_id, text, buttons=_buttons(keyboard))
+        return _Message(self._client, self.chat_id, sent.id)
+
+    async def edit_text(self, text: str, keyboard=None) -> None:
+        await self._client.edit_message(self.chat_id, self.msg_id, text, buttons=_buttons(keyboard))
+
+    async def reply_document(self, fileobj, file_name: str, caption: str = "") -> None:
+        if isinstance(fileobj, io.BytesIO):
+            # Telethon takes the uploaded file name from .name
+            fileobj.name = file_name
+        await self._client.send_file(self.chat_id, fileobj, caption=caption, force_document=True)
+
+    async def download(self, path: str) -> str:
+        return await self._client.download_media(self._raw, file=path)
+
+
+class _Callback:
+    def __init__(self, event):
+        self._event = event
+        self.user_id = event.sender_id
+        self.data = (event.data or b"").decode("utf-8", "replace")
+        self.message = _Message(event.client, event.chat_id, event.message_id)
+
+    async def answer(self, text: str = "", alert: bool = False) -> None:
+        await self._event.answer(text or None, alert=alert)
+
+
+async def _on_message(event) -> None:
+    msg = event.message
+    await handlers.handle_message(_Message(event.client, event.chat_id, msg.id, event.sender_id, msg))
+
+
+async def _on_callback(event) -> None:
+    await handlers.handle_callback(_Callback(event))
+
+
+async def start() -> TelegramClient:
+    bot = TelegramClient("multi_session_joiner_bot_telethon", API_ID, API_HASH)
+    bot.add_event_handler(_on_message, events.NewMessage(incoming=True, func=lambda e: e.is_private))
+    bot.add_event_handler(_on_callback, events.CallbackQuery())
+    await bot.start(bot_token=BOT_TOKEN)
+    return bot
+
+
+async def stop(bot: TelegramClient) -> None:
+    await bot.disconnect()
@@ -1,27 +1,100 @@
 # bot/db.py
+import logging
 import os
 import sqlite3
+import threading
 from contextlib import contextmanager
-from typing import Optional, List, Tuple, Dict, Any
-
-from bot.config import DB_PATH, RESERVE_LINKS
-
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+from typing import Optional, List, Tuple, Dict, Any, Iterator
+
+from bot import metrics
+from bot.config import (
+    DB_PATH,
+    LINK_FILTER_ENABLED,
+    RESERVE_LINKS,
+    SQLITE_CACHE_MB,
+    SQLITE_JOURNAL_SIZE_LIMIT_MB,
+    SQLITE_MMAP_MB,
+    SQLITE_WAL_AUTOCHECKPOINT,
+)
+from bot.linkfilter import KnownLinks
+from bot.utils import LINK_URL_PREFIX, link_key, link_url
+
+logger = logging.getLogger(__name__)
+
+# (link_id, kind, value) as returned for joining (see bot.utils.link_key)
+LinkRow = Tuple[int, int, str]
+
+# SQL for the canonical URL of links row `l` (exports)
+_LINK_URL_SQL = (
+    "CASE l.kind "
+    + " ".join(f"WHEN {kind} THEN '{prefix}' || l.value" for kind, prefix in LINK_URL_PREFIX.items())
+    + " ELSE l.value END"
+)
+
+# Storage profile applied to every connection (see config):
+# - mmap_size: reads come straight from the page cache of the OS mapping
+#   instead of read() syscalls + copies
+# - cache_size: bigger per-connection page cache (negative = KiB)
+# - temp_store=MEMORY: sorts / GROUP BY temp b-trees stay off disk
+# - wal_autocheckpoint + journal_size_limit: WAL is checkpointed and
+#   truncated back instead of keeping its high-water mark on disk
+_CONN_PRAGMAS = (
+    "PRAGMA journal_mode=WAL;",
+    "PRAGMA synchronous=NORMAL;",
+    f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024};",
+    f"PRAGMA cache_size=-{SQLITE_CACHE_MB * 1024};",
+    "PRAGMA temp_store=MEMORY;",
+    f"PRAGMA wal_autocheckpoint={SQLITE_WAL_AUTOCHECKPOINT};",
+    f"PRAGMA journal_size_limit={SQLITE_JOURNAL_SIZE_LIMIT_MB * 1024 * 1024};",
+)
+
+
+# One long-lived connection per thread: page cache and mmap stay warm and
+# the PRAGMAs run once (with a fresh connection per call, cache_size had
+# nothing to keep). Nested get_conn() calls get a private connection.
+_REUSE_CONNECTIONS = True
+_local = threading.local()
+
+
+def _open_conn() -> sqlite3.Connection:
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    for pragma in _CONN_PRAGMAS:
+        conn.execute(pragma)
+    conn.row_factory = sqlite3.Row
+    return conn
 
 
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH, timeout=30)
-    conn.execute("PRAGMA journal_mode=WAL;")
-    conn.execute("PRAGMA synchronous=NORMAL;")
-    conn.row_factory = sqlite3.Row
+    if not _REUSE_CONNECTIONS or getattr(_local, "busy", False):
+        conn = _open_conn()
+        try:
+            yield conn
+        finally:
+            conn.close()
+        return
+
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _open_conn()
+    _local.busy = True
     try:
         yield conn
     finally:
-        conn.close()
+        # same contract as closing a fresh connection: uncommitted work is dropped
+        if conn.in_transaction:
+            conn.rollback()
+        _local.busy = False
 
 
 # ---------------- internal helpers ----------------
+def _timed(fn):
+    """
+    Record latency of a DB operation in metrics (label: function name).
+    """
+    return metrics.DB_QUERY_LATENCY.timed(op=fn.__name__)(fn)
+
+
 def _column_exists(conn: sqlite3.Connection, table: str, col: str) -> bool:
     cur = conn.execute(f"PRAGMA table_info({table})")
     for r in cur.fetchall():
@@ -37,6 +110,9 @@ def _ensure_schema_migrations(conn: sqlite3.Connection) -> None:
     - links.status
     - links.dead_reason
     - links.last_checked_at
+    - sessions.user_id
+    - sessions.status_reason
+    - assignments.retries / assignments.next_attempt_at (retry queue)
     """
     if not _column_exists(conn, "links", "status"):
         conn.execute("ALTER TABLE links ADD COLUMN status TEXT DEFAULT 'active';")
@@ -47,9 +123,222 @@ def _ensure_schema_migrations(conn: sqlite3.Connection) -> None:
     if not _column_exists(conn, "links", "last_checked_at"):
         conn.execute("ALTER TABLE links ADD COLUMN last_checked_at TIMESTAMP;")
 
+    if not _column_exists(conn, "sessions", "user_id"):
+        conn.execute("ALTER TABLE sessions ADD COLUMN user_id INTEGER;")
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user_id ON sessions(user_id);")
+
+    if not _column_exists(conn, "sessions", "status_reason"):
+        conn.execute("ALTER TABLE sessions ADD COLUMN status_reason TEXT;")
+
+    if not _column_exists(conn, "assignments", "retries"):
+        conn.execute("ALTER TABLE assignments ADD COLUMN retries INTEGER DEFAULT 0;")
+
+    if not _column_exists(conn, "assignments", "next_attempt_at"):
+        conn.execute("ALTER TABLE assignments ADD COLUMN next_attempt_at TIMESTAMP;")
+
+    # partial index: only rows waiting for a retry
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_assignments_retry_due
+        ON assignments(session_id, next_attempt_at)
+        WHERE join_status='retry';
+    """)
+
+
+# ---------------- link storage migration ----------------
+# Links used to be stored as full URLs (links.link UNIQUE) and join_log
+# copied that text into every row. Now: links(kind, value) with a UNIQUE
+# index and join_log.link_id. Old DBs are converted at startup in batches
+# of _MIGRATE_BATCH rows, one transaction each, so an interrupted
+# migration resumes where it stopped:
+#   1) join_log.link_id from the old links.link index (plain SQL); log
+#      URLs with no links row (edited by hand) first get an 'archived'
+#      links row so their history survives (history only: not in the
+#      known-link filter, add_links() turns it active if extracted again)
+#   2) links copied into links_compact (ids kept, kind/value parsed)
+#   3) one transaction: duplicates collapsed (both invite forms of one
+#      hash; the most advanced assignment is kept), tables swapped,
+#      join_log.link dropped once every row has its link_id
+#   4) no VACUUM here (it would hold an exclusive lock and rewrite the file
+#      before the bot starts): freed pages are reused by new rows, DB
+#      maintenance gives them back on auto_vacuum=INCREMENTAL files and
+#      /vacuum (vacuum_full) rewrites older files while idle
+_MIGRATE_BATCH = 50_000
+
+# assignment progress when merging duplicate links (unknown statuses rank
+# with failed: final, but behind a completed join)
+_ASSIGNMENT_RANK_SQL = """CASE a.join_status
+  WHEN 'success' THEN 4 WHEN 'requested' THEN 3
+  WHEN 'retry' THEN 1 WHEN 'pending' THEN 0 ELSE 2 END"""
+
+_LINKS_TABLE_SQL = """
+CREATE TABLE IF NOT EXISTS {name} (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind INTEGER NOT NULL,
+  value TEXT NOT NULL,
+  source_channel TEXT,
+  created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+  status TEXT DEFAULT 'active',
+  dead_reason TEXT,
+  last_checked_at TIMESTAMP
+);
+"""
+
+
+def _migrate_join_log_link_ids(conn: sqlite3.Connection) -> None:
+    if not _column_exists(conn, "join_log", "link_id"):
+        conn.execute("ALTER TABLE join_log ADD COLUMN link_id INTEGER;")
+        conn.commit()
+
+    # log rows for URLs missing from links: keep them as archived links
+    # (never distributed) instead of losing the URL with join_log.link
+    kept = conn.execute("""
+        INSERT OR IGNORE INTO links(link, status, dead_reason)
+        SELECT DISTINCT j.link, 'archived', 'join_log only (link storage migration)'
+        FROM join_log j
+        WHERE j.link IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM links l WHERE l.link = j.link)
+    """).rowcount
+    conn.commit()
+    if kept:
+        logger.warning("[db] Link storage migration: %s join_log URL(s) not in links kept as archived links", kept)
+
+    top = conn.execute("SELECT COALESCE(MAX(id), 0) FROM join_log").fetchone()[0]
+    for start in range(0, top, _MIGRATE_BATCH):
+        conn.execute("""
+            UPDATE join_log
+            SET link_id = (SELECT l.id FROM links l WHERE l.link = join_log.link),
+                link = NULL
+            WHERE id > ? AND id <= ? AND link IS NOT NULL
+              AND EXISTS (SELECT 1 FROM links l WHERE l.link = join_log.link)
+        """, (start, start + _MIGRATE_BATCH))
+        conn.commit()
+    logger.info("[db] Link storage migration: join_log.link_id filled (%s rows)", top)
+
+
+def _copy_links_compact(conn: sqlite3.Connection) -> None:
+    conn.execute(_LINKS_TABLE_SQL.format(name="links_compact"))
+    conn.commit()
+
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM links_compact").fetchone()[0]
+    while True:
+        rows = conn.execute("""
+            SELECT id, link, source_channel, created_at, status, dead_reason, last_checked_at
+            FROM links WHERE id > ? ORDER BY id ASC LIMIT ?
+        """, (last_id, _MIGRATE_BATCH)).fetchall()
+        if not rows:
+            return
+        conn.executemany("""
+            INSERT INTO links_compact(
+              id, kind, value, source_channel, created_at, status, dead_reason, last_checked_at
+            ) VALUES(?,?,?,?,?,?,?,?)
+        """, [
+            (r["id"], *link_key(r["link"]), r["source_channel"], r["created_at"],
+             r["status"], r["dead_reason"], r["last_checked_at"])
+            for r in rows
+        ])
+        conn.commit()
+        last_id = rows[-1]["id"]
+        logger.info("[db] Link storage migration: links copied up to id %s", last_id)
+
+
+def _swap_links_compact(conn: sqlite3.Connection) -> None:
+    conn.execute("BEGIN")
+    # rows sharing a key: keep the oldest, repoint the log and the most
+    # advanced assignment of the group to it, drop the rest
+    conn.execute("DROP TABLE IF EXISTS temp.link_dups")
+    conn.execute("""
+        CREATE TEMP TABLE link_dups AS
+        SELECT c.id AS old_id, k.keep_id AS new_id
+        FROM links_compact c
+        JOIN (
+            SELECT kind, value, MIN(id) AS keep_id
+            FROM links_compact
+            GROUP BY kind, value
+            HAVING COUNT(*) > 1
+        ) k ON k.kind = c.kind AND k.value = c.value
+        WHERE c.id <> k.keep_id
+    """)
+    dups = conn.execute("SELECT COUNT(*) FROM temp.link_dups").fetchone()[0]
+    if dups:
+        conn.execute("""
+            UPDATE join_log
+            SET link_id = (SELECT new_id FROM temp.link_dups WHERE old_id = join_log.link_id)
+            WHERE link_id IN (SELECT old_id FROM temp.link_dups)
+        """)
+        conn.execute("DROP TABLE IF EXISTS temp.link_best")
+        conn.execute(f"""
+            CREATE TEMP TABLE link_best AS
+            SELECT g.new_id, (
+                SELECT a.link_id
+                FROM assignments a
+                WHERE a.link_id = g.new_id
+                   OR a.link_id IN (SELECT old_id FROM temp.link_dups d WHERE d.new_id = g.new_id)
+                ORDER BY {_ASSIGNMENT_RANK_SQL} DESC, a.link_id ASC  -- ties: the kept (lowest) id
+                LIMIT 1
+            ) AS best_id
+            FROM (SELECT DISTINCT new_id FROM temp.link_dups) g
+        """)
+        # assignment is UNIQUE(link_id): free the kept id, then move the best one onto it
+        conn.execute("""
+            DELETE FROM assignments
+            WHERE link_id IN (SELECT new_id FROM temp.link_best WHERE best_id <> new_id)
+        """)
+        conn.execute("""
+            UPDATE assignments
+            SET link_id = (SELECT new_id FROM temp.link_best WHERE best_id = assignments.link_id)
+            WHERE link_id IN (SELECT best_id FROM temp.link_best WHERE best_id <> new_id)
+        """)
+        conn.execute("DELETE FROM assignments WHERE link_id IN (SELECT old_id FROM temp.link_dups)")
+        conn.execute("DROP TABLE temp.link_best")
+        conn.execute("DELETE FROM links_compact WHERE id IN (SELECT old_id FROM temp.link_dups)")
+    conn.execute("DROP TABLE temp.link_dups")
+
+    conn.execute("DROP TABLE links")
+    conn.execute("ALTER TABLE links_compact RENAME TO links")
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_links_kind_value ON links(kind, value)")
+    if sqlite3.sqlite_version_info >= (3, 35, 0) and _column_exists(conn, "join_log", "link"):
+        unmatched = conn.execute("SELECT COUNT(*) FROM join_log WHERE link IS NOT NULL").fetchone()[0]
+        if unmatched:
+            logger.warning("[db] Link storage migration: %s join_log row(s) without link_id, "
+                           "keeping join_log.link", unmatched)
+        else:
+            conn.execute("ALTER TABLE join_log DROP COLUMN link")
+    conn.commit()
+    logger.info("[db] Link storage migration: tables swapped (%s duplicate link(s) merged)", dups)
+
+
+def _migrate_link_storage(conn: sqlite3.Connection) -> None:
+    if not _column_exists(conn, "links", "link"):
+        return
+
+    logger.info("[db] Converting link storage to (kind, value) + join_log.link_id ...")
+    if _column_exists(conn, "join_log", "link"):
+        _migrate_join_log_link_ids(conn)
+    _copy_links_compact(conn)
+    _swap_links_compact(conn)
+
+    if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+        logger.info("[db] Link storage migration done; freed pages are reused, "
+                    "run /vacuum while idle to shrink the file")
+    else:
+        logger.info("[db] Link storage migration done; maintenance returns freed pages gradually")
+
 
 # ---------------- init ----------------
 def init_db():
+    db_dir = os.path.dirname(DB_PATH)
+    if db_dir:
+        os.makedirs(db_dir, exist_ok=True)
+
+    if not os.path.exists(DB_PATH) or os.path.getsize(DB_PATH) == 0:
+        # new DB: auto_vacuum has to be chosen before WAL mode and the first
+        # table; lets maintenance give freed pages back (incremental_vacuum)
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.close()
+
     with get_conn() as conn:
         cur = conn.cursor()
 
@@ -63,14 +352,7 @@ def init_db():
         );
         """)
 
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS links (
-          id INTEGER PRIMARY KEY AUTOINCREMENT,
-          link TEXT UNIQUE NOT NULL,
-          source_channel TEXT,
-          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
+        cur.execute(_LINKS_TABLE_SQL.format(name="links"))
 
         cur.execute("""
         CREATE TABLE IF NOT EXISTS assignments (
@@ -91,34 +373,167 @@ def init_db():
         CREATE TABLE IF NOT EXISTS join_log (
           id INTEGER PRIMARY KEY AUTOINCREMENT,
           session_id INTEGER,
-          link TEXT,
+          link_id INTEGER,
           status TEXT,
           error_message TEXT,
           created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         );
         """)
 
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS extraction_jobs (
+          id INTEGER PRIMARY KEY AUTOINCREMENT,
+          channel_link TEXT NOT NULL,
+          status TEXT DEFAULT 'queued',
+          last_msg_id INTEGER DEFAULT 0,
+          scanned INTEGER DEFAULT 0,
+          found INTEGER DEFAULT 0,
+          added INTEGER DEFAULT 0,
+          error TEXT,
+          created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+          started_at TIMESTAMP,
+          finished_at TIMESTAMP
+        );
+        """)
+
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_extraction_jobs_status
+        ON extraction_jobs(status, id);
+        """)
+
+        # throughput snapshots (bot.rates): one row per flush and session,
+        # session_id 0 = all sessions (+ reserve / pending backlog)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS rate_snapshots (
+          ts INTEGER NOT NULL,
+          session_id INTEGER NOT NULL,
+          joined INTEGER DEFAULT 0,
+          failed INTEGER DEFAULT 0,
+          requested INTEGER DEFAULT 0,
+          dead INTEGER DEFAULT 0,
+          retried INTEGER DEFAULT 0,
+          floodwaits INTEGER DEFAULT 0,
+          floodwait_seconds INTEGER DEFAULT 0,
+          reserve INTEGER,
+          pending INTEGER,
+          PRIMARY KEY(ts, session_id)
+        ) WITHOUT ROWID;
+        """)
+
+        # join_log rollups (bot.retention): raw rows older than the retention
+        # window are counted here per day / session / outcome, then deleted
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS join_log_daily (
+          day TEXT NOT NULL,
+          session_id INTEGER NOT NULL,
+          outcome TEXT NOT NULL,
+          attempts INTEGER DEFAULT 0,
+          floodwait_seconds INTEGER DEFAULT 0,
+          PRIMARY KEY(day, session_id, outcome)
+        ) WITHOUT ROWID;
+        """)
+
         # Apply migrations for old DBs
         _ensure_schema_migrations(conn)
 
+        # per-session lookups (pending links, per-session stats pages)
+        cur.execute("""
+        CREATE INDEX IF NOT EXISTS idx_assignments_session_status
+        ON assignments(session_id, join_status);
+        """)
+
         conn.commit()
 
+        _migrate_link_storage(conn)
+
+        # link lookup / dedupe key (after the migration: old DBs get it there)
+        cur.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_links_kind_value ON links(kind, value);")
+
+        # known-link filter invalidation: every DELETE on links bumps n
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS links_deleted (
+          id INTEGER PRIMARY KEY CHECK (id = 0),
+          n INTEGER NOT NULL DEFAULT 0
+        );
+        """)
+        cur.execute("INSERT OR IGNORE INTO links_deleted(id, n) VALUES(0, 0);")
+        cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_links_deleted AFTER DELETE ON links
+        BEGIN
+          UPDATE links_deleted SET n = n + 1 WHERE id = 0;
+        END;
+        """)
+        conn.commit()
+
+    # migrations may have rewritten links: a filter built before is stale
+    reset_link_filter()
+
 
 # ---------------- sessions ----------------
-def add_session(session_string: str, phone: str = "") -> bool:
+# Bumped on every change to the set of active sessions; bot.registry
+# compares it to decide whether its cached copy is stale.
+_sessions_version = 0
+
+
+def sessions_version() -> int:
+    return _sessions_version
+
+
+def _sessions_changed() -> None:
+    global _sessions_version
+    _sessions_version += 1
+
+
+@_timed
+def add_session(session_string: str, phone: str = "", user_id: Optional[int] = None) -> bool:
     with get_conn() as conn:
         try:
             conn.execute(
-                "INSERT INTO sessions(session_string, phone) VALUES(?,?)",
-                (session_string.strip(), phone.strip()),
+                "INSERT INTO sessions(session_string, phone, user_id) VALUES(?,?,?)",
+                (session_string.strip(), (phone or "").strip(), user_id),
             )
             conn.commit()
+            _sessions_changed()
             return True
         except sqlite3.IntegrityError:
             return False
 
 
+@_timed
+def active_session_user_ids() -> set:
+    """
+    Telegram user ids of active sessions (to reject a second session of the same account).
+    """
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT user_id FROM sessions
+            WHERE status='active' AND user_id IS NOT NULL
+        """).fetchall()
+        return {r["user_id"] for r in rows}
+
+
+@_timed
+def existing_session_strings(session_strings: List[str]) -> set:
+    """
+    Subset of `session_strings` already stored (any status).
+    """
+    found = set()
+    with get_conn() as conn:
+        for i in range(0, len(session_strings), 500):
+            chunk = session_strings[i:i + 500]
+            rows = conn.execute(
+                f"SELECT session_string FROM sessions WHERE session_string IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            found.update(r["session_string"] for r in rows)
+    return found
+
+
+@_timed
 def list_sessions():
+    """
+    Full rows of active sessions. Hot paths use bot.registry (cached).
+    """
     with get_conn() as conn:
         cur = conn.cursor()
         cur.execute("""
@@ -130,6 +545,92 @@ def list_sessions():
         return [tuple(r) for r in cur.fetchall()]
 
 
+@_timed
+def load_session_registry() -> Tuple[int, List[sqlite3.Row]]:
+    """
+    (sessions_version, active session rows) for bot.registry.
+    The version is read first: a change racing with the read only makes
+    the next registry lookup reload again.
+    """
+    version = _sessions_version
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT id, session_string, phone, created_at, user_id
+            FROM sessions
+            WHERE status='active'
+            ORDER BY id ASC
+        """).fetchall()
+    return version, rows
+
+
+def _keyset_session_ids(
+    conn: sqlite3.Connection,
+    cursor: int,
+    direction: str,
+    limit: int,
+) -> Tuple[List[int], bool, bool]:
+    """
+    Keyset pagination over active session ids.
+    direction="next": ids > cursor ; direction="prev": ids < cursor.
+    Returns (ids ascending, has_prev, has_next).
+    """
+    if direction == "prev":
+        rows = conn.execute("""
+            SELECT id FROM sessions
+            WHERE status='active' AND id < ?
+            ORDER BY id DESC
+            LIMIT ?
+        """, (cursor, limit + 1)).fetchall()
+        ids = [r["id"] for r in rows]
+        has_prev = len(ids) > limit
+        ids = list(reversed(ids[:limit]))
+        has_next = bool(ids) and conn.execute(
+            "SELECT EXISTS(SELECT 1 FROM sessions WHERE status='active' AND id > ?)",
+            (ids[-1],),
+        ).fetchone()[0] == 1
+        return ids, has_prev, has_next
+
+    rows = conn.execute("""
+        SELECT id FROM sessions
+        WHERE status='active' AND id > ?
+        ORDER BY id ASC
+        LIMIT ?
+    """, (cursor, limit + 1)).fetchall()
+    ids = [r["id"] for r in rows]
+    has_next = len(ids) > limit
+    ids = ids[:limit]
+    has_prev = bool(ids) and conn.execute(
+        "SELECT EXISTS(SELECT 1 FROM sessions WHERE status='active' AND id < ?)",
+        (ids[0],),
+    ).fetchone()[0] == 1
+    return ids, has_prev, has_next
+
+
+@_timed
+def list_sessions_page(cursor: int = 0, direction: str = "next", limit: int = 20) -> Dict[str, Any]:
+    """
+    One page of active sessions (without session_string).
+    rows: [(id, phone, created_at), ...]
+    """
+    with get_conn() as conn:
+        ids, has_prev, has_next = _keyset_session_ids(conn, cursor, direction, limit)
+        rows = []
+        if ids:
+            rows = conn.execute(f"""
+                SELECT id, phone, created_at
+                FROM sessions
+                WHERE id IN ({",".join("?" * len(ids))})
+                ORDER BY id ASC
+            """, ids).fetchall()
+
+        return {
+            "rows": [tuple(r) for r in rows],
+            "has_prev": has_prev,
+            "has_next": has_next,
+        }
+
+
+@_timed
 def soft_delete_session(session_id: int) -> None:
     """
     Soft delete session to avoid losing assigned links permanently.
@@ -139,16 +640,42 @@ def soft_delete_session(session_id: int) -> None:
     So these links become unassigned again and can be distributed to other sessions.
     """
     with get_conn() as conn:
-        conn.execute("UPDATE sessions SET status='deleted' WHERE id=?", (session_id,))
+        _deactivate_session(conn, session_id, "deleted")
+        conn.commit()
+    _sessions_changed()
 
-        # requeue pending links for re-distribution
-        conn.execute("""
-            DELETE FROM assignments
-            WHERE session_id=?
-              AND join_status='pending'
-        """, (session_id,))
 
+def _deactivate_session(conn: sqlite3.Connection, session_id: int, status: str, reason: str = "") -> int:
+    """
+    Set session status and requeue its pending links for re-distribution.
+    Returns number of requeued links.
+    """
+    conn.execute(
+        "UPDATE sessions SET status=?, status_reason=? WHERE id=?",
+        (status, (reason or "")[:1000], session_id),
+    )
+
+    # requeue pending links (and queued retries) for re-distribution
+    cur = conn.execute("""
+        DELETE FROM assignments
+        WHERE session_id=?
+          AND join_status IN ('pending', 'retry')
+    """, (session_id,))
+    return cur.rowcount
+
+
+@_timed
+def quarantine_session(session_id: int, reason: str = "") -> int:
+    """
+    Take a broken session (revoked / banned / unauthorized) out of rotation.
+    Like soft delete: its pending links are requeued.
+    Returns number of requeued links.
+    """
+    with get_conn() as conn:
+        requeued = _deactivate_session(conn, session_id, "quarantined", reason)
         conn.commit()
+    _sessions_changed()
+    return requeued
 
 
 def delete_session(session_id: int) -> None:
@@ -158,6 +685,7 @@ def delete_session(session_id: int) -> None:
     soft_delete_session(session_id)
 
 
+@_timed
 def get_session_by_id(session_id: int):
     with get_conn() as conn:
         cur = conn.cursor()
@@ -170,33 +698,104 @@ def get_session_by_id(session_id: int):
         return tuple(row) if row else None
 
 
+# ---------------- known-link filter ----------------
+# Built lazily from `links` (minus archived history-only rows) on the first
+# add_links() call, after init_db() has run its migrations (which insert
+# archived rows and delete merged duplicates; init_db() drops any older
+# filter). At runtime add_links() is the only code adding links and keeps
+# the filter in sync. It must never hold a deleted link: a trigger counts
+# DELETEs on links (links_deleted.n) and add_links() rebuilds the filter
+# when the count moved since the build.
+_LINK_FILTER_LOAD_CHUNK = 10_000
+
+_known_links: Optional[KnownLinks] = None
+_known_links_deletes = 0
+_known_links_lock = threading.Lock()
+
+
+def _iter_all_links(conn: sqlite3.Connection) -> Iterator[str]:
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, kind, value FROM links WHERE id > ? AND status IS NOT 'archived' ORDER BY id ASC LIMIT ?",
+            (last_id, _LINK_FILTER_LOAD_CHUNK),
+        ).fetchall()
+        if not rows:
+            return
+        for r in rows:
+            yield link_url(r["kind"], r["value"])
+        last_id = rows[-1]["id"]
+
+
+def reset_link_filter() -> None:
+    """
+    Drop the in-memory filter (it is rebuilt on the next add_links call).
+    """
+    global _known_links
+    with _known_links_lock:
+        _known_links = None
+
+
 # ---------------- links ----------------
+@_timed
 def add_links(links: List[str], source_channel: str) -> int:
     """
     Insert links as active by default.
-    Dead links are NOT reactivated.
-    """
-    added = 0
-    with get_conn() as conn:
-        cur = conn.cursor()
+    Dead links are NOT reactivated; archived (history-only) links are.
 
-        for link in links:
-            link = (link or "").strip()
-            if not link:
-                continue
+    Links already in the known-link filter are dropped before any write.
+    """
+    global _known_links, _known_links_deletes
+
+    # canonical URL -> (kind, value)
+    keys = {}
+    for l in links:
+        if l and l.strip():
+            kind, value = link_key(l)
+            keys.setdefault(link_url(kind, value), (kind, value))
+    batch = list(keys)
+    if not batch:
+        return 0
+
+    with _known_links_lock:
+        fresh = batch
+        if LINK_FILTER_ENABLED:
+            with get_conn() as conn:
+                deletes = conn.execute("SELECT n FROM links_deleted WHERE id = 0").fetchone()[0]
+                if _known_links is None or deletes != _known_links_deletes:
+                    _known_links = KnownLinks(_iter_all_links(conn))
+                    _known_links_deletes = deletes
+
+            fresh = [l for l in batch if l not in _known_links]
+            metrics.LINK_FILTER_CHECKS.inc(len(batch) - len(fresh), result="known")
+            metrics.LINK_FILTER_CHECKS.inc(len(fresh), result="new")
+
+        if not fresh:
+            return 0
 
-            # insert as active
-            cur.execute(
-                "INSERT OR IGNORE INTO links(link, source_channel, status) VALUES(?,?, 'active')",
-                (link, source_channel),
+        with get_conn() as conn:
+            before = conn.total_changes
+            # INSERT OR IGNORE still guards the UNIQUE index (filter disabled,
+            # or another process writing the same DB)
+            conn.executemany(
+                "INSERT OR IGNORE INTO links(kind, value, source_channel, status) VALUES(?,?,?, 'active')",
+                [(*keys[link], source_channel) for link in fresh],
             )
-            if cur.rowcount > 0:
-                added += 1
+            conn.executemany("""
+                UPDATE links
+                SET status='active', dead_reason=NULL, source_channel=?
+                WHERE kind=? AND value=? AND status='archived'
+            """, [(source_channel, *keys[link]) for link in fresh])
+            added = conn.total_changes - before
+            conn.commit()
+
+        if _known_links is not None:
+            _known_links.update(fresh)
 
-        conn.commit()
     return added
 
 
+@_timed
 def mark_link_dead(link_id: int, reason: str = "") -> None:
     with get_conn() as conn:
         conn.execute("""
@@ -209,31 +808,55 @@ def mark_link_dead(link_id: int, reason: str = "") -> None:
         conn.commit()
 
 
+@_timed
 def count_links_total() -> int:
     with get_conn() as conn:
         return conn.execute("SELECT COUNT(*) FROM links").fetchone()[0]
 
 
+@_timed
 def count_dead_links() -> int:
     with get_conn() as conn:
         return conn.execute("SELECT COUNT(*) FROM links WHERE status='dead'").fetchone()[0]
 
 
-def count_links_unassigned_active() -> int:
+@_timed
+def count_links_unassigned_active(upto: Optional[int] = None) -> int:
     """
     Active links that are NOT assigned to any session.
     (This is the reserve pool base.)
+    upto: stop counting there (bounded scan when only "enough?" matters).
     """
     with get_conn() as conn:
         return conn.execute("""
-            SELECT COUNT(*)
-            FROM links l
-            LEFT JOIN assignments a ON a.link_id = l.id
-            WHERE a.link_id IS NULL
-              AND (l.status IS NULL OR l.status='active')
-        """).fetchone()[0]
+            SELECT COUNT(*) FROM (
+                SELECT 1
+                FROM links l
+                LEFT JOIN assignments a ON a.link_id = l.id
+                WHERE a.link_id IS NULL
+                  AND (l.status IS NULL OR l.status='active')
+                LIMIT ?
+            )
+        """, (-1 if upto is None else upto,)).fetchone()[0]
+
+
+@_timed
+def count_retry_assignments() -> int:
+    with get_conn() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM assignments WHERE join_status='retry'"
+        ).fetchone()[0]
 
 
+@_timed
+def count_pending_assignments() -> int:
+    with get_conn() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM assignments WHERE join_status='pending'"
+        ).fetchone()[0]
+
+
+@_timed
 def count_links_unassigned_any() -> int:
     """
     Counts ALL unassigned links including dead (informational only).
@@ -247,13 +870,14 @@ def count_links_unassigned_any() -> int:
         """).fetchone()[0]
 
 
-def pop_reserve_link() -> Optional[Tuple[int, str]]:
+@_timed
+def pop_reserve_link() -> Optional[LinkRow]:
     """
     Get ONE active unassigned link from the reserve pool.
     """
     with get_conn() as conn:
         row = conn.execute("""
-            SELECT l.id, l.link
+            SELECT l.id, l.kind, l.value
             FROM links l
             LEFT JOIN assignments a ON a.link_id = l.id
             WHERE a.link_id IS NULL
@@ -265,10 +889,11 @@ def pop_reserve_link() -> Optional[Tuple[int, str]]:
         if not row:
             return None
 
-        return (row["id"], row["link"])
+        return (row["id"], row["kind"], row["value"])
 
 
 # ---------------- assignments ----------------
+@_timed
 def assign_unassigned_links(session_id: int, limit: int) -> int:
     """
     Assign up to `limit` unassigned ACTIVE links to a session.
@@ -305,25 +930,29 @@ def assign_unassigned_links(session_id: int, limit: int) -> int:
         return assigned
 
 
-def get_pending_links_for_session(session_id: int, limit: int = 1000):
+@_timed
+def get_pending_links_for_session(session_id: int, limit: int = 1000) -> List[LinkRow]:
     """
-    Return active links where assignment status is pending.
+    Return active links where assignment status is pending,
+    plus retries whose backoff has expired, as (link_id, kind, value).
     """
     with get_conn() as conn:
         cur = conn.cursor()
         cur.execute("""
-            SELECT l.id, l.link
+            SELECT l.id, l.kind, l.value
             FROM links l
             JOIN assignments a ON a.link_id = l.id
             WHERE a.session_id = ?
-              AND a.join_status = 'pending'
+              AND (a.join_status = 'pending'
+                   OR (a.join_status = 'retry' AND a.next_attempt_at <= CURRENT_TIMESTAMP))
               AND (l.status IS NULL OR l.status='active')
             ORDER BY l.id ASC
             LIMIT ?
         """, (session_id, limit))
-        return [(r["id"], r["link"]) for r in cur.fetchall()]
+        return [(r["id"], r["kind"], r["value"]) for r in cur.fetchall()]
 
 
+@_timed
 def mark_join_success(session_id: int, link_id: int):
     with get_conn() as conn:
         conn.execute("""
@@ -335,6 +964,7 @@ def mark_join_success(session_id: int, link_id: int):
         conn.commit()
 
 
+@_timed
 def mark_join_failed(session_id: int, link_id: int, error: str):
     with get_conn() as conn:
         conn.execute("""
@@ -347,6 +977,72 @@ def mark_join_failed(session_id: int, link_id: int, error: str):
         conn.commit()
 
 
+@_timed
+def schedule_join_retry(
+    session_id: int,
+    link_id: int,
+    error: str,
+    max_attempts: int,
+    base_seconds: int,
+    max_seconds: int,
+) -> Optional[int]:
+    """
+    Transient join failure: requeue the link for the same session after
+    base_seconds * 2^(retries-1) (capped at max_seconds).
+    After max_attempts transient failures the link is marked failed.
+
+    Returns the backoff in seconds, or None if the link is now failed.
+    """
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT retries FROM assignments WHERE session_id=? AND link_id=?",
+            (session_id, link_id),
+        ).fetchone()
+        if row is None:
+            return None
+
+        retries = (row["retries"] or 0) + 1
+        delay: Optional[int] = None
+        if retries < max_attempts:
+            delay = min(base_seconds * 2 ** (retries - 1), max_seconds)
+
+        conn.execute("""
+            UPDATE assignments
+            SET join_status=?,
+                join_attempts=join_attempts+1,
+                retries=?,
+                last_error=?,
+                next_attempt_at=CASE WHEN ? IS NULL THEN NULL ELSE datetime('now', ?) END
+            WHERE session_id=? AND link_id=?
+        """, (
+            "retry" if delay is not None else "failed",
+            retries,
+            (error or "")[:1000],
+            delay, f"+{delay or 0} seconds",
+            session_id, link_id,
+        ))
+        conn.commit()
+        return delay
+
+
+@_timed
+def next_retry_in(session_id: int) -> Optional[float]:
+    """
+    Seconds until the session's earliest queued retry is due
+    (0 if already due), or None when it has no retries queued.
+    """
+    with get_conn() as conn:
+        row = conn.execute("""
+            SELECT (julianday(MIN(next_attempt_at)) - julianday('now')) * 86400.0
+            FROM assignments
+            WHERE session_id=? AND join_status='retry'
+        """, (session_id,)).fetchone()
+        if row[0] is None:
+            return None
+        return max(float(row[0]), 0.0)
+
+
+@_timed
 def mark_join_requested(session_id: int, link_id: int, note: str = ""):
     """
     For groups/channels with join request approval.
@@ -363,6 +1059,7 @@ def mark_join_requested(session_id: int, link_id: int, note: str = ""):
         conn.commit()
 
 
+@_timed
 def bump_attempt(session_id: int, link_id: int, error: str = ""):
     """
     Useful for FloodWait: increase attempts WITHOUT changing join_status.
@@ -377,20 +1074,22 @@ def bump_attempt(session_id: int, link_id: int, error: str = ""):
         conn.commit()
 
 
-def log_join(session_id: int, link: str, status: str, error_message: str = ""):
+@_timed
+def log_join(session_id: int, link_id: int, status: str, error_message: str = ""):
     with get_conn() as conn:
         conn.execute("""
-            INSERT INTO join_log(session_id, link, status, error_message)
+            INSERT INTO join_log(session_id, link_id, status, error_message)
             VALUES(?,?,?,?)
-        """, (session_id, link, status, (error_message or "")[:1000]))
+        """, (session_id, link_id, status, (error_message or "")[:1000]))
         conn.commit()
 
 
+@_timed
 def replace_dead_assignment(
     session_id: int,
     dead_link_id: int,
     dead_reason: str = ""
-) -> Optional[Tuple[int, str]]:
+) -> Optional[LinkRow]:
     """
     Implements:
     - mark dead link as dead
@@ -398,7 +1097,7 @@ def replace_dead_assignment(
     - pull new active unassigned link from reserve
     - assign new link to same session
 
-    Returns (new_link_id, new_link) or None if reserve empty.
+    Returns (new_link_id, kind, value) or None if reserve empty.
     """
     with get_conn() as conn:
         cur = conn.cursor()
@@ -420,7 +1119,7 @@ def replace_dead_assignment(
 
         # 3) pick reserve link
         row = cur.execute("""
-            SELECT l.id, l.link
+            SELECT l.id, l.kind, l.value
             FROM links l
             LEFT JOIN assignments a ON a.link_id = l.id
             WHERE a.link_id IS NULL
@@ -434,7 +1133,6 @@ def replace_dead_assignment(
             return None
 
         new_link_id = row["id"]
-        new_link = row["link"]
 
         # 4) assign
         cur.execute("""
@@ -443,11 +1141,222 @@ def replace_dead_assignment(
         """, (new_link_id, session_id))
 
         conn.commit()
-        return (new_link_id, new_link)
+        return (new_link_id, row["kind"], row["value"])
+
+
+# ---------------- extraction jobs ----------------
+# status: queued -> running -> done | failed | cancelled
+# last_msg_id is the resume checkpoint of a full-history scan.
+EXTRACTION_JOB_COLUMNS = (
+    "id, channel_link, status, last_msg_id, scanned, found, added, error, "
+    "created_at, started_at, finished_at"
+)
+
+
+@_timed
+def create_extraction_jobs(channel_links: List[str]) -> List[int]:
+    ids = []
+    with get_conn() as conn:
+        cur = conn.cursor()
+        for ch in channel_links:
+            cur.execute("INSERT INTO extraction_jobs(channel_link) VALUES(?)", (ch,))
+            ids.append(cur.lastrowid)
+        conn.commit()
+    return ids
+
+
+@_timed
+def claim_next_extraction_job() -> Optional[sqlite3.Row]:
+    """
+    Atomically move the oldest queued job to running and return it.
+    """
+    with get_conn() as conn:
+        row = conn.execute(f"""
+            UPDATE extraction_jobs
+            SET status='running', started_at=CURRENT_TIMESTAMP, error=NULL
+            WHERE id = (
+                SELECT id FROM extraction_jobs
+                WHERE status='queued'
+                ORDER BY id ASC
+                LIMIT 1
+            )
+            RETURNING {EXTRACTION_JOB_COLUMNS}
+        """).fetchone()
+        conn.commit()
+        return row
+
+
+@_timed
+def update_extraction_job_progress(job_id: int, last_msg_id: int, scanned: int, found: int, added: int) -> None:
+    """
+    Checkpoint: counters are deltas since the previous checkpoint.
+    """
+    with get_conn() as conn:
+        conn.execute("""
+            UPDATE extraction_jobs
+            SET last_msg_id=MAX(last_msg_id, ?),
+                scanned=scanned + ?,
+                found=found + ?,
+                added=added + ?
+            WHERE id=?
+        """, (last_msg_id, scanned, found, added, job_id))
+        conn.commit()
+
+
+@_timed
+def finish_extraction_job(job_id: int, status: str, error: str = "") -> None:
+    with get_conn() as conn:
+        conn.execute("""
+            UPDATE extraction_jobs
+            SET status=?, error=?, finished_at=CURRENT_TIMESTAMP
+            WHERE id=?
+        """, (status, error or None, job_id))
+        conn.commit()
+
+
+@_timed
+def cancel_queued_extraction_job(job_id: int) -> bool:
+    with get_conn() as conn:
+        cur = conn.execute("""
+            UPDATE extraction_jobs
+            SET status='cancelled', finished_at=CURRENT_TIMESTAMP
+            WHERE id=? AND status='queued'
+        """, (job_id,))
+        conn.commit()
+        return cur.rowcount > 0
+
+
+@_timed
+def requeue_running_extraction_jobs() -> int:
+    """
+    Startup: jobs left 'running' by a previous process go back to the queue
+    (they resume from last_msg_id).
+    """
+    with get_conn() as conn:
+        cur = conn.execute("UPDATE extraction_jobs SET status='queued' WHERE status='running'")
+        conn.commit()
+        return cur.rowcount
+
+
+@_timed
+def get_extraction_job(job_id: int) -> Optional[sqlite3.Row]:
+    with get_conn() as conn:
+        return conn.execute(
+            f"SELECT {EXTRACTION_JOB_COLUMNS} FROM extraction_jobs WHERE id=?", (job_id,)
+        ).fetchone()
+
+
+@_timed
+def list_extraction_jobs(limit: int = 20) -> List[sqlite3.Row]:
+    """
+    Unfinished jobs first, then the most recent finished ones.
+    """
+    with get_conn() as conn:
+        return conn.execute(f"""
+            SELECT {EXTRACTION_JOB_COLUMNS} FROM extraction_jobs
+            ORDER BY status IN ('queued', 'running') DESC, id DESC
+            LIMIT ?
+        """, (limit,)).fetchall()
+
+
+# ---------------- exports (chunked, keyset) ----------------
+# Each chunk uses its own short read transaction (id > last_id LIMIT n),
+# so exporting huge tables never holds a long-lived reader open.
+def _iter_keyset(sql: str, params: tuple, chunk_size: int) -> Iterator[List[tuple]]:
+    last_id = 0
+    while True:
+        with get_conn() as conn:
+            rows = conn.execute(sql, (last_id,) + params + (chunk_size,)).fetchall()
+        if not rows:
+            return
+        last_id = rows[-1][0]
+        yield [tuple(r) for r in rows]
+        if len(rows) < chunk_size:
+            return
+
+
+def iter_dead_links(chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """
+    Chunks of (id, link, source_channel, dead_reason, last_checked_at).
+    """
+    return _iter_keyset(f"""
+        SELECT l.id, {_LINK_URL_SQL}, l.source_channel, l.dead_reason, l.last_checked_at
+        FROM links l
+        WHERE l.id > ? AND l.status='dead'
+        ORDER BY l.id ASC
+        LIMIT ?
+    """, (), chunk_size)
+
+
+def iter_failed_assignments(chunk_size: int = 1000) -> Iterator[List[tuple]]:
+    """
+    Chunks of (link_id, link, session_id, join_attempts, last_error, assigned_at).
+    """
+    return _iter_keyset(f"""
+        SELECT a.link_id, {_LINK_URL_SQL}, a.session_id, a.join_attempts, a.last_error, a.assigned_at
+        FROM assignments a
+        JOIN links l ON l.id = a.link_id
+        WHERE a.link_id > ? AND a.join_status='failed'
+        ORDER BY a.link_id ASC
+        LIMIT ?
+    """, (), chunk_size)
+
+
+def iter_join_log(
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    chunk_size: int = 1000,
+) -> Iterator[List[tuple]]:
+    """
+    Chunks of (id, session_id, link, status, error_message, created_at)
+    for since <= created_at < until (UTC 'YYYY-MM-DD[ HH:MM:SS]', both optional).
+    """
+    return _iter_keyset(f"""
+        SELECT j.id, j.session_id, {_LINK_URL_SQL}, j.status, j.error_message, j.created_at
+        FROM join_log j
+        LEFT JOIN links l ON l.id = j.link_id
+        WHERE j.id > ?
+          AND (? IS NULL OR j.created_at >= ?)
+          AND (? IS NULL OR j.created_at < ?)
+        ORDER BY j.id ASC
+        LIMIT ?
+    """, (since, since, until, until), chunk_size)
 
 
 # ---------------- stats ----------------
-def get_stats() -> Dict[str, Any]:
+@_timed
+def get_session_stats_page(cursor: int = 0, direction: str = "next", limit: int = 20) -> Dict[str, Any]:
+    """
+    Per-session assignment counters for one keyset page of active sessions.
+    """
+    with get_conn() as conn:
+        ids, has_prev, has_next = _keyset_session_ids(conn, cursor, direction, limit)
+
+        counts: Dict[int, Dict[str, int]] = {
+            sid: {"session_id": sid, "pending": 0, "retry": 0, "requested": 0, "success": 0, "failed": 0}
+            for sid in ids
+        }
+        if ids:
+            rows = conn.execute(f"""
+                SELECT session_id, join_status, COUNT(*) AS n
+                FROM assignments
+                WHERE session_id IN ({",".join("?" * len(ids))})
+                GROUP BY session_id, join_status
+            """, ids).fetchall()
+            for r in rows:
+                st = r["join_status"]
+                if st in counts[r["session_id"]]:
+                    counts[r["session_id"]][st] = int(r["n"])
+
+        return {
+            "rows": [counts[sid] for sid in ids],
+            "has_prev": has_prev,
+            "has_next": has_next,
+        }
+
+
+@_timed
+def get_stats(include_per_session: bool = True) -> Dict[str, Any]:
     with get_conn() as conn:
         cur = conn.cursor()
 
@@ -483,14 +1392,16 @@ def get_stats() -> Dict[str, Any]:
         """).fetchone()[0]
 
         pending = cur.execute("SELECT COUNT(*) FROM assignments WHERE join_status='pending'").fetchone()[0]
+        retry = cur.execute("SELECT COUNT(*) FROM assignments WHERE join_status='retry'").fetchone()[0]
         requested = cur.execute("SELECT COUNT(*) FROM assignments WHERE join_status='requested'").fetchone()[0]
         success = cur.execute("SELECT COUNT(*) FROM assignments WHERE join_status='success'").fetchone()[0]
         failed = cur.execute("SELECT COUNT(*) FROM assignments WHERE join_status='failed'").fetchone()[0]
 
-        per_session_rows = cur.execute("""
+        per_session_rows = [] if not include_per_session else cur.execute("""
             SELECT
                 s.id AS session_id,
                 SUM(CASE WHEN a.join_status='pending' THEN 1 ELSE 0 END) AS pending,
+                SUM(CASE WHEN a.join_status='retry' THEN 1 ELSE 0 END) AS retry,
                 SUM(CASE WHEN a.join_status='requested' THEN 1 ELSE 0 END) AS requested,
                 SUM(CASE WHEN a.join_status='success' THEN 1 ELSE 0 END) AS success,
                 SUM(CASE WHEN a.join_status='failed' THEN 1 ELSE 0 END) AS failed
@@ -506,6 +1417,7 @@ def get_stats() -> Dict[str, Any]:
             per_session.append({
                 "session_id": int(r["session_id"]),
                 "pending": int(r["pending"] or 0),
+                "retry": int(r["retry"] or 0),
                 "requested": int(r["requested"] or 0),
                 "success": int(r["success"] or 0),
                 "failed": int(r["failed"] or 0),
@@ -526,9 +1438,299 @@ def get_stats() -> Dict[str, Any]:
             "unassigned": unassigned_any,
 
             "pending": pending,
+            "retry": retry,
             "requested": requested,
             "success": success,
             "failed": failed,
 
             "per_session": per_session,
         }
+
+
+# ---------------- storage maintenance ----------------
+@_timed
+def wal_checkpoint(mode: str = "PASSIVE") -> Tuple[int, int, int]:
+    """
+    mode: PASSIVE (never blocks writers) | TRUNCATE (waits for readers,
+    then resets the WAL file to zero bytes).
+    Returns (busy, wal_frames, checkpointed_frames).
+    """
+    if mode not in ("PASSIVE", "FULL", "RESTART", "TRUNCATE"):
+        raise ValueError(f"bad checkpoint mode: {mode}")
+    with get_conn() as conn:
+        busy, log, done = conn.execute(f"PRAGMA wal_checkpoint({mode});").fetchone()
+        return int(busy), int(log), int(done)
+
+
+@_timed
+def optimize() -> None:
+    """
+    PRAGMA optimize: re-analyze tables whose statistics are stale
+    (cheap when nothing changed).
+    """
+    with get_conn() as conn:
+        conn.execute("PRAGMA optimize;")
+
+
+@_timed
+def incremental_vacuum(max_pages: int) -> int:
+    """
+    Give up to `max_pages` free pages back to the filesystem.
+    Only works on DBs created with auto_vacuum=INCREMENTAL; returns pages freed.
+    """
+    with get_conn() as conn:
+        if conn.execute("PRAGMA auto_vacuum;").fetchone()[0] != 2:
+            return 0
+        before = conn.execute("PRAGMA freelist_count;").fetchone()[0]
+        if not before:
+            return 0
+        conn.execute(f"PRAGMA incremental_vacuum({int(max_pages)});").fetchall()
+        conn.commit()
+        return before - conn.execute("PRAGMA freelist_count;").fetchone()[0]
+
+
+@_timed
+def vacuum_full() -> Tuple[int, int]:
+    """
+    Rewrite the whole DB file (exclusive lock for the whole run: owner
+    /vacuum while idle only). Also switches older files to
+    auto_vacuum=INCREMENTAL. Returns (db_bytes_before, db_bytes_after).
+    """
+    before = storage_info()["db_bytes"]
+    with get_conn() as conn:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+        conn.execute("VACUUM;")
+    wal_checkpoint("TRUNCATE")
+    return before, storage_info()["db_bytes"]
+
+
+@_timed
+def storage_info() -> Dict[str, int]:
+    """
+    {"page_size", "page_count", "freelist_count", "auto_vacuum", "db_bytes", "wal_bytes"}
+    """
+    with get_conn() as conn:
+        info = {
+            k: int(conn.execute(f"PRAGMA {k};").fetchone()[0])
+            for k in ("page_size", "page_count", "freelist_count", "auto_vacuum")
+        }
+    info["db_bytes"] = info["page_size"] * info["page_count"]
+    wal = DB_PATH + "-wal"
+    info["wal_bytes"] = os.path.getsize(wal) if os.path.exists(wal) else 0
+    return info
+
+
+# ---------------- throughput snapshots ----------------
+@_timed
+def insert_rate_snapshots(rows: List[tuple]) -> None:
+    """
+    rows: (ts, session_id, joined, failed, requested, dead, retried,
+           floodwaits, floodwait_seconds, reserve, pending)
+    """
+    with get_conn() as conn:
+        conn.executemany("""
+            INSERT OR REPLACE INTO rate_snapshots(
+              ts, session_id, joined, failed, requested, dead, retried,
+              floodwaits, floodwait_seconds, reserve, pending
+            ) VALUES(?,?,?,?,?,?,?,?,?,?,?)
+        """, rows)
+        conn.commit()
+
+
+@_timed
+def prune_rate_snapshots(before_ts: int) -> int:
+    with get_conn() as conn:
+        cur = conn.execute("DELETE FROM rate_snapshots WHERE ts < ?", (before_ts,))
+        conn.commit()
+        return cur.rowcount
+
+
+@_timed
+def get_rate_series(session_id: int, since_ts: int) -> List[sqlite3.Row]:
+    """
+    Snapshots of one session (0 = overall) since `since_ts`, oldest first.
+    """
+    with get_conn() as conn:
+        return conn.execute("""
+            SELECT * FROM rate_snapshots
+            WHERE session_id=? AND ts >= ?
+            ORDER BY ts ASC
+        """, (session_id, since_ts)).fetchall()
+
+
+@_timed
+def get_session_rate_totals(since_ts: int, limit: int = 10) -> List[sqlite3.Row]:
+    """
+    Per-session totals since `since_ts`, busiest first:
+    (session_id, done, joined, failed, floodwait_seconds).
+    """
+    with get_conn() as conn:
+        return conn.execute("""
+            SELECT session_id,
+                   SUM(joined + failed + requested) AS done,
+                   SUM(joined) AS joined,
+                   SUM(failed) AS failed,
+                   SUM(floodwait_seconds) AS floodwait_seconds
+            FROM rate_snapshots
+            WHERE session_id > 0 AND ts >= ?
+            GROUP BY session_id
+            ORDER BY done DESC
+            LIMIT ?
+        """, (since_ts, limit)).fetchall()
+
+
+# ---------------- join_log outcomes / retention ----------------
+# join_log outcome classes: success | requested | retry | cancelled |
+# failed, plus dead and floodwait (both logged as status 'failed')
+_JOIN_OUTCOME_SQL = """CASE
+  WHEN status='failed' AND error_message LIKE 'dead_link:%' THEN 'dead'
+  WHEN status='failed' AND error_message LIKE 'FloodWaitError wait %' THEN 'floodwait'
+  ELSE status END"""
+_FLOODWAIT_SECONDS_SQL = """CASE
+  WHEN status='failed' AND error_message LIKE 'FloodWaitError wait %'
+  THEN CAST(substr(error_message, 21) AS INTEGER) ELSE 0 END"""
+
+
+@_timed
+def get_oldest_join_log(limit: int) -> List[sqlite3.Row]:
+    """
+    The `limit` oldest join_log rows (with the link URL), oldest first.
+    """
+    with get_conn() as conn:
+        return conn.execute(f"""
+            SELECT j.id, j.session_id, j.link_id, {_LINK_URL_SQL} AS link,
+                   j.status, j.error_message, j.created_at
+            FROM join_log j
+            LEFT JOIN links l ON l.id = j.link_id
+            ORDER BY j.id ASC
+            LIMIT ?
+        """, (limit,)).fetchall()
+
+
+@_timed
+def rollup_and_delete_join_log(max_id: int) -> int:
+    """
+    One transaction: add join_log rows with id <= max_id to join_log_daily,
+    then delete them. Returns the number of rows deleted.
+    """
+    with get_conn() as conn:
+        conn.execute(f"""
+            INSERT INTO join_log_daily(day, session_id, outcome, attempts, floodwait_seconds)
+            SELECT COALESCE(date(created_at), ''), COALESCE(session_id, 0), {_JOIN_OUTCOME_SQL},
+                   COUNT(*), SUM({_FLOODWAIT_SECONDS_SQL})
+            FROM join_log
+            WHERE id <= ?
+            GROUP BY 1, 2, 3
+            ON CONFLICT(day, session_id, outcome) DO UPDATE SET
+              attempts = attempts + excluded.attempts,
+              floodwait_seconds = floodwait_seconds + excluded.floodwait_seconds
+        """, (max_id,))
+        deleted = conn.execute("DELETE FROM join_log WHERE id <= ?", (max_id,)).rowcount
+        conn.commit()
+        return deleted
+
+
+@_timed
+def get_join_history(days: int) -> List[sqlite3.Row]:
+    """
+    Per-day outcome counts for the last `days` days (UTC), newest first:
+    rollups plus raw rows not rolled up yet. Rows: (day, outcome, n).
+    """
+    since = f"-{max(int(days) - 1, 0)} days"
+    with get_conn() as conn:
+        return conn.execute(f"""
+            SELECT day, outcome, SUM(n) AS n
+            FROM (
+                SELECT day, outcome, attempts AS n
+                FROM join_log_daily
+                WHERE day >= date('now', ?)
+                UNION ALL
+                SELECT date(created_at), {_JOIN_OUTCOME_SQL}, COUNT(*)
+                FROM join_log
+                WHERE created_at >= date('now', ?)
+                GROUP BY 1, 2
+            )
+            GROUP BY day, outcome
+            ORDER BY day DESC
+        """, (since, since)).fetchall()
+
+
+@_timed
+def get_rollup_outcome_mix(max_rows: int) -> Dict[str, int]:
+    """
+    Same shape as get_join_outcome_mix(), from the newest join_log_daily
+    days until about `max_rows` attempts are covered.
+    """
+    keys = ("success", "requested", "retried", "dead", "floodwaits", "failed")
+    by_outcome = {"success": "success", "requested": "requested", "retry": "retried",
+                  "dead": "dead", "floodwait": "floodwaits", "failed": "failed"}
+    mix = dict.fromkeys(("rows", "floodwait_seconds") + keys, 0)
+    with get_conn() as conn:
+        rows = conn.execute("""
+            SELECT day, outcome, SUM(attempts) AS n, SUM(floodwait_seconds) AS fw
+            FROM join_log_daily
+            GROUP BY day, outcome
+            ORDER BY day DESC
+        """)
+        day = None
+        for r in rows:
+            if r["day"] != day:
+                if mix["rows"] >= max_rows:
+                    break
+                day = r["day"]
+            mix["rows"] += int(r["n"])
+            key = by_outcome.get(r["outcome"])
+            if key:
+                mix[key] += int(r["n"])
+            mix["floodwait_seconds"] += int(r["fw"] or 0)
+    return mix
+
+
+# ---------------- capacity planner inputs ----------------
+@_timed
+def get_join_outcome_mix(last_rows: int) -> Dict[str, int]:
+    """
+    Outcome counts over the newest `last_rows` join_log rows (rowid range,
+    one aggregate pass):
+    {"rows", "success", "requested", "failed", "dead", "retried",
+     "floodwaits", "floodwait_seconds"}
+    "failed" excludes dead links and FloodWaits (logged as failed too).
+    """
+    with get_conn() as conn:
+        top = conn.execute("SELECT COALESCE(MAX(id), 0) FROM join_log").fetchone()[0]
+        row = conn.execute("""
+            SELECT
+              COUNT(*) AS rows,
+              COALESCE(SUM(status='success'), 0) AS success,
+              COALESCE(SUM(status='requested'), 0) AS requested,
+              COALESCE(SUM(status='retry'), 0) AS retried,
+              COALESCE(SUM(status='failed' AND error_message LIKE 'dead_link:%'), 0) AS dead,
+              COALESCE(SUM(status='failed' AND error_message LIKE 'FloodWaitError wait %'), 0) AS floodwaits,
+              COALESCE(SUM(CASE WHEN status='failed' AND error_message LIKE 'FloodWaitError wait %'
+                                THEN CAST(substr(error_message, 21) AS INTEGER) ELSE 0 END), 0) AS floodwait_seconds,
+              COALESCE(SUM(status='failed'
+                           AND error_message NOT LIKE 'dead_link:%'
+                           AND error_message NOT LIKE 'FloodWaitError wait %'), 0) AS failed
+            FROM join_log
+            WHERE id > ?
+        """, (top - last_rows,)).fetchone()
+        return {k: int(row[k]) for k in row.keys()}
+
+
+@_timed
+def get_backlog_counts() -> Dict[str, int]:
+    """
+    {"pending", "retry", "unassigned_active"}: assigned links still to
+    join and the unassigned pool (reserve included).
+    """
+    with get_conn() as conn:
+        counts = {"pending": 0, "retry": 0}
+        for r in conn.execute("""
+            SELECT join_status, COUNT(*) AS n
+            FROM assignments
+            WHERE join_status IN ('pending', 'retry')
+            GROUP BY join_status
+        """):
+            counts[r["join_status"]] = int(r["n"])
+    counts["unassigned_active"] = count_links_unassigned_active()
+    return counts
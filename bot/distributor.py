@@ -1,5 +1,6 @@
 # bot/distributor.py
 from bot import db
+from bot.registry import registry
 from bot.config import RESERVE_LINKS
 
 MAX_LINKS_PER_SESSION = 1000
@@ -17,8 +18,8 @@ def distribute_links_to_sessions() -> dict:
 
     Returns report dict.
     """
-    sessions = db.list_sessions()
-    if not sessions:
+    session_ids = registry.ids()
+    if not session_ids:
         return {"ok": False, "error": "No sessions found"}
 
     # Unassigned active links only (reserve pool)
@@ -31,7 +32,7 @@ def distribute_links_to_sessions() -> dict:
 
     report = {
         "ok": True,
-        "sessions": len(sessions),
+        "sessions": len(session_ids),
         "reserve_target": RESERVE_LINKS,
         "unassigned_active_before": unassigned_active_before,
         "distributable_before": distributable,
@@ -42,7 +43,7 @@ def distribute_links_to_sessions() -> dict:
     remaining = distributable
 
     # Distribute in order: session 1, session 2, ...
-    for (sid, _, _, _) in sessions:
+    for sid in session_ids:
         if remaining <= 0:
             assigned = 0
         else:
@@ -64,28 +65,14 @@ def distribute_links_to_sessions() -> dict:
     return report
 
 
-def estimate_needed_sessions() -> dict:
+def top_up_session(session_id: int, limit: int) -> int:
     """
-    Estimate number of additional sessions needed to process all active unassigned links
-    ABOVE the reserve pool.
-
-    Example:
-    - unassigned_active=3200
-    - reserve=500
-    - distributable=2700
-    => needed_sessions=3
+    Assign up to `limit` more links to ONE session without touching the
+    reserve pool (continuous pipeline mode: a session ran out of links).
+    Returns assigned count.
     """
-    unassigned_active = db.count_links_unassigned_active()
-
-    distributable = unassigned_active - RESERVE_LINKS
-    if distributable < 0:
-        distributable = 0
-
-    needed_sessions = (distributable + MAX_LINKS_PER_SESSION - 1) // MAX_LINKS_PER_SESSION
-
-    return {
-        "unassigned_active": unassigned_active,
-        "reserve_target": RESERVE_LINKS,
-        "distributable": distributable,
-        "needed_sessions": needed_sessions,
-    }
+    # bounded count: only whether there is more than the reserve matters
+    distributable = db.count_links_unassigned_active(upto=RESERVE_LINKS + limit) - RESERVE_LINKS
+    if distributable <= 0:
+        return 0
+    return db.assign_unassigned_links(session_id, min(limit, distributable))
@@ -1,81 +1,171 @@
 # bot/extractor.py
 import logging
-from telethon import TelegramClient
-from telethon.sessions import StringSession
+from typing import Awaitable, Callable, List, Optional
 
-from bot.config import API_ID, API_HASH, EXTRACT_MESSAGES_LIMIT
+from bot.config import API_ID, API_HASH, EXTRACT_MESSAGES_LIMIT, EXTRACT_USE_TAKEOUT
+from bot.registry import registry
 from bot.utils import extract_telegram_links, normalize_tme_link
 
 logger = logging.getLogger(__name__)
 
+# Progress / checkpoint callback:
+#   await on_batch(new_links, last_msg_id, scanned)
+# called every CHECKPOINT_EVERY messages and once at the end, with the
+# links first seen since the previous call. In full mode, passing
+# last_msg_id back as `min_id` resumes the scan after that message.
+OnBatch = Callable[[List[str], int, int], Awaitable[None]]
 
-async def extract_links_from_channel(session_string: str, channel_link: str) -> list[str]:
+CHECKPOINT_EVERY = 1000
+
+
+class _Scan:
+    """
+    Scan state shared by the takeout and the plain pass, so a fallback
+    continues where takeout stopped instead of starting over.
+    """
+
+    def __init__(self, min_id: int, on_batch: Optional[OnBatch]):
+        self.found = set()
+        self.seen_raw = set()
+        self.pending: List[str] = []
+        self.last_id = min_id
+        self.scanned = 0
+        self.on_batch = on_batch
+        self._since_checkpoint = 0
+
+    def feed(self, msg) -> None:
+        self.scanned += 1
+        self._since_checkpoint += 1
+        self.last_id = msg.id
+
+        text = msg.message or ""
+        if not text.strip():
+            return
+
+        # channels repeat the same links a lot: normalize each raw string once
+        for link in extract_telegram_links(text):
+            if link in self.seen_raw:
+                continue
+            self.seen_raw.add(link)
+            n = normalize_tme_link(link)
+            if n and n not in self.found:
+                self.found.add(n)
+                self.pending.append(n)
+
+    async def checkpoint(self, force: bool = False) -> None:
+        if self.on_batch is None:
+            return
+        if not force and self._since_checkpoint < CHECKPOINT_EVERY:
+            return
+        batch, self.pending = self.pending, []
+        self._since_checkpoint = 0
+        await self.on_batch(batch, self.last_id, self.scanned)
+
+
+async def _scan_history(source, entity, scan: _Scan, limit: int, wait_time: Optional[float]) -> None:
+    if limit > 0:
+        # newest first; after a takeout fallback continue below the last id
+        remaining = limit - scan.scanned
+        if remaining <= 0:
+            return
+        offset_id = scan.last_id if scan.scanned else 0
+        it = source.iter_messages(entity, limit=remaining, offset_id=offset_id, wait_time=wait_time)
+    else:
+        # reverse=True: from first message to last message
+        it = source.iter_messages(entity, reverse=True, min_id=scan.last_id, wait_time=wait_time)
+
+    async for msg in it:
+        if not msg:
+            continue
+        scan.feed(msg)
+        await scan.checkpoint()
+
+
+async def _scan_with_takeout(client, entity, scan: _Scan, limit: int) -> bool:
+    """
+    Scan inside a takeout (data export) session.
+    Returns False if Telegram refused / invalidated takeout (caller falls back).
+    """
+    from telethon import errors
+
+    try:
+        async with client.takeout(finalize=True, channels=True, megagroups=True) as takeout:
+            # takeout requests are not throttled by Telethon's 1 s wait between
+            # history chunks; Telegram still caps each chunk at 100 messages
+            await _scan_history(takeout, entity, scan, limit, wait_time=0)
+        return True
+
+    except errors.TakeoutInitDelayError as e:
+        logger.warning(
+            "[extractor] Takeout refused (confirm the export in Telegram, retry in %ss); "
+            "falling back to normal history", e.seconds,
+        )
+    except (errors.TakeoutInvalidError, errors.TakeoutRequiredError) as e:
+        logger.warning(
+            "[extractor] Takeout session lost after %s messages (%s); continuing with normal history",
+            scan.scanned, type(e).__name__,
+        )
+    return False
+
+
+async def extract_links_from_channel(
+    session_string: str,
+    channel_link: str,
+    min_id: int = 0,
+    on_batch: Optional[OnBatch] = None,
+    use_takeout: bool = EXTRACT_USE_TAKEOUT,
+) -> list[str]:
     """
     Extract telegram links from channel messages.
 
     Modes:
     - if EXTRACT_MESSAGES_LIMIT == 0:
-        Extract from first message to last message (reverse=True)
+        Extract from first message to last message (reverse=True),
+        starting after `min_id` (checkpoint resume)
     - if EXTRACT_MESSAGES_LIMIT > 0:
         Extract last N messages only
+    - use_takeout: run the scan inside a Telegram takeout (data export)
+        session; if takeout is refused, falls back to normal history
 
     Output:
     - returns unique links normalized to:
       https://t.me/<path>
 
     Notes:
-    - Uses Telethon StringSession.
+    - Uses Telethon StringSession (parsed once, see bot.registry).
     - Will ignore empty messages.
     """
+    from telethon import TelegramClient
+
     channel_link = normalize_tme_link(channel_link)
 
-    client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
+    client = TelegramClient(registry.string_session(session_string), API_ID, API_HASH)
     await client.connect()
 
-    found = set()
+    limit = EXTRACT_MESSAGES_LIMIT if EXTRACT_MESSAGES_LIMIT > 0 else 0
+    scan = _Scan(min_id if not limit else 0, on_batch)
 
     try:
         entity = await client.get_entity(channel_link)
 
-        # ---------------- Fast mode: last N messages ----------------
-        if EXTRACT_MESSAGES_LIMIT and EXTRACT_MESSAGES_LIMIT > 0:
-            logger.info(
-                f"[extractor] Extracting last {EXTRACT_MESSAGES_LIMIT} messages from {channel_link}"
-            )
-
-            async for msg in client.iter_messages(entity, limit=EXTRACT_MESSAGES_LIMIT):
-                if not msg:
-                    continue
-
-                text = msg.message or ""
-                if not text.strip():
-                    continue
-
-                for link in extract_telegram_links(text):
-                    n = normalize_tme_link(link)
-                    if n:
-                        found.add(n)
-
-        # ---------------- Full mode: all messages ----------------
+        if limit:
+            logger.info("[extractor] Extracting last %s messages from %s", limit, channel_link)
         else:
-            logger.info(f"[extractor] Extracting ALL messages from {channel_link}")
-
-            # reverse=True: from first message to last message
-            async for msg in client.iter_messages(entity, reverse=True):
-                if not msg:
-                    continue
+            logger.info("[extractor] Extracting ALL messages from %s (after id %s)", channel_link, scan.last_id)
 
-                text = msg.message or ""
-                if not text.strip():
-                    continue
+        done = False
+        if use_takeout:
+            done = await _scan_with_takeout(client, entity, scan, limit)
+        if not done:
+            await _scan_history(client, entity, scan, limit, wait_time=None)
 
-                for link in extract_telegram_links(text):
-                    n = normalize_tme_link(link)
-                    if n:
-                        found.add(n)
+        await scan.checkpoint(force=True)
 
-        result = sorted(found)
-        logger.info(f"[extractor] Done. Found {len(result)} unique links from {channel_link}")
+        result = sorted(scan.found)
+        logger.info(
+            "[extractor] Done. Scanned %s messages, found %s unique links from %s",
+            scan.scanned, len(result), channel_link,
+        )
         return result
 
     finally:
@@ -0,0 +1,1168 @@
+# bot/handlers.py
+import asyncio
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bot.config import OWNER_ID, PROGRESS_UPDATE_SECONDS, STOP_GRACE_SECONDS
+from bot import db, jobs, metrics, outbox, planner, profiling, rates, transfer
+from bot.distributor import distribute_links_to_sessions
+from bot.pipeline import Pipeline
+from bot.registry import registry
+from bot.scheduler import run_join_scheduler
+from bot.progress import JoinProgress, format_duration, run_progress_reporter
+from bot.session_check import check_sessions, sweep_sessions
+from bot.utils import normalize_tme_link
+
+logger = logging.getLogger("bot")
+
+# Owner-bot logic, independent of the MTProto library that runs the bot.
+# Backends (bot/control_pyrogram.py, bot/control_telethon.py) wrap their
+# native objects into adapters exposing:
+#
+#   message:  .user_id  .text  .document_name (None if no file)
+#             await reply_text(text, keyboard=None) -> message
+#             await edit_text(text, keyboard=None)
+#             await reply_document(fileobj, file_name, caption="")
+#             await download(path) -> path
+#   callback: .user_id  .data  .message
+#             await answer(text="", alert=False)
+#
+# Keyboards are plain rows of (button_text, callback_data).
+
+Keyboard = List[List[Tuple[str, str]]]
+
+# ---------------- In-memory user states ----------------
+USER_STATE: Dict[int, str] = {}
+STATE_WAIT_SESSION = "wait_session"
+STATE_WAIT_CHANNELS = "wait_channels"
+STATE_WAIT_LINKS_FILE = "wait_links_file"
+STATE_WAIT_SESSIONS_FILE = "wait_sessions_file"
+
+MIN_SESSION_STRING_LEN = 100
+
+# ---------------- Join control ----------------
+JOIN_RUNNING = False
+STOP_EVENT = asyncio.Event()
+JOIN_LOCK = asyncio.Lock()
+
+# Stop modes:
+# - "graceful": STOP_EVENT wakes every wait; in-flight joins finish, then
+#   tasks still running after STOP_GRACE_SECONDS are cancelled
+# - "immediate": join tasks are cancelled right away
+JOIN_TASKS: List[asyncio.Task] = []
+STOP_MODE: Optional[str] = None
+STOP_REQUESTED_AT: Optional[float] = None
+
+
+def request_stop(mode: str) -> None:
+    global STOP_MODE, STOP_REQUESTED_AT
+
+    if STOP_REQUESTED_AT is None:
+        STOP_REQUESTED_AT = time.monotonic()
+    STOP_MODE = mode
+    STOP_EVENT.set()
+
+    if mode == "immediate":
+        for t in JOIN_TASKS:
+            t.cancel()
+
+
+async def _enforce_stop_grace(tasks: List[asyncio.Task]) -> None:
+    await STOP_EVENT.wait()
+    _, still_running = await asyncio.wait(tasks, timeout=STOP_GRACE_SECONDS)
+    if still_running:
+        logger.warning("[join] %s task(s) still running after %ss grace; cancelling", len(still_running), STOP_GRACE_SECONDS)
+        for t in still_running:
+            t.cancel()
+
+
+def main_keyboard() -> Keyboard:
+    return [
+        [("➕ إضافة جلسة", "add_session"),
+         ("👁️ عرض الجلسات", "view_sessions")],
+        [("🗑️ حذف جلسة", "delete_session")],
+        [("📥 طلب قنوات الروابط", "request_channels"),
+         ("📋 مهام الاستخراج", "jobs")],
+        [("🚀 توزيع + انضمام", "start_join"),
+         ("♾️ تشغيل مستمر", "pipeline")],
+        [("🩺 فحص الجلسات", "health")],
+        [("📊 الإحصائيات", "stats")],
+        [("🛑 إيقاف الانضمام", "stop_join")]
+    ]
+
+
+# ---------------- keyset pagination ----------------
+SESSIONS_PAGE_SIZE = 20
+
+
+def _parse_page_data(data: str):
+    """
+    "<prefix>:<n|p>:<cursor>" -> ("next"|"prev", cursor)
+    """
+    _, d, cursor = data.split(":", 2)
+    return ("prev" if d == "p" else "next"), int(cursor)
+
+
+def _page_nav_row(prefix: str, page: dict):
+    rows = page["rows"]
+    nav = []
+    if rows and page["has_prev"]:
+        nav.append(("⬅️ السابق", f"{prefix}:p:{_row_id(rows[0])}"))
+    if rows and page["has_next"]:
+        nav.append(("التالي ➡️", f"{prefix}:n:{_row_id(rows[-1])}"))
+    return nav
+
+
+def _row_id(row) -> int:
+    return row["session_id"] if isinstance(row, dict) else row[0]
+
+
+def _page_keyboard(prefix: str, page: dict, extra_rows=None) -> Keyboard:
+    kb = list(extra_rows or [])
+    nav = _page_nav_row(prefix, page)
+    if nav:
+        kb.append(nav)
+    kb.append([("رجوع", "back")])
+    return kb
+
+
+def _fmt_stats_text(st: dict) -> str:
+    sessions = st.get("sessions", 0)
+
+    total_links = st.get("total_links", 0)
+    dead_links = st.get("dead_links", 0)
+
+    reserve_links = st.get("reserve_links", 0)
+    reserve_target = st.get("reserve_target", 0)
+
+    assigned = st.get("assigned", 0)
+    unassigned = st.get("unassigned", 0)
+
+    pending = st.get("pending", 0)
+    retry = st.get("retry", 0)
+    requested = st.get("requested", 0)
+    success = st.get("success", 0)
+    failed = st.get("failed", 0)
+
+    processed = success + failed
+    success_rate = (success / processed * 100.0) if processed else 0.0
+
+    txt = (
+        "📊 **الإحصائيات**\n\n"
+        f"👥 Sessions (Active): {sessions}\n\n"
+        f"🔗 Links Total: {total_links}\n"
+        f"☠️ Dead Links: {dead_links}\n\n"
+        f"📦 Reserve Pool (Active Unassigned): {reserve_links}\n"
+        f"🎯 Reserve Target: {reserve_target}\n\n"
+        f"📌 Assigned: {assigned}\n"
+        f"🆓 Unassigned (Any): {unassigned}\n\n"
+        f"⏳ Pending joins: {pending}\n"
+        f"🔁 Retry queue (transient errors): {retry}\n"
+        f"🕒 Requested (Waiting approval): {requested}\n"
+        f"✅ Success: {success}\n"
+        f"❌ Failed: {failed}\n"
+        f"📈 Success rate: {success_rate:.2f}%\n"
+    )
+
+    per_session = st.get("per_session", [])
+    if per_session:
+        txt += "\n👤 **Per Session:**\n"
+        for r in per_session:
+            txt += (
+                f"- Session {r['session_id']}: "
+                f"⏳ {r.get('pending', 0)} | "
+                f"🔁 {r.get('retry', 0)} | "
+                f"🕒 {r.get('requested', 0)} | "
+                f"✅ {r.get('success', 0)} | "
+                f"❌ {r.get('failed', 0)}\n"
+            )
+
+    return txt
+
+
+def _fmt_rates(s: dict) -> str:
+    trend = s.get("trend_pct")
+    if trend is None:
+        trend_txt = "?"
+    else:
+        trend_txt = f"{'📈' if trend >= 0 else '📉'} {trend:+.0f}% (آخر 15 دقيقة مقابل الـ15 قبلها)"
+
+    txt = (
+        "📈 **معدل الانضمام** (joins + requests + failures / min)\n\n"
+        f"- 5m: {s['rate_5m']:.2f} | 15m: {s['rate_15m']:.2f} | 60m: {s['rate_60m']:.2f}\n"
+        f"- Trend: {trend_txt}\n"
+        f"- FloodWait (60m): {format_duration(s['floodwait_60m'])}\n"
+        f"- Reserve: {s['reserve'] if s['reserve'] is not None else '?'}\n"
+        f"- Backlog (pending + retry): {s['backlog']}\n"
+        f"- ETA: {format_duration(s['eta_seconds'])}\n"
+    )
+    if s["sessions"]:
+        txt += "\n👤 **Top sessions (60m, /min):**\n"
+        for sid, rate in s["sessions"]:
+            txt += f"- S{sid}: {rate:.2f}\n"
+    return txt
+
+
+# days shown in the 📅 daily history view (raw join_log + rollups)
+HISTORY_DAYS = 14
+
+
+def _fmt_history(rows, days: int) -> str:
+    by_day: dict = {}
+    for r in rows:
+        by_day.setdefault(r["day"], {})[r["outcome"]] = r["n"]
+    if not by_day:
+        return f"📅 **آخر {days} يوم**\n\nلا يوجد سجل انضمام."
+
+    txt = f"📅 **آخر {days} يوم** (✅ joined | 🕒 requested | ❌ failed | 💀 dead | ⏳ FloodWait | 🔁 retry)\n\n"
+    for day, n in by_day.items():
+        txt += (
+            f"- {day}: ✅ {n.get('success', 0)} | 🕒 {n.get('requested', 0)} | "
+            f"❌ {n.get('failed', 0)} | 💀 {n.get('dead', 0)} | "
+            f"⏳ {n.get('floodwait', 0)} | 🔁 {n.get('retry', 0)}\n"
+        )
+    return txt
+
+
+def _fmt_eta(hours) -> str:
+    return "∞ (Quota لا تكفي)" if hours is None else format_duration(hours * 3600)
+
+
+def _fmt_plan(p: dict, brief: bool = False) -> str:
+    obs, est = p["observed"], p["estimate"]
+    txt = (
+        f"🧮 **تخطيط السعة** (هدف: {p['hours']:g} ساعة)\n"
+        f"- Backlog: {obs['backlog']} (pending {obs['pending']} + retry {obs['retry']}"
+        f" + distributable {obs['distributable']})\n"
+        f"- Sessions: {est['fleet']} | ~{est['per_session_per_hour']:.1f} links/h per session\n"
+        f"- ETA (current sessions): {_fmt_eta(est['eta_hours'])}\n"
+        f"- Sessions needed for {p['hours']:g}h: {est['needed_for_target']}"
+        f"{' (limited by quota)' if est['quota_limited'] else ''}\n"
+    )
+    if brief:
+        return txt + "المزيد: /plan <ساعات> و /whatif\n"
+
+    mix = obs["mix"]
+    handled = mix["success"] + mix["requested"] + mix["failed"] + mix["dead"]
+    pct = (lambda n: f"{n / handled * 100:.1f}%") if handled else (lambda n: "?")
+    txt += (
+        f"\n📊 **History** (last {mix['rows']} join_log rows)\n"
+        f"- success {pct(mix['success'])} | requested {pct(mix['requested'])} | "
+        f"failed {pct(mix['failed'])} | dead {pct(mix['dead'])}\n"
+        f"- retries: {mix['retried']} | FloodWaits: {mix['floodwaits']} "
+        f"({format_duration(mix['floodwait_seconds'])})\n"
+        f"- join delay {est['delay']}s | quota {est['quota']} | RPC "
+        f"{obs['rpc_seconds']:.2f}s{'' if obs['rpc_observed'] else ' (default)'}\n"
+    )
+    return txt
+
+
+def _fmt_whatif(w: dict) -> str:
+    obs = w["observed"]
+    txt = (
+        f"🔮 **What-if** (backlog {obs['backlog']}, هدف {w['hours']:g}h)\n"
+        "delay | quota | sessions | links/h/session | ETA | needed\n"
+    )
+    for r in w["rows"]:
+        txt += (
+            f"{r['delay']:g}s | {r['quota']} | {r['fleet']} | {r['per_session_per_hour']:.1f} | "
+            f"{_fmt_eta(r['eta_hours'])} | {r['needed_for_target']}\n"
+        )
+    return txt
+
+
+async def start_handler(message):
+    await message.reply_text(
+        "مرحباً بك.\n\n"
+        "هذا بوت إدارة جلسات Telethon لاستخراج روابط القنوات وتوزيعها (1000 لكل حساب) ثم الانضمام لها.\n\n"
+        "✅ يدعم:\n"
+        "- Reserve روابط للاستبدال الفوري\n"
+        "- وسم الروابط الميتة Dead وعدم تكرارها\n"
+        "- FloodWait Sleep وإكمال تلقائي\n"
+        "- Join Request حالة requested بدل فشل\n",
+        keyboard=main_keyboard()
+    )
+
+
+async def handle_callback(cq) -> None:
+    global JOIN_RUNNING, STOP_MODE, STOP_REQUESTED_AT
+
+    if cq.user_id != OWNER_ID:
+        await cq.answer("Not allowed", alert=True)
+        return
+
+    data = cq.data
+
+    # ---------------- add_session ----------------
+    if data == "add_session":
+        USER_STATE[cq.user_id] = STATE_WAIT_SESSION
+        await cq.message.edit_text(
+            "➕ **إضافة جلسة Telethon**\n\n"
+            "أرسل الآن StringSession (نص طويل)\n"
+            "ملاحظة: سيتم قبول الرسالة إذا طولها أكبر من 100 حرف.",
+            keyboard=main_keyboard()
+        )
+        await cq.answer()
+        return
+
+    # ---------------- view_sessions (paginated) ----------------
+    if data == "view_sessions" or data.startswith("vs:"):
+        direction, cursor = _parse_page_data(data) if data.startswith("vs:") else ("next", 0)
+        page = db.list_sessions_page(cursor, direction, SESSIONS_PAGE_SIZE)
+        if not page["rows"]:
+            await cq.message.edit_text("لا توجد جلسات.", keyboard=main_keyboard())
+        else:
+            txt = "👥 **الجلسات:**\n\n"
+            for sid, phone, created in page["rows"]:
+                txt += f"- ID: `{sid}` | 📱 {phone or '-'} | 📅 {created}\n"
+            await cq.message.edit_text(txt, keyboard=_page_keyboard("vs", page))
+        await cq.answer()
+        return
+
+    # ---------------- delete_session (paginated) ----------------
+    if data == "delete_session" or data.startswith("ds:"):
+        direction, cursor = _parse_page_data(data) if data.startswith("ds:") else ("next", 0)
+        page = db.list_sessions_page(cursor, direction, SESSIONS_PAGE_SIZE)
+        if not page["rows"]:
+            await cq.message.edit_text("لا توجد جلسات لحذفها.", keyboard=main_keyboard())
+        else:
+            buttons = [(f"حذف الجلسة {sid}", f"del_{sid}") for sid, _, _ in page["rows"]]
+            rows = [buttons[i:i + 2] for i in range(0, len(buttons), 2)]
+            await cq.message.edit_text(
+                "اختر الجلسة المراد حذفها:",
+                keyboard=_page_keyboard("ds", page, rows),
+            )
+        await cq.answer()
+        return
+
+    if data.startswith("del_"):
+        sid = int(data.split("_")[-1])
+        db.delete_session(sid)  # soft delete
+        await cq.message.edit_text(
+            f"✅ تم حذف الجلسة {sid} (Soft Delete)\n"
+            "📌 الروابط المعلقة تم إرجاعها إلى Unassigned تلقائياً.",
+            keyboard=main_keyboard()
+        )
+        await cq.answer()
+        return
+
+    # ---------------- request_channels ----------------
+    if data == "request_channels":
+        USER_STATE[cq.user_id] = STATE_WAIT_CHANNELS
+        await cq.message.edit_text(
+            "📥 **إرسال قنوات الروابط**\n\n"
+            "أرسل الآن روابط قنواتك الخاصة (يمكن أكثر من رابط برسالة واحدة).\n"
+            "البوت سيقوم باستخراج روابط تيليجرام من الرسائل.\n\n"
+            "مثال:\n"
+            "https://t.me/channel1\n"
+            "https://t.me/channel2",
+            keyboard=main_keyboard()
+        )
+        await cq.answer()
+        return
+
+    # ---------------- start_join ----------------
+    if data == "start_join":
+        if JOIN_RUNNING:
+            await cq.answer("عملية الانضمام تعمل بالفعل!", alert=True)
+            return
+
+        async with JOIN_LOCK:
+            if JOIN_RUNNING:
+                await cq.answer("عملية الانضمام تعمل بالفعل!", alert=True)
+                return
+
+            JOIN_RUNNING = True
+            STOP_EVENT.clear()
+            STOP_MODE = None
+            STOP_REQUESTED_AT = None
+
+            await cq.message.edit_text(
+                "🚀 بدء العملية:\n"
+                "1) توزيع الروابط 1000 لكل Session (مع الحفاظ على Reserve)\n"
+                "2) تشغيل الانضمام لكل الحسابات بالتوازي\n\n"
+                "سيتم إرسال تقارير هنا.",
+                keyboard=main_keyboard()
+            )
+            await cq.answer()
+
+            asyncio.create_task(orchestrate_join(cq.message))
+        return
+
+    # ---------------- pipeline (continuous) ----------------
+    if data == "pipeline":
+        if JOIN_RUNNING:
+            await cq.answer("عملية الانضمام تعمل بالفعل!", alert=True)
+            return
+
+        async with JOIN_LOCK:
+            if JOIN_RUNNING:
+                await cq.answer("عملية الانضمام تعمل بالفعل!", alert=True)
+                return
+
+            JOIN_RUNNING = True
+            STOP_EVENT.clear()
+            STOP_MODE = None
+            STOP_REQUESTED_AT = None
+
+            await cq.message.edit_text(
+                "♾️ تشغيل مستمر:\n"
+                "- الروابط المستخرجة تُخزن وتُوزع على الجلسات فور وصولها\n"
+                "- كل Session تأخذ دفعة جديدة عند انتهاء روابطها (مع الحفاظ على Reserve)\n"
+                "- يستمر حتى الضغط على 🛑 إيقاف الانضمام",
+                keyboard=main_keyboard()
+            )
+            await cq.answer()
+
+            asyncio.create_task(orchestrate_join(cq.message, continuous=True))
+        return
+
+    # ---------------- stats ----------------
+    if data == "stats":
+        st = await asyncio.to_thread(db.get_stats, include_per_session=False)
+        plan = await asyncio.to_thread(planner.plan, 24.0)
+        txt = _fmt_stats_text(st) + "\n\n" + _fmt_plan(plan, brief=True)
+
+        kb = [
+            [("👤 إحصائيات الجلسات", "st:n:0"),
+             ("📈 معدل الانضمام", "rates")],
+            [("📅 السجل اليومي", "history")],
+            [("رجوع", "back")],
+        ]
+        await cq.message.edit_text(txt, keyboard=kb)
+        await cq.answer()
+        return
+
+    if data == "rates":
+        summary = await asyncio.to_thread(rates.summary)
+        await cq.message.edit_text(
+            _fmt_rates(summary),
+            keyboard=[[("🔄 تحديث", "rates")], [("رجوع", "stats")]],
+        )
+        await cq.answer()
+        return
+
+    if data == "history":
+        rows = await asyncio.to_thread(db.get_join_history, HISTORY_DAYS)
+        await cq.message.edit_text(
+            _fmt_history(rows, HISTORY_DAYS),
+            keyboard=[[("🔄 تحديث", "history")], [("رجوع", "stats")]],
+        )
+        await cq.answer()
+        return
+
+    if data.startswith("st:"):
+        direction, cursor = _parse_page_data(data)
+        page = db.get_session_stats_page(cursor, direction, SESSIONS_PAGE_SIZE)
+        if not page["rows"]:
+            await cq.message.edit_text("لا توجد جلسات.", keyboard=main_keyboard())
+        else:
+            txt = "👤 **Per Session:**\n"
+            for r in page["rows"]:
+                txt += (
+                    f"- Session {r['session_id']}: "
+                    f"⏳ {r['pending']} | "
+                    f"🔁 {r['retry']} | "
+                    f"🕒 {r['requested']} | "
+                    f"✅ {r['success']} | "
+                    f"❌ {r['failed']}\n"
+                )
+            await cq.message.edit_text(txt, keyboard=_page_keyboard("st", page))
+        await cq.answer()
+        return
+
+    # ---------------- stop_join ----------------
+    if data == "stop_join":
+        if not JOIN_RUNNING:
+            await cq.answer("لا توجد عملية انضمام شغالة.", alert=True)
+            return
+        await cq.message.edit_text(
+            "🛑 **إيقاف الانضمام**\n\n"
+            f"- هادئ: إنهاء الانضمام الجاري ثم التوقف (بحد أقصى {STOP_GRACE_SECONDS}s)\n"
+            "- فوري: إلغاء كل المهام الآن (الرابط الجاري يبقى معلقاً)",
+            keyboard=[
+                [("🛑 إيقاف هادئ", "stop_graceful"), ("⛔ إيقاف فوري", "stop_now")],
+                [("رجوع", "back")],
+            ],
+        )
+        await cq.answer()
+        return
+
+    if data in ("stop_graceful", "stop_now"):
+        if not JOIN_RUNNING:
+            await cq.answer("لا توجد عملية انضمام شغالة.", alert=True)
+            return
+        request_stop("immediate" if data == "stop_now" else "graceful")
+        await cq.message.edit_text("🛑 تم طلب الإيقاف... سيتم إرسال زمن الإيقاف عند الانتهاء.", keyboard=main_keyboard())
+        await cq.answer()
+        return
+
+    # ---------------- extraction jobs ----------------
+    if data == "jobs":
+        await cq.message.edit_text(_fmt_jobs(), keyboard=[[("🔄 تحديث", "jobs")], [("رجوع", "back")]])
+        await cq.answer()
+        return
+
+    # ---------------- health sweep ----------------
+    if data == "health":
+        await cq.answer()
+        await health_handler(cq.message)
+        return
+
+    # ---------------- back ----------------
+    if data == "back":
+        await cq.message.edit_text("اختر:", keyboard=main_keyboard())
+        await cq.answer()
+        return
+
+
+# ---------------- profiling commands ----------------
+async def _send_text_file(message, text: str, file_name: str, caption: str = ""):
+    buf = io.BytesIO(text.encode("utf-8"))
+    buf.name = file_name
+    await message.reply_document(buf, file_name, caption)
+
+
+def _int_arg(message, index: int, default: int) -> int:
+    parts = (message.text or "").split()
+    for p in parts[1:]:
+        if p.isdigit():
+            index -= 1
+            if index < 0:
+                return int(p)
+    return default
+
+
+async def _profile_and_report(message, kind: str, seconds: int):
+    try:
+        report = await profiling.run_cpu_profile(kind, seconds)
+        await _send_text_file(message, report, f"profile_{kind}.txt", f"📄 Profile ({kind})")
+    except Exception as e:
+        await message.reply_text(f"❌ فشل التحليل: {e}")
+
+
+async def _memsnap_and_report(message, seconds: int):
+    try:
+        report = await profiling.run_memory_snapshot(seconds)
+        await _send_text_file(message, report, "tracemalloc.txt", "📄 Memory snapshot")
+    except Exception as e:
+        await message.reply_text(f"❌ فشل لقطة الذاكرة: {e}")
+
+
+async def profile_handler(message):
+    """
+    /profile [cpu|sample] [seconds]
+    """
+    parts = (message.text or "").split()
+    kind = "sample" if "sample" in parts[1:] else "cpu"
+    seconds = _int_arg(message, 0, 60)
+
+    if profiling.is_profiling():
+        await message.reply_text("⚠️ يوجد تحليل يعمل بالفعل. استخدم /profile_stop")
+        return
+
+    await message.reply_text(f"⏱️ بدء التحليل ({kind}) لمدة {seconds} ثانية...")
+    asyncio.create_task(_profile_and_report(message, kind, seconds))
+
+
+async def profile_stop_handler(message):
+    if not profiling.request_stop():
+        await message.reply_text("لا يوجد تحليل يعمل.")
+        return
+    await message.reply_text("🛑 تم إيقاف التحليل، سيتم إرسال التقرير.")
+
+
+async def memsnap_handler(message):
+    """
+    /memsnap [seconds]
+    """
+    seconds = _int_arg(message, 0, 30)
+    await message.reply_text(f"🧠 لقطة ذاكرة tracemalloc خلال {seconds} ثانية...")
+    asyncio.create_task(_memsnap_and_report(message, seconds))
+
+
+# ---------------- bulk import / export ----------------
+async def import_links_handler(message):
+    """
+    /import_links -> then upload a TXT / CSV / NDJSON file
+    """
+    USER_STATE[message.user_id] = STATE_WAIT_LINKS_FILE
+    await message.reply_text(
+        "📤 أرسل الآن ملف الروابط (TXT / CSV / NDJSON).\n"
+        "- TXT: أي نص يحتوي روابط\n"
+        "- CSV: عمود source_channel اختياري\n"
+        "- NDJSON: {\"link\": ..., \"source_channel\": ...}"
+    )
+
+
+async def _import_links_from_upload(message):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, os.path.basename(message.document_name))
+        await message.download(path)
+        res = await asyncio.to_thread(
+            transfer.import_links_file, path, f"file:{message.document_name}"
+        )
+
+    await message.reply_text(
+        f"✅ تم استيراد الملف.\n"
+        f"- روابط مقروءة: {res['seen']}\n"
+        f"- روابط جديدة: {res['added']}",
+        keyboard=main_keyboard()
+    )
+
+
+async def _export_and_send(message, kind: str, since=None, until=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        file_name = f"{kind}.csv"
+        path = os.path.join(tmp, file_name)
+        rows = await asyncio.to_thread(transfer.export_csv, kind, path, since, until)
+        with open(path, "rb") as f:
+            await message.reply_document(f, file_name, f"📄 {kind}: {rows} rows")
+
+
+async def export_dead_handler(message):
+    await _export_and_send(message, "dead")
+
+
+async def export_failed_handler(message):
+    await _export_and_send(message, "failed")
+
+
+async def export_log_handler(message):
+    """
+    /export_log [since YYYY-MM-DD] [until YYYY-MM-DD]
+    """
+    args = (message.text or "").split()[1:]
+    for a in args:
+        if not re.fullmatch(r"\d{4}-\d{2}-\d{2}", a):
+            await message.reply_text("❌ الصيغة: /export_log [YYYY-MM-DD] [YYYY-MM-DD]")
+            return
+    since = args[0] if len(args) > 0 else None
+    until = args[1] if len(args) > 1 else None
+    await _export_and_send(message, "join_log", since, until)
+
+
+# ---------------- session health sweep ----------------
+def _fmt_health_report(rep: dict) -> str:
+    txt = (
+        "🩺 **فحص الجلسات**\n"
+        f"- Checked: {rep['checked']}\n"
+        f"- ✅ Healthy: {rep['healthy']}\n"
+        f"- 🚫 Quarantined: {len(rep['quarantined'])}\n"
+        f"- 📡 Unreachable (kept): {len(rep['unreachable'])}\n"
+        f"- ♻️ Requeued links: {rep['requeued']}\n"
+    )
+    for sid, reason in rep["quarantined"][:20]:
+        txt += f"  • S{sid}: {reason[:80]}\n"
+    return txt
+
+
+async def health_handler(message):
+    """
+    /health: check every active session now, quarantine broken ones.
+    """
+    if JOIN_RUNNING:
+        await message.reply_text("⚠️ عملية الانضمام تعمل (تم فحص الجلسات عند بدايتها).")
+        return
+
+    sessions = registry.sessions()
+    if not sessions:
+        await message.reply_text("لا توجد جلسات.")
+        return
+
+    await message.reply_text(f"🩺 فحص {len(sessions)} جلسة...")
+    rep = await sweep_sessions(sessions)
+    await message.reply_text(_fmt_health_report(rep), keyboard=main_keyboard())
+
+
+# ---------------- bulk session import ----------------
+async def _import_sessions(session_strings: List[str]) -> dict:
+    """
+    Validate sessions concurrently (connect + get_me) and store the good ones
+    with phone + user_id. Rejects duplicates (same string or same account)
+    and unauthorized / broken sessions.
+    """
+    report = {"added": 0, "duplicate": 0, "rejected": []}
+
+    unique = []
+    seen = set()
+    for s in session_strings:
+        s = s.strip()
+        if not s or s in seen:
+            continue
+        seen.add(s)
+        if len(s) < MIN_SESSION_STRING_LEN:
+            report["rejected"].append((s, "too_short"))
+            continue
+        unique.append(s)
+
+    existing = db.existing_session_strings(unique)
+    report["duplicate"] += len(existing)
+    to_check = [s for s in unique if s not in existing]
+
+    results = await check_sessions(to_check)
+
+    known_users = db.active_session_user_ids()
+    for s, r in zip(to_check, results):
+        if not r["ok"]:
+            report["rejected"].append((s, r["error"]))
+            continue
+        if r["user_id"] in known_users:
+            report["duplicate"] += 1
+            continue
+        if db.add_session(s, r["phone"], r["user_id"]):
+            report["added"] += 1
+            known_users.add(r["user_id"])
+        else:
+            report["duplicate"] += 1
+
+    return report
+
+
+async def import_sessions_handler(message):
+    """
+    /import_sessions -> then upload a text file, one StringSession per line
+    """
+    USER_STATE[message.user_id] = STATE_WAIT_SESSIONS_FILE
+    await message.reply_text("📤 أرسل الآن ملف الجلسات (TXT): StringSession واحدة في كل سطر.")
+
+
+async def _import_sessions_from_upload(message):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "sessions.txt")
+        await message.download(path)
+        with open(path, "r", encoding="utf-8", errors="replace") as f:
+            strings = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+    await message.reply_text(f"⏳ التحقق من {len(strings)} جلسة بالتوازي...")
+    started = time.perf_counter()
+    report = await _import_sessions(strings)
+    elapsed = time.perf_counter() - started
+
+    await message.reply_text(
+        "🏁 **استيراد الجلسات**\n"
+        f"- ✅ أضيفت: {report['added']}\n"
+        f"- ♻️ مكررة: {report['duplicate']}\n"
+        f"- ❌ مرفوضة: {len(report['rejected'])}\n"
+        f"- ⏱️ {elapsed:.1f}s",
+        keyboard=main_keyboard()
+    )
+
+    if report["rejected"]:
+        lines = [f"{s[:12]}...\t{reason}" for s, reason in report["rejected"]]
+        await _send_text_file(message, "\n".join(lines) + "\n", "rejected_sessions.txt", "❌ الجلسات المرفوضة")
+
+
+async def private_text_handler(message):
+    state = USER_STATE.get(message.user_id)
+
+    # ---------------- links file import flow ----------------
+    if state == STATE_WAIT_LINKS_FILE:
+        if not message.document_name:
+            await message.reply_text("❌ أرسل الروابط كملف (Document).")
+            return
+
+        USER_STATE.pop(message.user_id, None)
+        try:
+            await _import_links_from_upload(message)
+        except Exception as e:
+            await message.reply_text(f"❌ فشل الاستيراد: {e}", keyboard=main_keyboard())
+        return
+
+    # ---------------- add session flow ----------------
+    if state == STATE_WAIT_SESSION:
+        text = (message.text or "").strip()
+        if len(text) < MIN_SESSION_STRING_LEN:
+            await message.reply_text("❌ هذه ليست StringSession صحيحة (قصيرة جداً).")
+            return
+
+        await message.reply_text("⏳ جاري التحقق من الجلسة...")
+        report = await _import_sessions([text])
+        if report["added"]:
+            await message.reply_text("✅ تمت إضافة الجلسة بنجاح.", keyboard=main_keyboard())
+        elif report["duplicate"]:
+            await message.reply_text("⚠️ هذه الجلسة موجودة مسبقاً.", keyboard=main_keyboard())
+        else:
+            reason = report["rejected"][0][1] if report["rejected"] else "unknown"
+            await message.reply_text(f"❌ تم رفض الجلسة: {reason}", keyboard=main_keyboard())
+
+        USER_STATE.pop(message.user_id, None)
+        return
+
+    # ---------------- sessions file import flow ----------------
+    if state == STATE_WAIT_SESSIONS_FILE:
+        if not message.document_name:
+            await message.reply_text("❌ أرسل الجلسات كملف (Document).")
+            return
+
+        USER_STATE.pop(message.user_id, None)
+        try:
+            await _import_sessions_from_upload(message)
+        except Exception as e:
+            await message.reply_text(f"❌ فشل الاستيراد: {e}", keyboard=main_keyboard())
+        return
+
+    # ---------------- channels extraction flow ----------------
+    if state == STATE_WAIT_CHANNELS:
+        text = message.text or ""
+        channel_links = re.findall(r"(https?://t\.me/\S+)", text)
+        channel_links = [normalize_tme_link(x) for x in channel_links]
+
+        if not channel_links:
+            await message.reply_text("❌ لم أجد روابط قنوات تيليجرام في رسالتك.")
+            return
+
+        if not registry.count():
+            await message.reply_text("❌ لازم تضيف Session واحدة على الأقل لاستخراج الروابط.")
+            return
+
+        # background jobs: the handler returns right away
+        job_ids = jobs.enqueue(channel_links, notify=message.reply_text)
+        USER_STATE.pop(message.user_id, None)
+        await message.reply_text(
+            f"📥 تمت إضافة {len(job_ids)} مهمة استخراج إلى الطابور: "
+            + ", ".join(f"#{j}" for j in job_ids)
+            + "\nتابع التقدم عبر /jobs أو ألغِ مهمة عبر /cancel_job <id>",
+            keyboard=main_keyboard()
+        )
+        return
+
+
+async def orchestrate_join(message, continuous: bool = False):
+    """
+    1) distribute (respect reserve)
+    2) join concurrently for all active sessions
+
+    continuous=True (pipeline mode): no distribution phase; sessions are
+    topped up while extraction jobs keep adding links, until stopped.
+    """
+    global JOIN_RUNNING
+
+    stages = profiling.StageTimer()
+    pipeline = None
+    try:
+        sessions = registry.sessions()
+        if not sessions:
+            await message.reply_text("❌ لا توجد Sessions.")
+            return
+
+        # 0) health sweep: quarantine dead accounts before they get links
+        with stages.stage("health_sweep"):
+            health = await sweep_sessions(sessions)
+        await message.reply_text(_fmt_health_report(health))
+
+        if health["quarantined"]:
+            sessions = registry.sessions()
+            if not sessions:
+                await message.reply_text("❌ لا توجد Sessions صالحة.")
+                return
+
+        # 1) distribute (pipeline mode tops sessions up as it goes)
+        if not continuous:
+            with stages.stage("distribution"):
+                report = distribute_links_to_sessions()
+            if not report.get("ok"):
+                await message.reply_text(f"❌ فشل التوزيع: {report.get('error')}")
+                return
+
+            txt = (
+                "📌 **تقرير التوزيع**\n"
+                f"- Sessions: {report['sessions']}\n"
+                f"- Unassigned Active Before: {report.get('unassigned_active_before')}\n"
+                f"- Reserve Target: {report.get('reserve_target')}\n"
+                f"- Distributable Before: {report.get('distributable_before')}\n"
+                f"- Assigned Total: {report['assigned_total']}\n"
+                f"- Unassigned Active After: {report.get('unassigned_active_after')}\n"
+                f"- Reserve After: {report.get('reserve_after')}\n\n"
+            )
+            for row in report["per_session"]:
+                txt += f"Session {row['session_id']}: assigned {row['assigned']}\n"
+
+            await message.reply_text(txt)
+
+        if STOP_EVENT.is_set():
+            await message.reply_text("🛑 تم الإيقاف قبل بدء الانضمام.")
+            return
+
+        # 2) join concurrently (one live progress message, edited in place)
+        progress_msg = await message.reply_text("🚀 بدء الانضمام بالتوازي لكل الجلسات...")
+        join_progress = JoinProgress()
+        progress_done = asyncio.Event()
+        reporter = asyncio.create_task(run_progress_reporter(
+            join_progress,
+            progress_msg.edit_text,
+            PROGRESS_UPDATE_SECONDS,
+            progress_done,
+        ))
+
+        # one scheduler task drives every session (bounded connections)
+        pairs = registry.pairs()
+        if continuous:
+            pipeline = Pipeline()
+            join_coro = pipeline.run(pairs, stop_flag=STOP_EVENT, progress=join_progress)
+        else:
+            join_coro = run_join_scheduler(pairs, limit=1000, stop_flag=STOP_EVENT, progress=join_progress)
+        tasks = [asyncio.create_task(join_coro)]
+        JOIN_TASKS[:] = tasks
+        grace = asyncio.create_task(_enforce_stop_grace(tasks))
+
+        join_started = time.perf_counter()
+        try:
+            outcome = (await asyncio.gather(*tasks, return_exceptions=True))[0]
+        finally:
+            JOIN_TASKS.clear()
+            grace.cancel()
+            progress_done.set()
+            await reporter
+        join_wall = time.perf_counter() - join_started
+
+        # the scheduler returns partial results when cancelled; an exception
+        # here means it failed (or was cancelled before it started)
+        results = outcome if isinstance(outcome, list) else []
+        if not isinstance(outcome, list):
+            logger.error("[join] Scheduler ended without results: %r", outcome)
+
+        stop_latency = None
+        if STOP_REQUESTED_AT is not None:
+            stop_latency = time.monotonic() - STOP_REQUESTED_AT
+            metrics.STOP_LATENCY.observe(stop_latency, mode=STOP_MODE or "graceful")
+
+        # per-session stage totals (summed over sessions)
+        session_stages = profiling.StageTimer()
+        for res in results:
+            session_stages.merge(res.get("timings"))
+
+        # per-session counters are in the (final) progress message
+        final_txt = "🏁 **نتيجة الانضمام**\n"
+        if not isinstance(outcome, list):
+            final_txt += f"❌ خطأ: {outcome!r}\n"
+        cancelled = 0
+        for res in results:
+            if res.get("error"):
+                final_txt += f"❌ Session {res['session_id']}: {res['error']}\n"
+            if res.get("cancelled"):
+                cancelled += 1
+        if stop_latency is not None:
+            final_txt += (
+                f"🛑 Stop ({STOP_MODE}): all tasks exited {stop_latency:.1f}s after the request"
+                f" ({cancelled} cancelled)\n"
+            )
+
+        if pipeline is not None:
+            ps = pipeline.stats
+            final_txt += (
+                f"♾️ Pipeline: {ps['batches']} batches stored, {ps['links']} links "
+                f"({ps['added']} new), {ps['refills']} session refills\n"
+            )
+
+        final_txt += (
+            "\n⏱️ **Timing**\n"
+            f"- health sweep: {stages.totals.get('health_sweep', 0.0):.1f}s\n"
+            f"- distribution: {stages.totals.get('distribution', 0.0):.2f}s\n"
+            f"- join loop (wall): {join_wall:.1f}s\n"
+            "Per-session totals (summed):\n"
+            f"{profiling.format_stage_timings(session_stages.as_dict())}\n"
+        )
+
+        # may exceed one message; the outbox splits it
+        outbox.post(message.reply_text, final_txt)
+
+    finally:
+        JOIN_RUNNING = False
+
+
+# ---------------- extraction jobs ----------------
+JOB_STATUS_ICONS = {
+    "queued": "🕒",
+    "running": "⏳",
+    "done": "✅",
+    "failed": "❌",
+    "cancelled": "🛑",
+}
+
+
+def _fmt_jobs(limit: int = 20) -> str:
+    rows = db.list_extraction_jobs(limit)
+    if not rows:
+        return "📋 لا توجد مهام استخراج."
+
+    txt = "📋 **مهام الاستخراج:**\n\n"
+    for r in rows:
+        txt += (
+            f"{JOB_STATUS_ICONS.get(r['status'], '•')} #{r['id']} {r['channel_link']}\n"
+            f"   📨 {r['scanned']} | 🔗 {r['found']} | ➕ {r['added']} | آخر ID: {r['last_msg_id']}\n"
+        )
+        if r["error"]:
+            txt += f"   ⚠️ {r['error'][:200]}\n"
+    return txt
+
+
+def _kv_args(message) -> Dict[str, List[float]]:
+    """
+    key=value[,value...] arguments: "/whatif delay=60,90 quota=500" -> {"delay": [60, 90], "quota": [500]}
+    """
+    out: Dict[str, List[float]] = {}
+    for part in (message.text or "").split()[1:]:
+        key, sep, val = part.partition("=")
+        if not sep:
+            continue
+        try:
+            out[key.lower()] = [float(v) for v in val.split(",") if v]
+        except ValueError:
+            continue
+    return out
+
+
+PLAN_USAGE = "الاستخدام: /plan [hours]  (عدد ساعات موجب، الافتراضي 24)"
+WHATIF_USAGE = (
+    "الاستخدام: /whatif [delay=30,60,..] [quota=500,1000] [sessions=N] [hours=H]\n"
+    "delay و hours أكبر من 0، quota عدد صحيح ≥ 1، sessions عدد صحيح ≥ 0"
+)
+
+
+async def plan_handler(message):
+    """
+    /plan [hours]: sessions needed to clear the backlog in <hours> (default 24).
+    """
+    parts = (message.text or "").split()[1:]
+    try:
+        hours = float(parts[0]) if parts else 24.0
+    except ValueError:
+        hours = 0.0
+    if not 0 < hours < float("inf"):
+        await message.reply_text(PLAN_USAGE)
+        return
+
+    p = await asyncio.to_thread(planner.plan, hours)
+    await message.reply_text(_fmt_plan(p))
+
+
+def _whatif_args(message) -> Optional[Tuple[float, Optional[List[float]], Optional[List[int]], Optional[int]]]:
+    """
+    (hours, delays, quotas, fleet) from /whatif arguments, None if any is invalid.
+    """
+    def _valid(vals: List[float], low: float, integer: bool = False) -> bool:
+        return bool(vals) and all(
+            low <= v < float("inf") and (not integer or v.is_integer()) for v in vals
+        )
+
+    known = {"hours", "delay", "quota", "sessions"}
+    parts = (message.text or "").split()[1:]
+    args = _kv_args(message)
+    if len(args) != len(parts) or not set(args) <= known:
+        return None  # unparsable value, bare word or unknown key
+
+    hours = args.get("hours", [24.0])
+    if len(hours) != 1 or not _valid(hours, 0.0) or hours[0] == 0:
+        return None
+    delays = args.get("delay")
+    if delays is not None and (not _valid(delays, 0.0) or 0 in delays):
+        return None
+    quotas = args.get("quota")
+    if quotas is not None and not _valid(quotas, 1, integer=True):
+        return None
+    sessions = args.get("sessions")
+    if sessions is not None and (len(sessions) != 1 or not _valid(sessions, 0, integer=True)):
+        return None
+
+    return (
+        hours[0],
+        delays,
+        [int(q) for q in quotas] if quotas else None,
+        int(sessions[0]) if sessions else None,
+    )
+
+
+async def whatif_handler(message):
+    """
+    /whatif [delay=30,60,..] [quota=500,1000] [sessions=N] [hours=H]
+    """
+    args = _whatif_args(message)
+    if args is None:
+        await message.reply_text(WHATIF_USAGE)
+        return
+
+    w = await asyncio.to_thread(planner.whatif, *args)
+    await message.reply_text(_fmt_whatif(w))
+
+
+async def jobs_handler(message):
+    await message.reply_text(_fmt_jobs())
+
+
+async def cancel_job_handler(message):
+    job_id = _int_arg(message, 0, 0)
+    if job_id <= 0:
+        await message.reply_text("الاستخدام: /cancel_job <id>")
+        return
+
+    result = jobs.cancel(job_id)
+    await message.reply_text({
+        "cancelled": f"🛑 تم إلغاء المهمة #{job_id}.",
+        "cancelling": f"🛑 جاري إيقاف المهمة #{job_id}... (الروابط المستخرجة حتى الآن محفوظة)",
+        "finished": f"المهمة #{job_id} منتهية بالفعل.",
+        "not_found": f"❌ لا توجد مهمة #{job_id}.",
+    }[result])
+
+
+async def vacuum_handler(message):
+    """
+    /vacuum: rewrite the DB file to give free space back (idle only).
+    """
+    if JOIN_RUNNING or jobs.running_count():
+        await message.reply_text("⚠️ أوقف الانضمام وانتظر انتهاء مهام الاستخراج أولاً (VACUUM يقفل قاعدة البيانات).")
+        return
+
+    await message.reply_text("🧹 جاري ضغط قاعدة البيانات...")
+    before, after = await asyncio.to_thread(db.vacuum_full)
+    await message.reply_text(f"✅ تم: {before / 2**20:.1f} MiB -> {after / 2**20:.1f} MiB")
+
+
+# ---------------- message routing ----------------
+COMMAND_HANDLERS = {
+    "start": start_handler,
+    "profile": profile_handler,
+    "profile_stop": profile_stop_handler,
+    "memsnap": memsnap_handler,
+    "import_links": import_links_handler,
+    "import_sessions": import_sessions_handler,
+    "health": health_handler,
+    "jobs": jobs_handler,
+    "plan": plan_handler,
+    "whatif": whatif_handler,
+    "cancel_job": cancel_job_handler,
+    "vacuum": vacuum_handler,
+    "export_dead": export_dead_handler,
+    "export_failed": export_failed_handler,
+    "export_log": export_log_handler,
+}
+
+
+def _command_name(text: str) -> Optional[str]:
+    if not text.startswith("/"):
+        return None
+    return text.split()[0][1:].split("@", 1)[0].lower()
+
+
+async def handle_message(message) -> None:
+    """
+    Entry point for every private message (commands + state flows).
+    """
+    cmd = _command_name(message.text or "")
+
+    if message.user_id != OWNER_ID:
+        if cmd == "start":
+            await message.reply_text("❌ هذا البوت خاص.")
+        return
+
+    handler = COMMAND_HANDLERS.get(cmd) if cmd else None
+    if handler:
+        await handler(message)
+        return
+
+    await private_text_handler(message)
@@ -0,0 +1,193 @@
+# bot/jobs.py
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from bot import db, outbox
+from bot.config import EXTRACT_WORKERS
+from bot.extractor import extract_links_from_channel
+from bot.registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Background extraction job queue.
+# - jobs live in the extraction_jobs table, so they survive restarts
+#   (jobs left 'running' are requeued and resume from last_msg_id)
+# - EXTRACT_WORKERS worker tasks claim queued jobs one at a time
+# - progress is checkpointed through the extractor's on_batch callback
+# - cancel: a queued job is cancelled in the DB, a running one by
+#   cancelling its task (links found so far stay stored)
+# - pipeline mode: with an ingest sink set, checkpoints are handed to the
+#   sink (bot.pipeline) instead of being written inline
+
+Notify = Callable[[str], Awaitable[None]]
+
+_WORKERS: List[asyncio.Task] = []
+_RUNNING: Dict[int, asyncio.Task] = {}
+_CANCEL_REQUESTED: Set[int] = set()
+_NOTIFY: Dict[int, Notify] = {}
+_WAKEUP = asyncio.Event()
+_INGEST_SINK = None
+
+
+# ---------------- public API ----------------
+def enqueue(channel_links: List[str], notify: Optional[Notify] = None) -> List[int]:
+    """
+    Store one job per channel and wake the workers.
+    `notify` (in-memory only) receives a message when each job ends,
+    through the outbox (job results finishing together share a message).
+    """
+    ids = db.create_extraction_jobs(channel_links)
+    if notify is not None:
+        for job_id in ids:
+            _NOTIFY[job_id] = notify
+    _WAKEUP.set()
+    return ids
+
+
+def cancel(job_id: int) -> str:
+    """
+    Returns "cancelled" | "cancelling" | "not_found" | "finished".
+    """
+    if db.cancel_queued_extraction_job(job_id):
+        _NOTIFY.pop(job_id, None)
+        return "cancelled"
+
+    task = _RUNNING.get(job_id)
+    if task is not None and not task.done():
+        _CANCEL_REQUESTED.add(job_id)
+        task.cancel()
+        return "cancelling"
+
+    return "finished" if db.get_extraction_job(job_id) else "not_found"
+
+
+def is_running(job_id: int) -> bool:
+    return job_id in _RUNNING
+
+
+def running_count() -> int:
+    return len(_RUNNING)
+
+
+def set_ingest_sink(sink) -> None:
+    """
+    sink.put(job_id, source, links, last_msg_id, scanned_delta) stores a
+    checkpoint (and its links); sink.drain() waits for all of them.
+    None restores inline writes.
+    """
+    global _INGEST_SINK
+    _INGEST_SINK = sink
+
+
+def start_workers(count: int = EXTRACT_WORKERS) -> int:
+    """
+    Requeue jobs interrupted by a restart and start the worker tasks.
+    Returns the number of requeued jobs.
+    """
+    requeued = db.requeue_running_extraction_jobs()
+    if requeued:
+        logger.info("[jobs] Requeued %s interrupted extraction job(s)", requeued)
+
+    for n in range(count):
+        _WORKERS.append(asyncio.create_task(_worker(n)))
+    _WAKEUP.set()
+    return requeued
+
+
+async def stop_workers() -> None:
+    """
+    Shutdown: running jobs stay 'running' in the DB and resume next start.
+    """
+    for t in _WORKERS:
+        t.cancel()
+    await asyncio.gather(*_WORKERS, return_exceptions=True)
+    _WORKERS.clear()
+
+
+# ---------------- worker ----------------
+async def _run_job(job, session_string: str) -> Dict[str, int]:
+    """
+    Returns this run's totals as stored in the job row (scanned/found/added).
+    """
+    job_id = job["id"]
+    ch = job["channel_link"]
+    prev_scanned = 0
+
+    async def on_batch(links: List[str], last_msg_id: int, scanned: int) -> None:
+        nonlocal prev_scanned
+        delta, prev_scanned = scanned - prev_scanned, scanned
+        sink = _INGEST_SINK
+        if sink is not None:
+            await sink.put(job_id, ch, links, last_msg_id, delta)
+            return
+        added = await asyncio.to_thread(db.add_links, links, ch)
+        db.update_extraction_job_progress(job_id, last_msg_id, delta, len(links), added)
+
+    await extract_links_from_channel(session_string, ch, min_id=job["last_msg_id"] or 0, on_batch=on_batch)
+
+    sink = _INGEST_SINK
+    if sink is not None:
+        await sink.drain()
+
+    row = db.get_extraction_job(job_id)
+    return {k: row[k] - job[k] for k in ("scanned", "found", "added")}
+
+
+def _notify(job_id: int, text: str) -> None:
+    notify = _NOTIFY.pop(job_id, None)
+    if notify is not None:
+        outbox.post(notify, text)
+
+
+async def _next_job():
+    while True:
+        job = db.claim_next_extraction_job()
+        if job is not None:
+            return job
+        _WAKEUP.clear()
+        # re-check: a job may have been enqueued before clear()
+        job = db.claim_next_extraction_job()
+        if job is not None:
+            return job
+        await _WAKEUP.wait()
+
+
+async def _worker(n: int) -> None:
+    while True:
+        job = await _next_job()
+        job_id = job["id"]
+        ch = job["channel_link"]
+
+        sessions = registry.pairs()
+        if not sessions:
+            db.finish_extraction_job(job_id, "failed", "no active sessions")
+            _notify(job_id, f"❌ مهمة #{job_id} فشلت: لا توجد Sessions ({ch})")
+            continue
+
+        # spread workers over sessions: one extraction per account at a time
+        session_string = sessions[n % len(sessions)][1]
+
+        logger.info("[jobs] Worker %s running job %s: %s", n, job_id, ch)
+        task = asyncio.create_task(_run_job(job, session_string))
+        _RUNNING[job_id] = task
+        try:
+            totals = await task
+            db.finish_extraction_job(job_id, "done")
+            _notify(
+                job_id,
+                f"✅ مهمة #{job_id} انتهت: {ch}\n"
+                f"📨 رسائل: {totals['scanned']} | 🔗 روابط: {totals['found']} | ➕ جديد: {totals['added']}",
+            )
+        except asyncio.CancelledError:
+            if job_id not in _CANCEL_REQUESTED:
+                raise  # shutdown: job stays 'running' and is requeued at startup
+            db.finish_extraction_job(job_id, "cancelled")
+            _notify(job_id, f"🛑 مهمة #{job_id} أُلغيت: {ch}")
+        except Exception as e:
+            logger.exception("[jobs] Job %s failed", job_id)
+            db.finish_extraction_job(job_id, "failed", f"{type(e).__name__}: {e}")
+            _notify(job_id, f"❌ مهمة #{job_id} فشلت: {ch}\nالسبب: {e}")
+        finally:
+            _RUNNING.pop(job_id, None)
+            _CANCEL_REQUESTED.discard(job_id)
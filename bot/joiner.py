@@ -1,67 +1,116 @@
 # bot/joiner.py
 import asyncio
 import logging
-from typing import Optional, Tuple
+import time
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Optional, Tuple
 
-from telethon import TelegramClient, errors
-from telethon.sessions import StringSession
-from telethon.tl.functions.channels import JoinChannelRequest
-from telethon.tl.functions.messages import ImportChatInviteRequest
+from bot.config import JOIN_MAX_ATTEMPTS, JOIN_RETRY_BASE_SECONDS, JOIN_RETRY_MAX_SECONDS
+from bot.utils import LINK_KIND_FOLDER, LINK_KIND_INVITE, LINK_KIND_NAMES, LINK_KIND_USERNAME, link_url
+from bot import db, metrics, rates
+from bot.profiling import StageTimer
 
-# دعم روابط المجلدات addlist
-from telethon.tl.functions.chatlists import (
-    CheckChatlistInviteRequest,
-    JoinChatlistInviteRequest,
-)
-
-from bot.config import API_ID, API_HASH, JOIN_DELAY_SECONDS
-from bot.utils import parse_link_type
-from bot import db
+if TYPE_CHECKING:
+    from telethon import TelegramClient
 
 logger = logging.getLogger(__name__)
 
+# Telethon (and its TL request modules) are imported lazily inside the
+# functions below, so importing bot.joiner stays cheap at startup.
+
+
+def _log_fields(session_id: int, link_id: int, kind: str, outcome: str, rpc_seconds: float) -> dict:
+    # structured fields for bot.logs (JSON output, success sampling)
+    return {
+        "session_id": session_id,
+        "link_id": link_id,
+        "kind": kind,
+        "outcome": outcome,
+        "latency_ms": round(rpc_seconds * 1000.0, 1),
+    }
+
 
 # ---------------- Dead link errors classification ----------------
-DEAD_LINK_EXCEPTIONS = (
-    # invite issues
-    errors.InviteHashExpiredError,
-    errors.InviteHashInvalidError,
+@lru_cache(maxsize=1)
+def _dead_link_exceptions() -> tuple:
+    from telethon import errors
 
-    # username/channel issues
-    errors.UsernameInvalidError,
-    errors.UsernameNotOccupiedError,
+    return (
+        # invite issues
+        errors.InviteHashExpiredError,
+        errors.InviteHashInvalidError,
 
-    # privacy / permission issues
-    errors.ChannelPrivateError,
-    errors.ChatAdminRequiredError,
+        # username/channel issues
+        errors.UsernameInvalidError,
+        errors.UsernameNotOccupiedError,
 
-    # invalid peer/entity
-    errors.PeerIdInvalidError,
-)
+        # privacy / permission issues
+        errors.ChannelPrivateError,
+        errors.ChatAdminRequiredError,
+
+        # invalid peer/entity
+        errors.PeerIdInvalidError,
+    )
 
 
 def _is_dead_link_error(e: Exception) -> bool:
-    return isinstance(e, DEAD_LINK_EXCEPTIONS)
+    return isinstance(e, _dead_link_exceptions())
+
+
+# ---------------- Transient errors classification ----------------
+# Failures that say nothing about the link itself: retried later with
+# backoff (see db.schedule_join_retry). Anything else is permanent.
+@lru_cache(maxsize=1)
+def _transient_exceptions() -> tuple:
+    from telethon import errors
+
+    return (
+        # Telegram-side 500s / internal timeouts
+        errors.ServerError,
+        errors.TimedOutError,
+        errors.RpcCallFailError,
+        errors.RpcMcgetFailError,
+        errors.InterdcCallErrorError,
+        errors.InterdcCallRichErrorError,
+        errors.WorkerBusyTooLongRetryError,
+        errors.MsgWaitFailedError,
+
+        # network: timeouts, resets, dropped connections
+        asyncio.TimeoutError,
+        ConnectionError,
+        OSError,
+    )
 
 
-async def join_one_link(client: TelegramClient, link: str) -> None:
+def _is_transient_error(e: Exception) -> bool:
+    return isinstance(e, _transient_exceptions())
+
+
+async def join_one_link(client: "TelegramClient", kind: int, value: str) -> None:
     """
-    Join:
+    Join a stored (kind, value) link (see bot.utils.link_key):
     - username links (public)
     - invite links (+hash / joinchat/hash)
     - chat folder links (addlist/slug)
     """
-    kind, value = parse_link_type(link)
+    from telethon.tl.functions.channels import JoinChannelRequest
+    from telethon.tl.functions.messages import ImportChatInviteRequest
+
+    # دعم روابط المجلدات addlist
+    from telethon.tl.functions.chatlists import (
+        CheckChatlistInviteRequest,
+        JoinChatlistInviteRequest,
+    )
 
-    if kind == "invite":
+    if kind == LINK_KIND_INVITE:
         await client(ImportChatInviteRequest(value))
         return
 
-    if kind == "username":
+    if kind == LINK_KIND_USERNAME:
         await client(JoinChannelRequest(value))
         return
 
-    if kind == "folder":
+    if kind == LINK_KIND_FOLDER:
         invite = await client(CheckChatlistInviteRequest(value))
 
         peers = []
@@ -74,7 +123,7 @@ async def join_one_link(client: TelegramClient, link: str) -> None:
         await client(JoinChatlistInviteRequest(slug=value, peers=peers))
         return
 
-    raise Exception(f"Unsupported link kind: {kind}")
+    raise Exception(f"Unsupported link kind: {LINK_KIND_NAMES.get(kind, kind)}")
 
 
 async def _replace_dead_link_immediately(
@@ -82,12 +131,12 @@ async def _replace_dead_link_immediately(
     dead_link_id: int,
     dead_link: str,
     reason: str,
-) -> Optional[Tuple[int, str]]:
+) -> Optional[Tuple[int, int, str]]:
     """
     Marks link as dead + replaces it with a new link from reserve, assigned to same session.
-    Returns (new_link_id, new_link) or None if reserve empty.
+    Returns (new_link_id, kind, value) or None if reserve empty.
     """
-    db.log_join(session_id, dead_link, "failed", f"dead_link: {reason}")
+    db.log_join(session_id, dead_link_id, "failed", f"dead_link: {reason}")
 
     replacement = db.replace_dead_assignment(
         session_id=session_id,
@@ -97,137 +146,195 @@ async def _replace_dead_link_immediately(
 
     if not replacement:
         logger.warning(
-            f"[Session {session_id}] Dead link detected but reserve empty. dead_link={dead_link}"
+            "[Session %s] Dead link detected but reserve empty. dead_link=%s", session_id, dead_link,
+            extra={"session_id": session_id, "link_id": dead_link_id, "outcome": "dead"},
         )
         return None
 
-    new_link_id, new_link = replacement
     logger.info(
-        f"[Session {session_id}] Dead link replaced immediately. old={dead_link} -> new={new_link}"
+        "[Session %s] Dead link replaced immediately. old=%s -> new=%s",
+        session_id, dead_link, link_url(replacement[1], replacement[2]),
+        extra={"session_id": session_id, "link_id": dead_link_id, "outcome": "dead"},
     )
-    return (new_link_id, new_link)
+    return replacement
 
 
-async def run_session_joiner(
-    session_id: int,
-    session_string: str,
-    limit: int = 1000,
-    stop_flag=None,
-):
-    """
-    - pending ACTIVE links only
-    - join sequentially
-
-    Rules:
-    - success/already participant => mark success + sleep JOIN_DELAY_SECONDS
-    - dead => replace immediately, no sleep
-    - floodwait => sleep only that account, retry same link
-    - join request required => mark requested (NOT failed, NOT dead), no sleep
-    """
-    client = TelegramClient(StringSession(session_string), API_ID, API_HASH)
-    await client.connect()
+# ---------------- one join attempt ----------------
+# Outcomes returned by attempt_link():
+#   ("success", None)          joined / already participant -> wait JOIN_DELAY_SECONDS
+#   ("requested", None)        join request sent             -> no wait
+#   ("failed", None)           failed / dead with empty reserve / out of retries
+#   ("retry", seconds)         transient error, link requeued after backoff -> no wait
+#   ("floodwait", seconds)     retry the same link after `seconds`
+#   ("replaced", (id, kind, value))  dead link replaced from reserve -> try it next, no wait
 
-    try:
-        pending = db.get_pending_links_for_session(session_id, limit=limit)
 
-        success = 0
-        failed = 0
-        requested = 0
+async def attempt_link(
+    client: "TelegramClient",
+    session_id: int,
+    link_id: int,
+    link_kind: int,
+    value: str,
+    timer: StageTimer,
+    progress=None,
+) -> Tuple[str, Any]:
+    """
+    Try to join one link and record the outcome (DB, join_log, metrics,
+    progress). Scheduling (delays, retries) is up to the caller.
 
-        i = 0
-        while i < len(pending):
-            link_id, link = pending[i]
+    If cancelled mid-RPC the outcome is unknown: the link is logged as
+    "cancelled", its attempt is bumped and it stays pending.
+    """
+    from telethon import errors
 
-            if stop_flag and stop_flag.is_set():
-                logger.info(f"[Session {session_id}] Stop flag set. Exiting.")
-                break
+    kind = LINK_KIND_NAMES.get(link_kind, "unknown")
+    link = link_url(link_kind, value)  # for log lines only
+    t0 = time.perf_counter()
 
+    try:
+        with timer.stage("rpc"), metrics.RPC_LATENCY.time(kind=kind):
             try:
-                await join_one_link(client, link)
-
-                db.mark_join_success(session_id, link_id)
-                db.log_join(session_id, link, "success", "")
-                success += 1
-
-                logger.info(f"[Session {session_id}] Joined OK: {link}")
-                await asyncio.sleep(JOIN_DELAY_SECONDS)
-
-                i += 1
-                continue
-
-            except errors.UserAlreadyParticipantError:
-                db.mark_join_success(session_id, link_id)
-                db.log_join(session_id, link, "success", "already_participant")
-                success += 1
-
-                logger.info(f"[Session {session_id}] Already participant: {link}")
-                await asyncio.sleep(JOIN_DELAY_SECONDS)
-
-                i += 1
-                continue
-
-            except errors.InviteRequestSentError as e:
-                # ✅ Join request sent successfully, waiting for approval
-                note = str(e) or "invite_request_sent"
-                db.mark_join_requested(session_id, link_id, note=note)
-                db.log_join(session_id, link, "requested", note)
-                requested += 1
-
-                logger.info(f"[Session {session_id}] Join request sent: {link}")
-
-                # no sleep
-                i += 1
-                continue
-
-            except errors.FloodWaitError as e:
-                wait_s = int(e.seconds) + 5
-
-                db.bump_attempt(session_id, link_id, f"FloodWaitError: {e.seconds}s")
-                db.log_join(session_id, link, "failed", f"FloodWaitError wait {wait_s}s")
+                await join_one_link(client, link_kind, value)
+            except asyncio.CancelledError:
+                db.bump_attempt(session_id, link_id, "cancelled_in_flight")
+                db.log_join(session_id, link_id, "cancelled", "stopped during join RPC (outcome unknown)")
+                raise
+        fields = _log_fields(session_id, link_id, kind, "success", time.perf_counter() - t0)
+
+        with timer.stage("db"):
+            db.mark_join_success(session_id, link_id)
+            db.log_join(session_id, link_id, "success", "")
+        metrics.JOIN_OUTCOMES.inc(kind=kind, status="success")
+        rates.record(session_id, "success")
+        if progress:
+            progress.record(session_id, "success")
+
+        logger.info("[Session %s] Joined OK: %s", session_id, link, extra=fields)
+        return "success", None
+
+    except errors.UserAlreadyParticipantError:
+        fields = _log_fields(session_id, link_id, kind, "success", time.perf_counter() - t0)
+        with timer.stage("db"):
+            db.mark_join_success(session_id, link_id)
+            db.log_join(session_id, link_id, "success", "already_participant")
+        metrics.JOIN_OUTCOMES.inc(kind=kind, status="already_participant")
+        rates.record(session_id, "success")
+        if progress:
+            progress.record(session_id, "success")
+
+        logger.info("[Session %s] Already participant: %s", session_id, link, extra=fields)
+        return "success", None
+
+    except errors.InviteRequestSentError as e:
+        # ✅ Join request sent successfully, waiting for approval
+        fields = _log_fields(session_id, link_id, kind, "requested", time.perf_counter() - t0)
+        note = str(e) or "invite_request_sent"
+        with timer.stage("db"):
+            db.mark_join_requested(session_id, link_id, note=note)
+            db.log_join(session_id, link_id, "requested", note)
+        metrics.JOIN_OUTCOMES.inc(kind=kind, status="requested")
+        rates.record(session_id, "requested")
+        if progress:
+            progress.record(session_id, "requested")
+
+        logger.info("[Session %s] Join request sent: %s", session_id, link, extra=fields)
+        return "requested", None
+
+    except errors.FloodWaitError as e:
+        fields = _log_fields(session_id, link_id, kind, "floodwait", time.perf_counter() - t0)
+        wait_s = int(e.seconds) + 5
+
+        with timer.stage("db"):
+            db.bump_attempt(session_id, link_id, f"FloodWaitError: {e.seconds}s")
+            db.log_join(session_id, link_id, "failed", f"FloodWaitError wait {wait_s}s")
+        metrics.JOIN_OUTCOMES.inc(kind=kind, status="floodwait")
+        metrics.FLOODWAIT_SECONDS.inc(e.seconds, session_id=session_id)
+        rates.record_floodwait(session_id, e.seconds)
+
+        logger.warning("[Session %s] FloodWait %ss -> retry in %ss", session_id, e.seconds, wait_s, extra=fields)
+        return "floodwait", wait_s
+
+    except Exception as e:
+        rpc_s = time.perf_counter() - t0
+        err = str(e)
+
+        if _is_dead_link_error(e):
+            metrics.JOIN_OUTCOMES.inc(kind=kind, status="dead")
+            rates.record(session_id, "dead")
+            if progress:
+                progress.record(session_id, "dead")
+            with timer.stage("db"):
+                replacement = await _replace_dead_link_immediately(
+                    session_id=session_id,
+                    dead_link_id=link_id,
+                    dead_link=link,
+                    reason=err,
+                )
 
+            if replacement:
+                return "replaced", replacement
+
+            with timer.stage("db"):
+                db.mark_join_failed(session_id, link_id, f"dead_no_reserve: {err}")
+            if progress:
+                progress.record(session_id, "failed")
+            return "failed", None
+
+        if _is_transient_error(e):
+            err = err or type(e).__name__
+            with timer.stage("db"):
+                delay = db.schedule_join_retry(
+                    session_id, link_id, err,
+                    JOIN_MAX_ATTEMPTS, JOIN_RETRY_BASE_SECONDS, JOIN_RETRY_MAX_SECONDS,
+                )
+                if delay is not None:
+                    db.log_join(session_id, link_id, "retry", f"{err} (retry in {delay}s)")
+            if delay is not None:
+                metrics.JOIN_OUTCOMES.inc(kind=kind, status="retry")
+                rates.record(session_id, "retry")
+                if progress:
+                    progress.record(session_id, "retry")
                 logger.warning(
-                    f"[Session {session_id}] FloodWait {e.seconds}s -> sleeping {wait_s}s then retry"
+                    "[Session %s] Transient error on %s: %s -> retry in %ss", session_id, link, err, delay,
+                    extra=_log_fields(session_id, link_id, kind, "retry", rpc_s),
                 )
-                await asyncio.sleep(wait_s)
+                return "retry", delay
+            err = f"retries_exhausted: {err}"
+        else:
+            with timer.stage("db"):
+                db.mark_join_failed(session_id, link_id, err)
 
-                # retry same link
-                continue
+        with timer.stage("db"):
+            db.log_join(session_id, link_id, "failed", err)
+        metrics.JOIN_OUTCOMES.inc(kind=kind, status="failed")
+        rates.record(session_id, "failed")
+        if progress:
+            progress.record(session_id, "failed")
 
-            except Exception as e:
-                err = str(e)
+        logger.error(
+            "[Session %s] Failed join: %s | Error: %s", session_id, link, err,
+            extra=_log_fields(session_id, link_id, kind, "failed", rpc_s),
+        )
+        return "failed", None
 
-                if _is_dead_link_error(e):
-                    replacement = await _replace_dead_link_immediately(
-                        session_id=session_id,
-                        dead_link_id=link_id,
-                        dead_link=link,
-                        reason=err,
-                    )
 
-                    if not replacement:
-                        db.mark_join_failed(session_id, link_id, f"dead_no_reserve: {err}")
-                        failed += 1
-                        i += 1
-                        continue
+async def run_session_joiner(
+    session_id: int,
+    session_string: str,
+    limit: int = 1000,
+    stop_flag=None,
+    progress=None,
+):
+    """
+    Join the pending links of ONE session (see bot.scheduler for the rules).
+    Thin wrapper over the central scheduler, kept for single-session use.
 
-                    new_link_id, new_link = replacement
-                    pending[i] = (new_link_id, new_link)
-                    continue
+    Returns {"session_id", "success", "failed", "requested", "timings"}
+    (+ "cancelled" if stopped immediately).
+    """
+    from bot.scheduler import run_join_scheduler
 
-                db.mark_join_failed(session_id, link_id, err)
-                db.log_join(session_id, link, "failed", err)
-                failed += 1
-
-                logger.error(f"[Session {session_id}] Failed join: {link} | Error: {err}")
-                i += 1
-                continue
-
-        return {
-            "session_id": session_id,
-            "success": success,
-            "failed": failed,
-            "requested": requested,
-        }
-
-    finally:
-        await client.disconnect()
+    results = await run_join_scheduler(
+        [(session_id, session_string)], limit=limit, stop_flag=stop_flag, progress=progress,
+    )
+    return results[0]
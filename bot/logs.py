@@ -0,0 +1,136 @@
+# bot/logs.py
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import Optional
+
+from bot import metrics
+from bot.config import LOG_FORMAT, LOG_LEVEL, LOG_QUEUE_SIZE, LOG_SUCCESS_SAMPLE
+
+# Logging off the event loop thread.
+#
+#   logger.info(...) --> sampling filter --> bounded queue --> listener thread --> stderr
+#
+# - the calling thread only builds the LogRecord and enqueues it; message
+#   %-formatting, tracebacks, JSON encoding and the write happen on the
+#   listener thread (log with "msg %s", arg, not f-strings, to keep it lazy)
+# - a full queue drops the record (counted in log_records_dropped_total)
+#   instead of blocking the loop
+# - routine success lines (extra={"outcome": "success"}, INFO) are kept
+#   1 in LOG_SUCCESS_SAMPLE; warnings and errors are never sampled
+# - LOG_FORMAT=json writes one object per line with the structured fields
+#   below when the call passed them via `extra`
+
+FIELDS = ("session_id", "link_id", "kind", "outcome", "latency_ms")
+
+_listener: Optional["_Listener"] = None
+
+
+class _SuccessSampler(logging.Filter):
+    def __init__(self, keep_every: int):
+        super().__init__()
+        self.keep_every = max(int(keep_every), 1)
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.keep_every == 1 or record.levelno > logging.INFO:
+            return True
+        if getattr(record, "outcome", None) != "success":
+            return True
+        self._seen += 1
+        if self._seen % self.keep_every == 1:
+            return True
+        metrics.LOG_RECORDS_DROPPED.inc(reason="sampled")
+        return False
+
+
+class _AsyncQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # no formatting here: the listener's handler formats the record
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.LOG_RECORDS_DROPPED.inc(reason="queue_full")
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self) -> None:
+        # wait for room: put_nowait would fail on a full queue at shutdown
+        self.queue.put(self._sentinel, timeout=5)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in FIELDS:
+            val = getattr(record, key, None)
+            if val is not None:
+                out[key] = val
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, ensure_ascii=False, default=str)
+
+
+def _formatter() -> logging.Formatter:
+    if LOG_FORMAT == "json":
+        return JsonFormatter()
+    return logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+
+def setup_logging() -> None:
+    """
+    Route all logging through the background listener (idempotent).
+    Call shutdown_logging() on exit to flush queued records.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    q: queue.Queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    sink = logging.StreamHandler(sys.stderr)
+    sink.setFormatter(_formatter())
+
+    handler = _AsyncQueueHandler(q)
+    handler.addFilter(_SuccessSampler(LOG_SUCCESS_SAMPLE))
+
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    _listener = _Listener(q, sink, respect_handler_level=True)
+    _listener.start()
+    # name the thread so it is recognisable in /profile samples
+    thread = getattr(_listener, "_thread", None)
+    if isinstance(thread, threading.Thread):
+        thread.name = "log-listener"
+
+
+def shutdown_logging() -> None:
+    """
+    Stop the listener after writing everything still queued.
+    """
+    global _listener
+    if _listener is None:
+        return
+    # detach first so late records are not queued behind the sentinel
+    for h in list(logging.getLogger().handlers):
+        if isinstance(h, _AsyncQueueHandler):
+            logging.getLogger().removeHandler(h)
+    try:
+        _listener.stop()
+    except queue.Full:
+        pass
+    _listener = None
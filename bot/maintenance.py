@@ -0,0 +1,85 @@
+# bot/maintenance.py
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict
+
+from bot import db, metrics, retention
+from bot.config import DB_MAINTENANCE_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Background SQLite maintenance.
+# Every run:
+# - join_log retention (bot/retention.py): old rows rolled up, archived and
+#   deleted in small batches
+# - PASSIVE checkpoint (copies WAL frames into the DB, never blocks writers)
+# Quiet runs only (no join run / extraction job active):
+# - TRUNCATE checkpoint: WAL file back to 0 bytes (waits for readers)
+# - PRAGMA optimize: refresh stale planner statistics
+# - incremental vacuum: return up to VACUUM_PAGES_PER_RUN free pages
+# Steps run in a thread so the event loop keeps serving the bot.
+
+VACUUM_PAGES_PER_RUN = 2000
+
+
+def run_once(full: bool) -> Dict[str, Any]:
+    """
+    One maintenance pass (blocking). Returns what was done, per step:
+    {"join_log_pruned": rows, "checkpoint": (busy, wal_frames, checkpointed), "optimize": True,
+     "vacuumed_pages": n, "wal_bytes", "freelist_pages", "timings": {step: s}}
+    """
+    out: Dict[str, Any] = {"timings": {}}
+
+    def step(name: str, fn: Callable[[], Any]) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            dt = time.perf_counter() - t0
+            out["timings"][name] = dt
+            metrics.DB_MAINTENANCE_SECONDS.observe(dt, step=name)
+
+    out["join_log_pruned"] = step("join_log_retention", retention.prune)["rows"]
+
+    if full:
+        out["checkpoint"] = step("checkpoint_truncate", lambda: db.wal_checkpoint("TRUNCATE"))
+        step("optimize", db.optimize)
+        out["optimize"] = True
+        out["vacuumed_pages"] = step("incremental_vacuum", lambda: db.incremental_vacuum(VACUUM_PAGES_PER_RUN))
+    else:
+        out["checkpoint"] = step("checkpoint_passive", lambda: db.wal_checkpoint("PASSIVE"))
+
+    info = db.storage_info()
+    out["wal_bytes"] = info["wal_bytes"]
+    out["freelist_pages"] = info["freelist_count"]
+    metrics.DB_WAL_BYTES.set(info["wal_bytes"])
+    metrics.DB_FREELIST_PAGES.set(info["freelist_count"])
+    return out
+
+
+async def run_maintenance_loop(
+    is_quiet: Callable[[], bool],
+    interval: float = DB_MAINTENANCE_INTERVAL_SECONDS,
+) -> None:
+    """
+    Run forever (cancel to stop). `is_quiet()` decides whether the heavy
+    steps may run now.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        full = is_quiet()
+        try:
+            res = await asyncio.to_thread(run_once, full)
+        except Exception:
+            logger.exception("[maintenance] DB maintenance failed")
+            continue
+
+        busy, frames, done = res["checkpoint"]
+        logger.info(
+            "[maintenance] %s run: checkpoint %s/%s frames%s, pruned %s join_log rows, "
+            "vacuumed %s pages, WAL %.1f MiB, %.2fs",
+            "full" if full else "passive", done, frames, " (busy)" if busy else "",
+            res["join_log_pruned"], res.get("vacuumed_pages", 0),
+            res["wal_bytes"] / 2**20, sum(res["timings"].values()),
+        )
@@ -0,0 +1,367 @@
+# bot/metrics.py
+import asyncio
+import bisect
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Minimal in-process metrics registry exported in Prometheus text format.
+#
+# Design notes:
+# - Updates come from the loop thread and from worker threads (@_timed DB
+#   calls under asyncio.to_thread, maintenance, the log listener), so every
+#   metric guards its values with its own lock; render() copies under it.
+# - Label values are stored as tuples -> one dict lookup per update.
+# - Rendering happens only when /metrics is scraped.
+
+LabelValues = Tuple[str, ...]
+
+_LE_INF = 'le="+Inf"'
+
+DEFAULT_LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    if not parts:
+        return ""
+    return "{" + ",".join(parts) + "}"
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    if float(v).is_integer():
+        return str(int(v))
+    return repr(float(v))
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple([str(labels.get(n, "")) for n in self.label_names])
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.label_names, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, doc, labels)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_fmt_labels(self.label_names, k)} {_fmt_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+    ):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+        # per label key: [bucket counts..., +Inf count], sum
+        self._counts: Dict[LabelValues, List[int]] = {}
+        self._sums: Dict[LabelValues, float] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = [0] * (len(self.buckets) + 1)
+                self._counts[key] = counts
+                self._sums[key] = 0.0
+            # non-cumulative storage; made cumulative at render time
+            counts[idx] += 1
+            self._sums[key] += value
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def timed(self, **labels) -> Callable:
+        """
+        Decorator version of time() for plain (sync) functions.
+        """
+        def deco(fn):
+            @wraps(fn)
+            def wrapper(*args, **kwargs):
+                t0 = time.perf_counter()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.observe(time.perf_counter() - t0, **labels)
+            return wrapper
+        return deco
+
+    def totals(self) -> Tuple[int, float]:
+        """
+        (observations, sum) over all label values.
+        """
+        with self._lock:
+            return sum(sum(c) for c in self._counts.values()), sum(self._sums.values())
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(counts), self._sums[key]) for key, counts in self._counts.items()]
+        out: List[str] = []
+        for key, counts, total in items:
+            acc = 0
+            for bound, c in zip(self.buckets, counts):
+                acc += c
+                le = f'le="{_fmt_value(bound)}"'
+                out.append(f"{self.name}_bucket{_fmt_labels(self.label_names, key, le)} {acc}")
+            acc += counts[-1]
+            out.append(f"{self.name}_bucket{_fmt_labels(self.label_names, key, _LE_INF)} {acc}")
+            out.append(f"{self.name}_sum{_fmt_labels(self.label_names, key)} {_fmt_value(total)}")
+            out.append(f"{self.name}_count{_fmt_labels(self.label_names, key)} {acc}")
+        return out
+
+
+# ---------------- registry ----------------
+_REGISTRY: List[_Metric] = []
+
+
+def _register(metric: _Metric) -> _Metric:
+    _REGISTRY.append(metric)
+    return metric
+
+
+def render() -> str:
+    # only in-memory values: DB-backed gauges are refreshed off the loop
+    # (rates snapshot flush), a scrape never queries the DB
+    lines: List[str] = []
+    for m in _REGISTRY:
+        lines.append(f"# HELP {m.name} {m.doc}")
+        lines.append(f"# TYPE {m.name} {m.kind}")
+        lines.extend(m.render())
+    return "\n".join(lines) + "\n"
+
+
+# ---------------- metric definitions ----------------
+JOIN_OUTCOMES = _register(Counter(
+    "joiner_join_outcomes_total",
+    "Join attempts by link kind and outcome status.",
+    ("kind", "status"),
+))
+
+RPC_LATENCY = _register(Histogram(
+    "joiner_rpc_latency_seconds",
+    "Latency of Telegram join RPC calls by link kind.",
+    ("kind",),
+))
+
+DB_QUERY_LATENCY = _register(Histogram(
+    "db_query_latency_seconds",
+    "Latency of bot.db operations (connection + query + commit).",
+    ("op",),
+))
+
+FLOODWAIT_SECONDS = _register(Gauge(
+    "joiner_floodwait_seconds_total",
+    "Total FloodWait seconds received per session.",
+    ("session_id",),
+))
+
+RESERVE_SIZE = _register(Gauge(
+    "links_reserve_size",
+    "Active unassigned links (reserve pool), as of the last rate snapshot.",
+))
+
+PENDING_DEPTH = _register(Gauge(
+    "assignments_pending_depth",
+    "Assignments waiting to be joined, as of the last rate snapshot.",
+))
+
+LINK_FILTER_CHECKS = _register(Counter(
+    "link_filter_checks_total",
+    "Known-link filter lookups in add_links (new | known).",
+    ("result",),
+))
+
+SCHEDULER_ACTIVE = _register(Gauge(
+    "scheduler_active_sessions",
+    "Sessions currently connected and joining (scheduler turns).",
+))
+
+SCHEDULER_IDLE_CONNECTED = _register(Gauge(
+    "scheduler_idle_connected_sessions",
+    "Sessions kept connected across a short wait (below IDLE_DISCONNECT_SECONDS).",
+))
+
+SESSION_CONNECTS = _register(Counter(
+    "session_connects_total",
+    "Session client connects made by the join scheduler.",
+))
+
+STOP_LATENCY = _register(Histogram(
+    "joiner_stop_latency_seconds",
+    "Time from a stop request until every join task has exited.",
+    ("mode",),
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120),
+))
+
+DB_MAINTENANCE_SECONDS = _register(Histogram(
+    "db_maintenance_step_seconds",
+    "Duration of background DB maintenance steps.",
+    ("step",),
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30, 120),
+))
+
+JOIN_LOG_PRUNED = _register(Counter(
+    "join_log_pruned_rows_total",
+    "join_log rows rolled up into join_log_daily and deleted.",
+))
+
+JOIN_LOG_ARCHIVE_BYTES = _register(Counter(
+    "join_log_archive_bytes_total",
+    "Compressed bytes written to join_log archive files.",
+))
+
+DB_WAL_BYTES = _register(Gauge(
+    "db_wal_bytes",
+    "Size of the SQLite WAL file after the last maintenance run.",
+))
+
+DB_FREELIST_PAGES = _register(Gauge(
+    "db_freelist_pages",
+    "Free (unused) pages in the SQLite file after the last maintenance run.",
+))
+
+PIPELINE_QUEUE_DEPTH = _register(Gauge(
+    "pipeline_ingest_queue_depth",
+    "Extracted batches waiting to be stored (pipeline mode).",
+))
+
+OUTBOX_POSTED = _register(Counter(
+    "outbox_posted_total",
+    "Notification texts queued for the owner bot.",
+))
+
+OUTBOX_MESSAGES = _register(Counter(
+    "outbox_messages_total",
+    "Owner-bot messages sent by the outbox (after merging), by result.",
+    ("result",),
+))
+
+OUTBOX_PENDING = _register(Gauge(
+    "outbox_pending",
+    "Notification texts waiting in the outbox.",
+))
+
+LOG_RECORDS_DROPPED = _register(Counter(
+    "log_records_dropped_total",
+    "Log records not written: sampled out or log queue full.",
+    ("reason",),
+))
+
+
+# ---------------- HTTP exporter ----------------
+async def _handle_http(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        # drain headers
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout=5)
+            if not line or line in (b"\r\n", b"\n"):
+                break
+
+        parts = request_line.decode("latin-1").split()
+        path = parts[1] if len(parts) > 1 else "/"
+
+        if path.split("?", 1)[0] == "/metrics":
+            body = render().encode("utf-8")
+            status = "200 OK"
+            ctype = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = b"not found\n"
+            status = "404 Not Found"
+            ctype = "text/plain; charset=utf-8"
+
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {ctype}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode("latin-1") + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug("[metrics] http handler error: %s", e)
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    """
+    Serve GET /metrics on host:port. port=0 disables the exporter.
+    """
+    if not port:
+        return None
+
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info("[metrics] Prometheus exporter listening on http://%s:%s/metrics", host, port)
+    return server
@@ -0,0 +1,175 @@
+# bot/outbox.py
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from bot import metrics
+from bot.config import OUTBOX_MIN_INTERVAL_SECONDS, OUTBOX_WINDOW_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Owner-bot notification outbox.
+# - post() only queues the text (no await, never blocks the caller)
+# - texts for the same destination (the `send` coroutine function, e.g. a
+#   message's reply_text) posted within OUTBOX_WINDOW_SECONDS of the first
+#   one are merged into digest messages of at most MAX_MESSAGE_CHARS
+# - one background task sends them, at most one message per
+#   OUTBOX_MIN_INTERVAL_SECONDS (Bot API: ~1 message/s per chat); a
+#   FloodWait from the backend (pyrogram `.value`, Telethon `.seconds`)
+#   pauses the sender and the message is retried
+# - on shutdown whatever is still queued is sent right away (best effort)
+
+Send = Callable[[str], Awaitable[Any]]
+
+MAX_MESSAGE_CHARS = 4096
+SEPARATOR = "\n\n"
+SHUTDOWN_FLUSH_SECONDS = 10
+
+# destination -> queued texts (dict order = posting order)
+_PENDING: Dict[Send, List[str]] = {}
+# destination -> monotonic time of its oldest queued text
+_FIRST: Dict[Send, float] = {}
+_WAKEUP = asyncio.Event()
+
+
+def post(send: Send, text: str) -> None:
+    """
+    Queue `text` for `send` (sent by run_outbox, possibly merged with others).
+    """
+    if send not in _PENDING:
+        _PENDING[send] = []
+        _FIRST[send] = time.monotonic()
+    _PENDING[send].append(text)
+    metrics.OUTBOX_POSTED.inc()
+    metrics.OUTBOX_PENDING.inc()
+    _WAKEUP.set()
+
+
+def pending_count() -> int:
+    return sum(len(v) for v in _PENDING.values())
+
+
+# ---------------- digests ----------------
+def _split(text: str, limit: int) -> List[str]:
+    # oversized text: cut at the last newline before the limit when possible
+    out = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        out.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        out.append(text)
+    return out
+
+
+def pack(texts: List[str], limit: int = MAX_MESSAGE_CHARS) -> List[str]:
+    """
+    Merge texts (in order) into as few messages of <= limit chars as possible.
+    """
+    out: List[str] = []
+    cur = ""
+    for text in texts:
+        for piece in _split(text, limit):
+            if cur and len(cur) + len(SEPARATOR) + len(piece) <= limit:
+                cur += SEPARATOR + piece
+            else:
+                if cur:
+                    out.append(cur)
+                cur = piece
+    if cur:
+        out.append(cur)
+    return out
+
+
+def _next_due(now: float, window: float) -> Optional[Send]:
+    for send, first in _FIRST.items():
+        if now - first >= window or sum(len(t) for t in _PENDING[send]) >= MAX_MESSAGE_CHARS:
+            return send
+    return None
+
+
+def _take(send: Send) -> List[str]:
+    _FIRST.pop(send, None)
+    texts = _PENDING.pop(send, [])
+    metrics.OUTBOX_PENDING.inc(-len(texts))
+    return texts
+
+
+# ---------------- sender ----------------
+def _flood_wait(e: Exception) -> Optional[float]:
+    wait_s = getattr(e, "value", None)
+    if not isinstance(wait_s, (int, float)):
+        wait_s = getattr(e, "seconds", None)
+    return wait_s if isinstance(wait_s, (int, float)) else None
+
+
+async def _deliver(send: Send, text: str) -> None:
+    while True:
+        try:
+            await send(text)
+            metrics.OUTBOX_MESSAGES.inc(result="sent")
+            return
+        except Exception as e:
+            wait_s = _flood_wait(e)
+            if wait_s is None:
+                metrics.OUTBOX_MESSAGES.inc(result="failed")
+                logger.warning("[outbox] Send failed: %s", e)
+                return
+            logger.warning("[outbox] FloodWait -> backing off %ss", wait_s)
+            await asyncio.sleep(wait_s)
+
+
+async def _flush_all(send: Optional[Send], unsent: List[str]) -> None:
+    for text in unsent:
+        await _deliver(send, text)
+    for dest in list(_PENDING):
+        for text in pack(_take(dest)):
+            await _deliver(dest, text)
+
+
+async def run_outbox(
+    window: float = OUTBOX_WINDOW_SECONDS,
+    min_interval: float = OUTBOX_MIN_INTERVAL_SECONDS,
+) -> None:
+    """
+    Send queued notifications forever (cancel to stop; the rest is flushed).
+    """
+    last_send = 0.0
+    send: Optional[Send] = None
+    unsent: List[str] = []  # digests taken from the queue, not sent yet
+    try:
+        while True:
+            if not _PENDING:
+                _WAKEUP.clear()
+                await _WAKEUP.wait()
+                continue
+
+            now = time.monotonic()
+            send = _next_due(now, window)
+            if send is None:
+                # sleep until the oldest window closes (or a post fills a digest)
+                _WAKEUP.clear()
+                timeout = max(min(_FIRST.values()) + window - now, 0.0)
+                try:
+                    await asyncio.wait_for(_WAKEUP.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            unsent = pack(_take(send))
+            while unsent:
+                gap = last_send + min_interval - time.monotonic()
+                if gap > 0:
+                    await asyncio.sleep(gap)
+                await _deliver(send, unsent[0])
+                unsent.pop(0)
+                last_send = time.monotonic()
+    finally:
+        if unsent or _PENDING:
+            try:
+                await asyncio.wait_for(_flush_all(send, unsent), timeout=SHUTDOWN_FLUSH_SECONDS)
+            except Exception:
+                logger.exception("[outbox] Final flush failed")
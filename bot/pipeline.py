@@ -0,0 +1,119 @@
+# bot/pipeline.py
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple
+
+from bot import db, jobs, metrics
+from bot.config import PIPELINE_QUEUE_BATCHES, PIPELINE_REFILL_LINKS
+from bot.distributor import top_up_session
+from bot.scheduler import run_join_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Continuous pipeline mode: extract -> ingest -> join, no batch phases.
+#
+#   extraction jobs --(bounded queue)--> ingest task --> links table
+#                                              |            |
+#                               links_available event    refill (above reserve)
+#                                              v            v
+#                                         join scheduler (continuous)
+#
+# - extraction checkpoints are queued instead of written inline; a full
+#   queue pauses extraction (backpressure). A job's checkpoint only moves
+#   once its links are stored, so a crash never skips unstored links.
+# - a session that runs out of links gets PIPELINE_REFILL_LINKS more from
+#   above the reserve; with none left it waits for the next ingest.
+# - runs until the stop flag is set (or the task is cancelled); queued
+#   batches are always stored before run() returns.
+
+
+class Pipeline:
+    def __init__(
+        self,
+        queue_batches: int = PIPELINE_QUEUE_BATCHES,
+        refill_links: int = PIPELINE_REFILL_LINKS,
+    ):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_batches)
+        self.links_available = asyncio.Event()
+        self.refill_links = refill_links
+        self.stats = {"batches": 0, "links": 0, "added": 0, "refills": 0}
+        self._putting = 0  # producers blocked on a full queue
+
+    # ---------------- ingest stage ----------------
+    async def put(self, job_id: int, source: str, links: List[str], last_msg_id: int, scanned: int) -> None:
+        """
+        Extraction checkpoint sink (see bot.jobs.set_ingest_sink).
+        Waits while the queue is full.
+        """
+        self._putting += 1
+        try:
+            await self.queue.put((job_id, source, links, last_msg_id, scanned))
+        finally:
+            self._putting -= 1
+        metrics.PIPELINE_QUEUE_DEPTH.set(self.queue.qsize())
+
+    async def drain(self) -> None:
+        """
+        Wait until every queued batch (including ones still being put) is stored.
+        """
+        while True:
+            await self.queue.join()
+            if not self._putting:
+                return
+            await asyncio.sleep(0.05)
+
+    async def _ingest_loop(self) -> None:
+        while True:
+            job_id, source, links, last_msg_id, scanned = await self.queue.get()
+            try:
+                added = await asyncio.to_thread(db.add_links, links, source)
+                db.update_extraction_job_progress(job_id, last_msg_id, scanned, len(links), added)
+                self.stats["batches"] += 1
+                self.stats["links"] += len(links)
+                self.stats["added"] += added
+                if added:
+                    self.links_available.set()
+            except Exception:
+                # checkpoint not advanced: a resumed job scans this batch again
+                logger.exception("[pipeline] Ingest failed for job %s (%s links)", job_id, len(links))
+            finally:
+                self.queue.task_done()
+                metrics.PIPELINE_QUEUE_DEPTH.set(self.queue.qsize())
+
+    # ---------------- join stage ----------------
+    def refill(self, session_id: int) -> List[Tuple[int, int, str]]:
+        pending = db.get_pending_links_for_session(session_id, limit=self.refill_links)
+        if pending:
+            return pending
+        if top_up_session(session_id, self.refill_links) <= 0:
+            return []
+        self.stats["refills"] += 1
+        return db.get_pending_links_for_session(session_id, limit=self.refill_links)
+
+    async def run(
+        self,
+        sessions: List[Tuple[int, str]],
+        stop_flag: asyncio.Event,
+        progress=None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Run until stop_flag is set. Returns the scheduler's per-session results.
+        """
+        ingest = asyncio.create_task(self._ingest_loop())
+        jobs.set_ingest_sink(self)
+        try:
+            return await run_join_scheduler(
+                sessions,
+                limit=self.refill_links,
+                stop_flag=stop_flag,
+                progress=progress,
+                refill=self.refill,
+                links_available=self.links_available,
+            )
+        finally:
+            # new checkpoints go back to inline writes; store what is queued
+            jobs.set_ingest_sink(None)
+            await self.drain()
+            ingest.cancel()
+            await asyncio.gather(ingest, return_exceptions=True)
+            metrics.PIPELINE_QUEUE_DEPTH.set(0)
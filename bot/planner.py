@@ -0,0 +1,130 @@
+# bot/planner.py
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+from bot import db, metrics
+from bot.config import JOIN_DELAY_SECONDS, RESERVE_LINKS
+from bot.distributor import MAX_LINKS_PER_SESSION
+from bot.registry import registry
+
+# Capacity planner (replaces the old "distributable / 1000" estimate).
+#
+# Model, per session, from the newest HISTORY_ROWS join_log rows (one
+# aggregate query, no row iteration), topped up from the newest
+# join_log_daily rollups when retention has pruned the raw log below that:
+#
+#   links handled   = success + requested + failed + dead
+#   attempts        = links handled + retries + FloodWaits
+#   session seconds = success * delay            (wait after each join)
+#                   + attempts * rpc             (every RPC)
+#                   + FloodWait seconds
+#   seconds/link    = session seconds / links handled
+#
+# rpc = mean observed join RPC latency (metrics), DEFAULT_RPC_SECONDS
+# until there is one. Without history every link counts as a success.
+#
+# Backlog = pending + retry assignments + unassigned links above the
+# reserve. A session takes at most `quota` links (MAX_LINKS_PER_SESSION),
+# so sessions needed = max(backlog / (rate * hours), backlog / quota).
+
+HISTORY_ROWS = 200_000
+DEFAULT_RPC_SECONDS = 1.5
+WHATIF_DELAYS = (30, 60, 90, 120, 180)
+
+
+def observe() -> Dict[str, Any]:
+    """
+    Inputs measured from the DB (outcome mix, backlog, fleet size).
+    """
+    mix = db.get_join_outcome_mix(HISTORY_ROWS)
+    if mix["rows"] < HISTORY_ROWS:
+        older = db.get_rollup_outcome_mix(HISTORY_ROWS - mix["rows"])
+        mix = {k: mix[k] + older[k] for k in mix}
+    backlog = db.get_backlog_counts()
+
+    count, total = metrics.RPC_LATENCY.totals()
+    rpc = total / count if count else DEFAULT_RPC_SECONDS
+
+    distributable = max(backlog["unassigned_active"] - RESERVE_LINKS, 0)
+    return {
+        "mix": mix,
+        "rpc_seconds": rpc,
+        "rpc_observed": bool(count),
+        "fleet": registry.count(),
+        "pending": backlog["pending"],
+        "retry": backlog["retry"],
+        "distributable": distributable,
+        "backlog": backlog["pending"] + backlog["retry"] + distributable,
+    }
+
+
+def seconds_per_link(mix: Dict[str, int], delay: float, rpc: float) -> float:
+    handled = mix["success"] + mix["requested"] + mix["failed"] + mix["dead"]
+    if handled <= 0:
+        return delay + rpc
+    attempts = handled + mix["retried"] + mix["floodwaits"]
+    busy = mix["success"] * delay + attempts * rpc + mix["floodwait_seconds"]
+    return busy / handled
+
+
+def estimate(
+    obs: Dict[str, Any],
+    hours: float,
+    delay: Optional[float] = None,
+    quota: Optional[int] = None,
+    fleet: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    {"delay", "quota", "fleet", "per_session_per_hour", "eta_hours" (None =
+     never with this fleet), "needed_for_target", "quota_limited"}
+    """
+    delay = JOIN_DELAY_SECONDS if delay is None else delay
+    quota = MAX_LINKS_PER_SESSION if quota is None else quota
+    fleet = obs["fleet"] if fleet is None else fleet
+    if hours <= 0 or delay <= 0 or quota < 1 or fleet < 0:
+        raise ValueError(f"invalid plan inputs: hours={hours} delay={delay} quota={quota} fleet={fleet}")
+    backlog = obs["backlog"]
+
+    rate = 3600.0 / seconds_per_link(obs["mix"], delay, obs["rpc_seconds"])
+
+    by_time = math.ceil(backlog / (rate * hours)) if backlog else 0
+    by_quota = math.ceil(backlog / quota) if backlog else 0
+
+    eta: Optional[float] = None
+    if backlog == 0:
+        eta = 0.0
+    elif fleet > 0 and fleet * quota >= backlog:
+        eta = backlog / (rate * fleet)
+
+    return {
+        "delay": delay,
+        "quota": quota,
+        "fleet": fleet,
+        "per_session_per_hour": rate,
+        "eta_hours": eta,
+        "needed_for_target": max(by_time, by_quota),
+        "quota_limited": by_quota > by_time,
+    }
+
+
+def plan(hours: float = 24.0) -> Dict[str, Any]:
+    obs = observe()
+    return {"observed": obs, "hours": hours, "estimate": estimate(obs, hours)}
+
+
+def whatif(
+    hours: float = 24.0,
+    delays: Optional[Iterable[float]] = None,
+    quotas: Optional[Iterable[int]] = None,
+    fleet: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Grid of estimates over join delays x per-session quotas (one DB read).
+    """
+    obs = observe()
+    rows: List[Dict[str, Any]] = [
+        estimate(obs, hours, delay=d, quota=q, fleet=fleet)
+        for d in (delays or WHATIF_DELAYS)
+        for q in (quotas or (MAX_LINKS_PER_SESSION,))
+    ]
+    return {"observed": obs, "hours": hours, "rows": rows}
@@ -0,0 +1,229 @@
+# bot/profiling.py
+import asyncio
+import io
+import logging
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# On-demand profilers (owner bot commands):
+# - "cpu":    cProfile (deterministic, higher overhead, exact call counts)
+# - "sample": sampling profiler thread reading the loop thread's stack
+# - memory:   tracemalloc snapshots (top allocation sites)
+#
+# Only one CPU profiler may run at a time.
+#
+# Note: the sampler needs the GIL to read frames, so samples are biased
+# toward points where the loop thread releases it (select / socket I/O).
+# Use "cpu" for exact attribution of pure-Python hot spots.
+
+TOP_N = 40
+SAMPLE_INTERVAL_SECONDS = 0.005
+
+
+# ---------------- stage timings ----------------
+class StageTimer:
+    """
+    Accumulates wall time per named stage, e.g. db / rpc / sleep.
+    """
+
+    def __init__(self):
+        self.totals: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.totals[stage] = self.totals.get(stage, 0.0) + seconds
+
+    @contextmanager
+    def stage(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0)
+
+    def merge(self, other: Dict[str, float]) -> None:
+        for k, v in (other or {}).items():
+            self.add(k, v)
+
+    def as_dict(self) -> Dict[str, float]:
+        return dict(self.totals)
+
+
+def format_stage_timings(totals: Dict[str, float]) -> str:
+    if not totals:
+        return ""
+    grand = sum(totals.values()) or 1.0
+    lines = []
+    for name, secs in sorted(totals.items(), key=lambda kv: kv[1], reverse=True):
+        lines.append(f"- {name}: {secs:.1f}s ({secs / grand * 100.0:.1f}%)")
+    return "\n".join(lines)
+
+
+# ---------------- sampling profiler ----------------
+class _Sampler(threading.Thread):
+    def __init__(self, target_thread_id: int, interval: float):
+        super().__init__(name="sampling-profiler", daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.samples = 0
+        self.self_counts: Counter = Counter()
+        self.cum_counts: Counter = Counter()
+        self._stop_evt = threading.Event()
+
+    def run(self) -> None:
+        while not self._stop_evt.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+
+            self.samples += 1
+            seen = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                key = f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+                if leaf:
+                    self.self_counts[key] += 1
+                    leaf = False
+                if key not in seen:
+                    self.cum_counts[key] += 1
+                    seen.add(key)
+                frame = frame.f_back
+
+    def stop(self) -> None:
+        self._stop_evt.set()
+        self.join(timeout=2)
+
+    def report(self, top: int = TOP_N) -> str:
+        total = self.samples or 1
+        out = [f"Sampling profile: {self.samples} samples every {self.interval * 1000:.1f}ms\n"]
+        out.append("== Top functions by self samples ==")
+        for key, n in self.self_counts.most_common(top):
+            out.append(f"{n:8d} {n / total * 100.0:6.2f}%  {key}")
+        out.append("\n== Top functions by cumulative samples ==")
+        for key, n in self.cum_counts.most_common(top):
+            out.append(f"{n:8d} {n / total * 100.0:6.2f}%  {key}")
+        return "\n".join(out) + "\n"
+
+
+# ---------------- CPU profiling session ----------------
+_ACTIVE_KIND: Optional[str] = None
+_STOP_EVENT: Optional[asyncio.Event] = None
+
+
+def is_profiling() -> bool:
+    return _ACTIVE_KIND is not None
+
+
+def request_stop() -> bool:
+    """
+    Stop the running CPU profile early. Returns False if none is running.
+    """
+    if _STOP_EVENT is None:
+        return False
+    _STOP_EVENT.set()
+    return True
+
+
+async def run_cpu_profile(kind: str, seconds: int) -> str:
+    """
+    Profile the event loop thread for `seconds` (or until request_stop()).
+    kind: "cpu" (cProfile) or "sample".
+    Returns the text report.
+    """
+    global _ACTIVE_KIND, _STOP_EVENT
+
+    if _ACTIVE_KIND is not None:
+        raise RuntimeError(f"Profiler already running: {_ACTIVE_KIND}")
+    if kind not in ("cpu", "sample"):
+        raise ValueError(f"Unknown profiler kind: {kind}")
+
+    _ACTIVE_KIND = kind
+    _STOP_EVENT = asyncio.Event()
+    started = time.perf_counter()
+
+    profiler = None
+    sampler = None
+    try:
+        if kind == "cpu":
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            sampler = _Sampler(threading.get_ident(), SAMPLE_INTERVAL_SECONDS)
+            sampler.start()
+
+        try:
+            await asyncio.wait_for(_STOP_EVENT.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        _ACTIVE_KIND = None
+        _STOP_EVENT = None
+
+    elapsed = time.perf_counter() - started
+    header = f"Profile kind={kind} duration={elapsed:.1f}s\n\n"
+
+    if profiler is not None:
+        import pstats
+        buf = io.StringIO()
+        st = pstats.Stats(profiler, stream=buf)
+        st.sort_stats("cumulative").print_stats(TOP_N)
+        st.sort_stats("tottime").print_stats(TOP_N)
+        return header + buf.getvalue()
+
+    return header + sampler.report()
+
+
+# ---------------- memory snapshots ----------------
+async def run_memory_snapshot(seconds: int, top: int = TOP_N) -> str:
+    """
+    Take a tracemalloc snapshot, wait `seconds`, take another one and report
+    top allocation sites plus the growth between both snapshots.
+    """
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(10)
+
+    try:
+        before = tracemalloc.take_snapshot()
+        if seconds > 0:
+            await asyncio.sleep(seconds)
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_here:
+            tracemalloc.stop()
+
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ]
+    before = before.filter_traces(filters)
+    after = after.filter_traces(filters)
+
+    out = [
+        f"tracemalloc: window={seconds}s current={current / 1024:.1f}KiB peak={peak / 1024:.1f}KiB",
+        "(started for this snapshot: allocations made earlier are not traced)" if started_here else "",
+        "",
+        "== Top allocation sites ==",
+    ]
+    for stat in after.statistics("lineno")[:top]:
+        out.append(str(stat))
+
+    out.append("\n== Top growth since first snapshot ==")
+    for stat in after.compare_to(before, "lineno")[:top]:
+        out.append(str(stat))
+
+    return "\n".join(out) + "\n"
@@ -0,0 +1,226 @@
+# bot/progress.py
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# In-memory join progress fed by the joiners, rendered into ONE bot message
+# that is edited in place (rate limited). No DB queries are involved.
+
+RATE_WINDOW_SECONDS = 600
+MAX_SESSION_LINES = 30
+MAX_MESSAGE_CHARS = 4000
+REFRESH_SECONDS = 60
+
+
+class SessionProgress:
+    __slots__ = ("session_id", "total", "success", "failed", "requested", "dead", "retry", "state", "until")
+
+    def __init__(self, session_id: int, total: int = 0):
+        self.session_id = session_id
+        self.total = total
+        self.success = 0
+        self.failed = 0
+        self.requested = 0
+        self.dead = 0
+        self.retry = 0
+        self.state = "starting"
+        # monotonic deadline of current wait (sleep / floodwait), if any
+        self.until: Optional[float] = None
+
+    @property
+    def done(self) -> int:
+        return self.success + self.failed + self.requested
+
+
+class JoinProgress:
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.sessions: Dict[int, SessionProgress] = {}
+        self.finished = False
+        self._events: Deque[float] = deque()
+        self._version = 0
+
+    # ---------------- updates (called by joiners) ----------------
+    def register(self, session_id: int, total: int) -> None:
+        sp = self.sessions.get(session_id)
+        if sp is None:
+            sp = SessionProgress(session_id, total)
+            self.sessions[session_id] = sp
+        else:
+            sp.total = total
+        self._version += 1
+
+    def extend(self, session_id: int, count: int) -> None:
+        """
+        More links for a running session (pipeline refill, due retries).
+        """
+        sp = self.sessions.get(session_id)
+        if sp is None:
+            sp = SessionProgress(session_id)
+            self.sessions[session_id] = sp
+        sp.total += count
+        self._version += 1
+
+    def record(self, session_id: int, outcome: str) -> None:
+        """
+        outcome: success | failed | requested | dead | retry
+        ("dead" links are replaced from reserve, so they do not complete a slot;
+        a "retry" link leaves the queue until its backoff ends and is counted
+        again through extend() when it comes back)
+        """
+        sp = self.sessions.get(session_id)
+        if sp is None:
+            sp = SessionProgress(session_id)
+            self.sessions[session_id] = sp
+
+        if outcome == "dead":
+            sp.dead += 1
+        elif outcome == "retry":
+            sp.retry += 1
+            sp.total = max(sp.total - 1, 0)
+        else:
+            setattr(sp, outcome, getattr(sp, outcome) + 1)
+            self._events.append(time.monotonic())
+        self._version += 1
+
+    def set_state(self, session_id: int, state: str, wait_seconds: Optional[float] = None) -> None:
+        sp = self.sessions.get(session_id)
+        if sp is None:
+            return
+        sp.state = state
+        sp.until = (time.monotonic() + wait_seconds) if wait_seconds else None
+        self._version += 1
+
+    # ---------------- derived values ----------------
+    @property
+    def version(self) -> int:
+        return self._version
+
+    def totals(self) -> Dict[str, int]:
+        out = {"total": 0, "done": 0, "success": 0, "failed": 0, "requested": 0, "dead": 0, "retry": 0}
+        for sp in self.sessions.values():
+            out["total"] += sp.total
+            out["done"] += sp.done
+            out["success"] += sp.success
+            out["failed"] += sp.failed
+            out["requested"] += sp.requested
+            out["dead"] += sp.dead
+            out["retry"] += sp.retry
+        return out
+
+    def rate_per_minute(self) -> float:
+        now = time.monotonic()
+        while self._events and now - self._events[0] > RATE_WINDOW_SECONDS:
+            self._events.popleft()
+        if not self._events:
+            return 0.0
+        span = max(min(now - self.started_at, RATE_WINDOW_SECONDS), 1.0)
+        return len(self._events) / span * 60.0
+
+    def eta_seconds(self) -> Optional[float]:
+        t = self.totals()
+        remaining = t["total"] - t["done"]
+        if remaining <= 0:
+            return 0.0
+        rate = self.rate_per_minute()
+        if rate <= 0:
+            return None
+        return remaining / rate * 60.0
+
+    def render(self) -> str:
+        t = self.totals()
+        elapsed = time.monotonic() - self.started_at
+        pct = (t["done"] / t["total"] * 100.0) if t["total"] else 0.0
+        eta = self.eta_seconds()
+
+        title = "🏁 **تقدم الانضمام (انتهى)**" if self.finished else "⏳ **تقدم الانضمام**"
+        txt = (
+            f"{title}\n\n"
+            f"📌 {t['done']}/{t['total']} ({pct:.1f}%)\n"
+            f"✅ {t['success']} | 🕒 {t['requested']} | ❌ {t['failed']} | ☠️ {t['dead']} | 🔁 {t['retry']}\n"
+            f"⚡ Rate: {self.rate_per_minute():.2f}/min\n"
+            f"⏱️ Elapsed: {format_duration(elapsed)}"
+        )
+        if not self.finished:
+            txt += f" | ETA: {format_duration(eta) if eta is not None else '?'}"
+        txt += "\n\n"
+
+        now = time.monotonic()
+        rows = sorted(self.sessions.values(), key=lambda sp: sp.session_id)
+        for sp in rows[:MAX_SESSION_LINES]:
+            state = sp.state
+            if sp.until and sp.until > now:
+                state += f" {format_duration(sp.until - now)}"
+            txt += (
+                f"- S{sp.session_id}: {sp.done}/{sp.total} "
+                f"✅{sp.success} 🕒{sp.requested} ❌{sp.failed} | {state}\n"
+            )
+        if len(rows) > MAX_SESSION_LINES:
+            txt += f"... +{len(rows) - MAX_SESSION_LINES} sessions\n"
+
+        return txt[:MAX_MESSAGE_CHARS]
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "?"
+    seconds = int(max(seconds, 0))
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    if h:
+        return f"{h}h{m:02d}m"
+    if m:
+        return f"{m}m{s:02d}s"
+    return f"{s}s"
+
+
+async def run_progress_reporter(
+    progress: JoinProgress,
+    edit: Callable[[str], Awaitable[Any]],
+    interval: float,
+    done_event: asyncio.Event,
+) -> None:
+    """
+    Edit the progress message at most once per `interval` seconds.
+    Edits only when counters changed (or every REFRESH_SECONDS to keep
+    timers/ETA fresh). Makes a final edit once done_event is set.
+
+    On flood limits `edit` raises the backend's FloodWait exception
+    (pyrogram: `.value`, Telethon: `.seconds`); we back off that long.
+    """
+    last_version = -1
+    last_edit = 0.0
+
+    while True:
+        finished = done_event.is_set()
+        progress.finished = finished
+
+        now = time.monotonic()
+        if finished or progress.version != last_version or now - last_edit >= REFRESH_SECONDS:
+            try:
+                await edit(progress.render())
+                last_version = progress.version
+                last_edit = now
+            except Exception as e:
+                wait_s = getattr(e, "value", None)
+                if not isinstance(wait_s, (int, float)):
+                    wait_s = getattr(e, "seconds", None)
+                if isinstance(wait_s, (int, float)):
+                    logger.warning("[progress] FloodWait on edit -> backing off %ss", wait_s)
+                    await asyncio.sleep(wait_s)
+                    continue
+                # e.g. MESSAGE_NOT_MODIFIED: nothing to do
+                logger.debug("[progress] edit failed: %s", e)
+                last_edit = now
+
+        if finished:
+            return
+
+        try:
+            await asyncio.wait_for(done_event.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
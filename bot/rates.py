@@ -0,0 +1,153 @@
+# bot/rates.py
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from bot import db, metrics
+from bot.config import RATE_RETENTION_HOURS, RATE_SNAPSHOT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Throughput time series.
+# The joiner bumps in-memory counters (record / record_floodwait: a dict
+# update, no I/O). Every RATE_SNAPSHOT_SECONDS the flush loop writes one
+# rate_snapshots row per active session plus an overall row (session_id 0)
+# that also carries the reserve size and the pending backlog, then prunes
+# rows older than RATE_RETENTION_HOURS. The same (threaded) flush refreshes
+# the reserve / pending gauges, so a /metrics scrape never hits the DB.
+
+COUNTERS = ("joined", "failed", "requested", "dead", "retried", "floodwaits", "floodwait_seconds")
+
+_OUTCOME_COUNTER = {
+    "success": "joined",
+    "failed": "failed",
+    "requested": "requested",
+    "dead": "dead",
+    "retry": "retried",
+}
+
+# session_id -> counter -> value, since the last flush
+_current: Dict[int, Dict[str, float]] = {}
+
+
+def _bucket(session_id: int) -> Dict[str, float]:
+    b = _current.get(session_id)
+    if b is None:
+        b = _current[session_id] = dict.fromkeys(COUNTERS, 0)
+    return b
+
+
+def record(session_id: int, outcome: str) -> None:
+    """
+    outcome: success | failed | requested | dead | retry
+    """
+    _bucket(session_id)[_OUTCOME_COUNTER[outcome]] += 1
+
+
+def record_floodwait(session_id: int, seconds: float) -> None:
+    b = _bucket(session_id)
+    b["floodwaits"] += 1
+    b["floodwait_seconds"] += seconds
+
+
+def _take() -> Dict[int, Dict[str, float]]:
+    # called on the event loop thread, where the joiner records
+    global _current
+    taken, _current = _current, {}
+    return taken
+
+
+def _write(taken: Dict[int, Dict[str, float]], now: float) -> int:
+    total = dict.fromkeys(COUNTERS, 0)
+    for b in taken.values():
+        for k in COUNTERS:
+            total[k] += b[k]
+
+    reserve = db.count_links_unassigned_active()
+    pending = db.count_pending_assignments()
+    metrics.RESERVE_SIZE.set(reserve)
+    metrics.PENDING_DEPTH.set(pending)
+
+    ts = int(now)
+    rows = [(ts, sid, *(int(b[k]) for k in COUNTERS), None, None) for sid, b in taken.items()]
+    rows.append((ts, 0, *(int(total[k]) for k in COUNTERS), reserve, pending))
+    db.insert_rate_snapshots(rows)
+    db.prune_rate_snapshots(ts - RATE_RETENTION_HOURS * 3600)
+    return len(rows)
+
+
+def flush(now: Optional[float] = None) -> int:
+    """
+    Write the counters collected since the last flush (blocking).
+    Returns the number of rows written.
+    """
+    return _write(_take(), time.time() if now is None else now)
+
+
+async def run_rate_snapshots(interval: float = RATE_SNAPSHOT_SECONDS) -> None:
+    """
+    Flush forever (cancel to stop); the last partial interval is flushed on cancel.
+    """
+    try:
+        while True:
+            await asyncio.sleep(interval)
+            taken = _take()
+            try:
+                await asyncio.to_thread(_write, taken, time.time())
+            except Exception:
+                logger.exception("[rates] Snapshot flush failed")
+    finally:
+        if _current:
+            try:
+                flush()
+            except Exception:
+                logger.exception("[rates] Final snapshot flush failed")
+
+
+# ---------------- reporting ----------------
+def _per_minute(rows: List[Any], start: float, end: float) -> float:
+    if rows:
+        # do not count minutes before the first snapshot (bot just started)
+        start = max(start, rows[0]["ts"] - RATE_SNAPSHOT_SECONDS)
+    if end <= start:
+        return 0.0
+    done = sum(r["joined"] + r["failed"] + r["requested"] for r in rows if start < r["ts"] <= end)
+    return done / ((end - start) / 60.0)
+
+
+def summary(now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Recent overall rates (per minute), trend, backlog ETA and the busiest sessions:
+      {"rate_5m", "rate_15m", "rate_60m", "trend_pct", "floodwait_60m",
+       "reserve", "pending", "backlog", "eta_seconds",
+       "sessions": [(id, done/min), ...]}
+    """
+    now = time.time() if now is None else now
+    rows = db.get_rate_series(0, int(now - 3600))
+
+    out: Dict[str, Any] = {
+        "rate_5m": _per_minute(rows, now - 300, now),
+        "rate_15m": _per_minute(rows, now - 900, now),
+        "rate_60m": _per_minute(rows, now - 3600, now),
+        "floodwait_60m": sum(r["floodwait_seconds"] for r in rows),
+        "reserve": rows[-1]["reserve"] if rows else None,
+        "pending": rows[-1]["pending"] if rows else None,
+    }
+
+    prev = _per_minute(rows, now - 1800, now - 900)
+    out["trend_pct"] = ((out["rate_15m"] - prev) / prev * 100.0) if prev else None
+
+    backlog = db.count_pending_assignments() + db.count_retry_assignments()
+    rate = out["rate_60m"]
+    out["backlog"] = backlog
+    out["eta_seconds"] = (backlog / rate * 60.0) if rate > 0 else None
+
+    span_min = 60.0
+    if rows:
+        span_min = max(min(span_min, (now - rows[0]["ts"] + RATE_SNAPSHOT_SECONDS) / 60.0), 1.0)
+    out["sessions"] = [
+        (r["session_id"], r["done"] / span_min)
+        for r in db.get_session_rate_totals(int(now - 3600), limit=10)
+    ]
+    return out
@@ -0,0 +1,109 @@
+# bot/registry.py
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from bot import db
+
+logger = logging.getLogger(__name__)
+
+# In-process cache of the active sessions.
+# - loaded once, reloaded only when db.sessions_version() moved
+#   (add_session / soft_delete_session / quarantine_session bump it)
+# - id-only lookups (ids(), count()) never touch the DB while the cache
+#   is current
+# - parsed StringSession objects are kept per session string; each
+#   client gets its own copy (Telethon mutates the session it is given)
+
+
+class SessionInfo:
+    __slots__ = ("session_id", "session_string", "phone", "created_at", "user_id")
+
+    def __init__(self, session_id: int, session_string: str, phone: str, created_at: str, user_id: Optional[int]):
+        self.session_id = session_id
+        self.session_string = session_string
+        self.phone = phone
+        self.created_at = created_at
+        self.user_id = user_id
+
+    def as_row(self) -> Tuple[int, str, str, str]:
+        # same shape as db.list_sessions()
+        return (self.session_id, self.session_string, self.phone, self.created_at)
+
+
+class SessionRegistry:
+    def __init__(self):
+        self._version: Optional[int] = None
+        self._infos: List[SessionInfo] = []
+        self._by_id: Dict[int, SessionInfo] = {}
+        self._parsed: Dict[str, Any] = {}
+
+    def _current(self) -> List[SessionInfo]:
+        if self._version != db.sessions_version():
+            self.reload()
+        return self._infos
+
+    def reload(self) -> None:
+        version, rows = db.load_session_registry()
+        self._infos = [
+            SessionInfo(r["id"], r["session_string"], r["phone"] or "", r["created_at"], r["user_id"])
+            for r in rows
+        ]
+        self._by_id = {i.session_id: i for i in self._infos}
+        # drop parsed sessions of removed accounts
+        live = {i.session_string for i in self._infos}
+        self._parsed = {k: v for k, v in self._parsed.items() if k in live}
+        self._version = version
+
+    def invalidate(self) -> None:
+        """
+        Force a reload on next access (e.g. after editing the DB by hand).
+        """
+        self._version = None
+
+    # ---------------- projections ----------------
+    def ids(self) -> List[int]:
+        return [i.session_id for i in self._current()]
+
+    def count(self) -> int:
+        return len(self._current())
+
+    def sessions(self) -> List[Tuple[int, str, str, str]]:
+        """
+        (id, session_string, phone, created_at) of active sessions, like db.list_sessions().
+        """
+        return [i.as_row() for i in self._current()]
+
+    def pairs(self) -> List[Tuple[int, str]]:
+        """
+        (id, session_string) of active sessions (join scheduler input).
+        """
+        return [(i.session_id, i.session_string) for i in self._current()]
+
+    def get(self, session_id: int) -> Optional[SessionInfo]:
+        self._current()
+        return self._by_id.get(session_id)
+
+    # ---------------- parsed sessions ----------------
+    def string_session(self, session_string: str):
+        """
+        A fresh Telethon StringSession for `session_string`, built from a
+        cached parse (no base64 / auth key hashing per connect).
+        """
+        from telethon.sessions import StringSession
+
+        parsed = self._parsed.get(session_string)
+        if parsed is None:
+            parsed = StringSession(session_string)
+            if len(self._parsed) > 4 * max(len(self._infos), 64):
+                # strings saved after DC moves pile up; start over
+                self._parsed.clear()
+            self._parsed[session_string] = parsed
+
+        session = StringSession()
+        if parsed.dc_id:
+            session.set_dc(parsed.dc_id, parsed.server_address, parsed.port)
+        session.auth_key = parsed.auth_key
+        return session
+
+
+registry = SessionRegistry()
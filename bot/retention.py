@@ -0,0 +1,90 @@
+# bot/retention.py
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+from itertools import takewhile
+from typing import Dict, List, Optional
+
+from bot import db, metrics
+from bot.config import JOIN_LOG_ARCHIVE_DIR, JOIN_LOG_PRUNE_BATCH, JOIN_LOG_RETENTION_DAYS
+
+logger = logging.getLogger(__name__)
+
+# join_log retention, run by DB maintenance, one batch at a time:
+# 1. read the JOIN_LOG_PRUNE_BATCH oldest rows and keep those older than the
+#    cutoff (ids follow created_at, so old rows are always a prefix)
+# 2. append them to <archive dir>/join_log-YYYY-MM-DD.ndjson.gz (one file per
+#    created_at day; every batch adds a gzip member, zcat / gzip.open read
+#    the file as one stream) and fsync
+# 3. one short transaction: add them to join_log_daily, delete them
+# A crash between 2 and 3 archives the batch again on the next run (duplicate
+# lines, same id); a row is never lost or counted twice in the rollups.
+# Writers wait for at most one batch transaction; BATCH_PAUSE_SECONDS between
+# batches lets queued join_log writes through.
+
+MAX_BATCHES_PER_RUN = 50
+BATCH_PAUSE_SECONDS = 0.05
+
+
+def _cutoff(days: int, now: float) -> str:
+    # same format as SQLite CURRENT_TIMESTAMP (UTC), so strings compare
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - days * 86400))
+
+
+def _archive(rows: List[sqlite3.Row], archive_dir: str) -> int:
+    by_day: Dict[str, List[str]] = {}
+    for r in rows:
+        day = str(r["created_at"] or "")[:10] or "undated"
+        by_day.setdefault(day, []).append(json.dumps(dict(r), ensure_ascii=False))
+
+    os.makedirs(archive_dir, exist_ok=True)
+    written = 0
+    for day, lines in by_day.items():
+        blob = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"))
+        with open(os.path.join(archive_dir, f"join_log-{day}.ndjson.gz"), "ab") as f:
+            f.write(blob)
+            f.flush()
+            os.fsync(f.fileno())
+        written += len(blob)
+    metrics.JOIN_LOG_ARCHIVE_BYTES.inc(written)
+    return written
+
+
+def prune(
+    retention_days: int = JOIN_LOG_RETENTION_DAYS,
+    archive_dir: str = JOIN_LOG_ARCHIVE_DIR,
+    batch: int = JOIN_LOG_PRUNE_BATCH,
+    max_batches: int = MAX_BATCHES_PER_RUN,
+    now: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    Roll up, archive and delete join_log rows older than retention_days
+    (blocking). Returns {"rows", "batches", "archive_bytes"}.
+    """
+    out = {"rows": 0, "batches": 0, "archive_bytes": 0}
+    if retention_days <= 0:
+        return out
+
+    cutoff = _cutoff(retention_days, time.time() if now is None else now)
+    while out["batches"] < max_batches:
+        rows = db.get_oldest_join_log(batch)
+        old = list(takewhile(lambda r: str(r["created_at"] or "") < cutoff, rows))
+        if not old:
+            break
+        if archive_dir:
+            out["archive_bytes"] += _archive(old, archive_dir)
+        deleted = db.rollup_and_delete_join_log(old[-1]["id"])
+        metrics.JOIN_LOG_PRUNED.inc(deleted)
+        out["rows"] += deleted
+        out["batches"] += 1
+        if len(old) < batch:
+            break  # reached the retention window (or the end of the table)
+        time.sleep(BATCH_PAUSE_SECONDS)
+
+    if out["rows"]:
+        logger.info("[retention] join_log: %s rows before %s rolled up and deleted (%s batches, %s archive bytes)",
+                    out["rows"], cutoff, out["batches"], out["archive_bytes"])
+    return out
@@ -0,0 +1,475 @@
+# bot/scheduler.py
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from bot import db, metrics
+from bot.config import (
+    API_ID,
+    API_HASH,
+    IDLE_DISCONNECT_SECONDS,
+    JOIN_DELAY_SECONDS,
+    JOIN_MAX_ATTEMPTS,
+    JOIN_RETRY_BASE_SECONDS,
+    JOIN_RETRY_MAX_SECONDS,
+    MAX_ACTIVE_SESSIONS,
+)
+from bot.joiner import attempt_link
+from bot.profiling import StageTimer
+from bot.registry import registry
+from bot.session_check import fatal_session_errors
+
+logger = logging.getLogger(__name__)
+
+# Central join scheduler.
+#
+# Instead of one coroutine + one open connection per session (sleeping
+# almost all the time), sessions are entries in a min-heap keyed by their
+# next eligible time. When a session is due and a slot is free, a "turn"
+# task connects it, joins links until it has to wait (JOIN_DELAY_SECONDS
+# after a join, or a FloodWait deadline). At most MAX_ACTIVE_SESSIONS
+# clients are connected at once: running turns plus idle clients kept
+# connected (below).
+#
+# Connection lifecycle: if the next turn is more than IDLE_DISCONNECT_SECONDS
+# away, the client saves its StringSession and disconnects (no socket,
+# buffers or update handling while waiting) and reconnects lazily at its
+# next turn. Shorter waits keep the idle client connected to skip the
+# reconnect handshake; those count toward MAX_ACTIVE_SESSIONS, and the one
+# idle the longest is disconnected when a new turn needs its slot.
+#
+# Rules per link (see bot.joiner.attempt_link):
+# - success/already participant => next turn after JOIN_DELAY_SECONDS
+# - dead => replaced from reserve immediately, no wait
+# - floodwait => next turn after the FloodWait, retry same link
+# - join request required => marked requested, no wait
+# - transient error => link requeued in the DB with backoff, no wait
+#
+# Failed turns (connect error, network drop outside a join RPC): the session
+# is requeued after JOIN_RETRY_BASE_SECONDS, x2 per consecutive failure up
+# to JOIN_RETRY_MAX_SECONDS, and dropped from the run after JOIN_MAX_ATTEMPTS
+# consecutive failures. Fatal auth errors (revoked / banned / unauthorized,
+# see bot.session_check) drop and quarantine the session right away.
+#
+# Retries: a session whose queue is empty but has retries in backoff stays
+# scheduled until its earliest retry is due, then reloads the due ones
+# (in continuous mode they come back through `refill`).
+#
+# Continuous mode (pipeline): with `refill`, a session that runs out of
+# links asks for more (assigned from above the reserve); if none are left
+# it waits "starved" until `links_available` is set (or REFILL_POLL_SECONDS
+# pass) and the scheduler keeps running until stopped (stop_flag is
+# required), or until no session is left at all (all dropped on errors).
+#
+# Stop:
+# - stop_flag set => no new turns; running turns exit after their
+#   in-flight RPC (graceful drain)
+# - scheduler task cancelled => running turns are cancelled, in-flight
+#   joins are logged as "cancelled" and stay pending
+
+
+class _Session:
+    __slots__ = (
+        "session_id", "session_string", "pending", "timer",
+        "success", "failed", "requested", "retried", "cancelled", "error",
+        "turn_failures", "wait_kind", "idle_since", "client",
+    )
+
+    def __init__(self, session_id: int, session_string: str):
+        self.session_id = session_id
+        self.session_string = session_string
+        self.pending: Deque[Tuple[int, int, str]] = deque()  # (link_id, kind, value)
+        self.timer = StageTimer()
+        self.success = 0
+        self.failed = 0
+        self.requested = 0
+        self.retried = 0
+        self.cancelled = False
+        self.error: Optional[str] = None
+        # consecutive failed turns (reset by a turn that completes)
+        self.turn_failures = 0
+        # what the session is waiting for between turns (sleep | floodwait | retry | reconnect)
+        self.wait_kind: Optional[str] = None
+        self.idle_since = 0.0
+        # connected client kept across a short wait, else None
+        self.client = None
+
+    def result(self) -> Dict[str, Any]:
+        out = {
+            "session_id": self.session_id,
+            "success": self.success,
+            "failed": self.failed,
+            "requested": self.requested,
+            "retry": self.retried,
+            "timings": self.timer.as_dict(),
+        }
+        if self.cancelled:
+            out["cancelled"] = True
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+ClientFactory = Callable[[str], Any]
+Refill = Callable[[int], List[Tuple[int, int, str]]]
+
+REFILL_POLL_SECONDS = 60
+
+
+def _telethon_client(session_string: str):
+    from telethon import TelegramClient
+
+    return TelegramClient(registry.string_session(session_string), API_ID, API_HASH)
+
+
+def _turn_retry_delay(failures: int) -> float:
+    return min(JOIN_RETRY_BASE_SECONDS * 2 ** (failures - 1), JOIN_RETRY_MAX_SECONDS)
+
+
+def _stop_requested(stop_flag) -> bool:
+    return stop_flag is not None and stop_flag.is_set()
+
+
+async def _join_until_wait(client, st: _Session, stop_flag, progress, join_delay: float) -> Optional[Tuple[float, str]]:
+    while st.pending:
+        if _stop_requested(stop_flag):
+            return None
+
+        link_id, kind, link_value = st.pending[0]
+        outcome, value = await attempt_link(client, st.session_id, link_id, kind, link_value, st.timer, progress)
+
+        if outcome == "replaced":
+            st.pending[0] = value
+            continue
+
+        if outcome == "floodwait":
+            return value, "floodwait"
+
+        st.pending.popleft()
+        if outcome == "success":
+            st.success += 1
+            if join_delay > 0:
+                return join_delay, "sleep"
+        elif outcome == "requested":
+            st.requested += 1
+        elif outcome == "retry":
+            st.retried += 1
+        else:
+            st.failed += 1
+
+    return None
+
+
+async def _disconnect(st: _Session, client, save: bool = True) -> None:
+    # keep auth key / DC changes for the next connect (not from a client
+    # whose connect failed: its session may be half set up)
+    if save:
+        st.session_string = client.session.save()
+    await client.disconnect()
+
+
+async def _turn(
+    st: _Session,
+    stop_flag,
+    progress,
+    client_factory: ClientFactory,
+    join_delay: float,
+    idle_disconnect: float,
+) -> Optional[Tuple[float, str]]:
+    """
+    (Re)connect if needed, join links until the session has to wait.
+    Returns (seconds_until_next_turn, wait_kind), or None when the session
+    has nothing left to do (or stop was requested).
+    """
+    client, st.client = st.client, None
+    connected = client is not None and client.is_connected()
+    keep = False
+    try:
+        if not connected:
+            client = client_factory(st.session_string)
+            with st.timer.stage("connect"):
+                await client.connect()
+            connected = True
+            metrics.SESSION_CONNECTS.inc()
+
+        nxt = await _join_until_wait(client, st, stop_flag, progress, join_delay)
+        keep = nxt is not None and bool(st.pending) and nxt[0] < idle_disconnect
+        return nxt
+    finally:
+        if keep:
+            st.client = client
+        elif connected:
+            await _disconnect(st, client)
+        elif client is not None:
+            # failed connect: release whatever it opened, keep the original error
+            try:
+                await _disconnect(st, client, save=False)
+            except Exception:
+                pass
+
+
+async def _free_idle_slot(states: Dict[int, "_Session"], active: int, max_active: int) -> None:
+    # idle connected clients hold slots too: disconnect the longest idle
+    # ones until a new connection fits under max_active
+    idle = sorted((st for st in states.values() if st.client is not None), key=lambda st: st.idle_since)
+    while idle and active + len(idle) >= max_active:
+        st = idle.pop(0)
+        client, st.client = st.client, None
+        try:
+            await _disconnect(st, client)
+        except Exception as e:
+            logger.warning("[Session %s] Idle disconnect failed: %s", st.session_id, e,
+                           extra={"session_id": st.session_id})
+
+
+async def run_join_scheduler(
+    sessions: List[Tuple[int, str]],
+    limit: int = 1000,
+    stop_flag: Optional[asyncio.Event] = None,
+    progress=None,
+    max_active: int = MAX_ACTIVE_SESSIONS,
+    idle_disconnect: float = IDLE_DISCONNECT_SECONDS,
+    join_delay: float = JOIN_DELAY_SECONDS,
+    client_factory: ClientFactory = _telethon_client,
+    refill: Optional[Refill] = None,
+    links_available: Optional[asyncio.Event] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Join pending links of all (session_id, session_string) pairs.
+
+    Returns one result per session, in input order:
+      {"session_id", "success", "failed", "requested", "retry", "timings"}
+      (+ "cancelled": True / "error": str)
+
+    "timings" stages: connect / db / rpc, plus sleep / floodwait / retry /
+    reconnect (time between turns) and slot_wait (due but no free turn slot).
+
+    client_factory(session_string) builds the (not yet connected) client;
+    tests and benchmarks pass an offline fake.
+
+    refill(session_id) -> [(link_id, kind, value)] (blocking, run in a worker
+    thread) turns on continuous mode:
+    the scheduler runs until stop_flag (required) is set, it is cancelled or
+    no session is left.
+    """
+    if refill is not None and stop_flag is None:
+        raise ValueError("continuous mode (refill) requires a stop_flag")
+
+    states: Dict[int, _Session] = {}
+    heap: List[Tuple[float, int, int]] = []
+    seq = itertools.count()
+
+    continuous = refill is not None
+    # continuous mode: session_id -> earliest time it may join again
+    starved: Dict[int, float] = {}
+
+    async def top_up(st: _Session, eligible_at: float) -> bool:
+        # refill queries the DB (assignment + pending links): off the loop
+        with st.timer.stage("db"):
+            items = await asyncio.to_thread(refill, st.session_id)
+        if not items:
+            starved[st.session_id] = eligible_at
+            if progress:
+                progress.set_state(st.session_id, "idle")
+            return False
+        st.pending.extend(items)
+        starved.pop(st.session_id, None)
+        heapq.heappush(heap, (eligible_at, next(seq), st.session_id))
+        if progress:
+            progress.extend(st.session_id, len(items))
+        return True
+
+    def wait_for_retry(st: _Session, not_before: float) -> bool:
+        # empty queue: come back when the earliest retry is due
+        with st.timer.stage("db"):
+            retry_in = db.next_retry_in(st.session_id)
+        if retry_in is None:
+            return False
+        st.wait_kind = "retry"
+        st.idle_since = time.monotonic()
+        # next_attempt_at has 1 s resolution
+        due = max(not_before, st.idle_since + retry_in + 1.0)
+        heapq.heappush(heap, (due, next(seq), st.session_id))
+        if progress:
+            progress.set_state(st.session_id, "retry", due - st.idle_since)
+        return True
+
+    now = time.monotonic()
+    for sid, session_string in sessions:
+        st = _Session(sid, session_string)
+        with st.timer.stage("db"):
+            st.pending = deque(db.get_pending_links_for_session(sid, limit=limit))
+        states[sid] = st
+        if progress:
+            progress.register(sid, len(st.pending))
+            progress.set_state(sid, "queued" if st.pending else "done")
+        if st.pending:
+            heapq.heappush(heap, (now, next(seq), sid))
+        elif continuous:
+            await top_up(st, now)
+        else:
+            wait_for_retry(st, now)
+
+    active: Dict[asyncio.Task, _Session] = {}
+    stop_wait = asyncio.ensure_future(stop_flag.wait()) if stop_flag is not None else None
+    links_wait = None
+    last_refill_scan = time.monotonic()
+
+    try:
+        while heap or active or continuous:
+            if not (heap or active or starved):
+                # continuous mode with every session dropped: nothing can wake us
+                logger.warning("[scheduler] No session left to run, stopping.")
+                break
+            stopping = _stop_requested(stop_flag)
+            now = time.monotonic()
+
+            # continuous mode: new links (or poll interval) -> top up starved sessions
+            if continuous and starved and not stopping:
+                signalled = links_available is not None and links_available.is_set()
+                if signalled or now - last_refill_scan >= REFILL_POLL_SECONDS:
+                    if signalled:
+                        links_available.clear()
+                    last_refill_scan = now
+                    for sid, eligible_at in sorted(starved.items(), key=lambda kv: kv[1]):
+                        if not await top_up(states[sid], max(eligible_at, now)):
+                            break  # nothing left above the reserve
+
+            # start every due session while slots are free
+            while not stopping and heap and heap[0][0] <= now and len(active) < max_active:
+                due, _, sid = heapq.heappop(heap)
+                st = states[sid]
+                if st.wait_kind:
+                    st.timer.add(st.wait_kind, due - st.idle_since)
+                    st.timer.add("slot_wait", now - due)
+                    st.wait_kind = None
+                if not st.pending:
+                    # woke up for retries: load the due ones
+                    with st.timer.stage("db"):
+                        st.pending.extend(db.get_pending_links_for_session(sid, limit=limit))
+                    if not st.pending:
+                        if not wait_for_retry(st, now) and progress:
+                            progress.set_state(sid, "done")
+                        continue
+                    if progress:
+                        progress.extend(sid, len(st.pending))
+                if st.client is None:
+                    await _free_idle_slot(states, len(active), max_active)
+                turn = _turn(st, stop_flag, progress, client_factory, join_delay, idle_disconnect)
+                active[asyncio.create_task(turn)] = st
+                if progress:
+                    progress.set_state(sid, "joining")
+            metrics.SCHEDULER_ACTIVE.set(len(active))
+            metrics.SCHEDULER_IDLE_CONNECTED.set(sum(1 for st in states.values() if st.client is not None))
+
+            if stopping:
+                if not active:
+                    break
+                timeout = None
+            elif heap and len(active) < max_active:
+                timeout = max(heap[0][0] - now, 0.0)
+            else:
+                timeout = None
+
+            waiters = set(active)
+            if stop_wait is not None and not stopping:
+                waiters.add(stop_wait)
+            if continuous and starved and not stopping:
+                poll = max(last_refill_scan + REFILL_POLL_SECONDS - now, 0.0)
+                timeout = poll if timeout is None else min(timeout, poll)
+                if links_available is not None:
+                    if links_wait is None or links_wait.done():
+                        links_wait = asyncio.ensure_future(links_available.wait())
+                    waiters.add(links_wait)
+            if not waiters:
+                await asyncio.sleep(timeout or 0)
+                continue
+
+            done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                st = active.pop(task, None)
+                if st is None:
+                    continue  # stop_wait / links_wait
+
+                try:
+                    nxt = task.result()
+                except Exception as e:
+                    st.error = f"{type(e).__name__}: {e}"
+                    st.turn_failures += 1
+                    fatal = isinstance(e, fatal_session_errors())
+                    if fatal or st.turn_failures >= JOIN_MAX_ATTEMPTS or _stop_requested(stop_flag):
+                        logger.error("[Session %s] Turn failed, session dropped from this run: %s",
+                                     st.session_id, st.error, extra={"session_id": st.session_id})
+                        if fatal:
+                            with st.timer.stage("db"):
+                                db.quarantine_session(st.session_id, st.error)
+                        if progress:
+                            progress.set_state(st.session_id, "error")
+                        continue
+
+                    wait_s = _turn_retry_delay(st.turn_failures)
+                    st.wait_kind = "reconnect"
+                    st.idle_since = time.monotonic()
+                    heapq.heappush(heap, (st.idle_since + wait_s, next(seq), st.session_id))
+                    logger.warning("[Session %s] Turn failed (%s/%s): %s -> retry in %ss",
+                                   st.session_id, st.turn_failures, JOIN_MAX_ATTEMPTS, st.error, wait_s,
+                                   extra={"session_id": st.session_id})
+                    if progress:
+                        progress.set_state(st.session_id, "reconnect", wait_s)
+                    continue
+
+                st.turn_failures = 0
+                st.error = None
+
+                if nxt is not None and st.pending:
+                    wait_s, kind = nxt
+                    st.wait_kind = kind
+                    st.idle_since = time.monotonic()
+                    heapq.heappush(heap, (st.idle_since + wait_s, next(seq), st.session_id))
+                    if progress:
+                        progress.set_state(st.session_id, kind, wait_s)
+                elif continuous and not st.pending and not _stop_requested(stop_flag):
+                    # out of links: respect the pending delay, then ask for more
+                    now = time.monotonic()
+                    await top_up(st, now + (nxt[0] if nxt is not None else 0.0))
+                elif not st.pending and not _stop_requested(stop_flag):
+                    not_before = time.monotonic() + (nxt[0] if nxt is not None else 0.0)
+                    if not wait_for_retry(st, not_before) and progress:
+                        progress.set_state(st.session_id, "done")
+                elif progress:
+                    progress.set_state(st.session_id, "done" if not st.pending else "stopped")
+
+    except asyncio.CancelledError:
+        # immediate stop: cancel running turns (they log in-flight joins);
+        # partial results are still returned to the caller
+        logger.info("[scheduler] Cancelled with %s active turn(s).", len(active))
+        for task in active:
+            task.cancel()
+        await asyncio.gather(*active, return_exceptions=True)
+        for st in active.values():
+            st.cancelled = True
+
+    finally:
+        if stop_wait is not None:
+            stop_wait.cancel()
+        if links_wait is not None:
+            links_wait.cancel()
+        for st in states.values():
+            if st.client is not None:
+                client, st.client = st.client, None
+                await _disconnect(st, client)
+        metrics.SCHEDULER_ACTIVE.set(0)
+        metrics.SCHEDULER_IDLE_CONNECTED.set(0)
+
+    if progress:
+        for sid in list(starved) + [sid for _, _, sid in heap]:
+            progress.set_state(sid, "stopped")
+        for st in active.values():
+            progress.set_state(st.session_id, "stopped")
+
+    return [states[sid].result() for sid, _ in sessions]
@@ -0,0 +1,124 @@
+# bot/session_check.py
+import asyncio
+import logging
+from typing import Any, Dict, List, Tuple, Type
+
+from bot import db
+from bot.config import API_ID, API_HASH, SESSION_CHECK_CONCURRENCY, SESSION_CHECK_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Lightweight session validation: connect + is_user_authorized + get_me.
+# Used by session import (single paste and bulk file) and by the
+# pre-run health sweep that quarantines dead accounts.
+#
+# "fatal" errors mean the session itself is unusable (revoked, banned,
+# unauthorized); timeouts / network errors are NOT fatal, so a flaky
+# network never quarantines healthy accounts.
+
+
+def fatal_session_errors() -> Tuple[Type[BaseException], ...]:
+    """
+    Telethon errors meaning the session itself is unusable.
+    """
+    from telethon import errors
+
+    return (
+        errors.AuthKeyUnregisteredError,
+        errors.AuthKeyDuplicatedError,
+        errors.SessionRevokedError,
+        errors.SessionExpiredError,
+        errors.UserDeactivatedError,
+        errors.UserDeactivatedBanError,
+    )
+
+
+async def check_session(session_string: str, timeout: float = SESSION_CHECK_TIMEOUT) -> Dict[str, Any]:
+    """
+    Returns:
+      {"ok": True, "user_id": int, "phone": str}
+      {"ok": False, "fatal": bool, "error": "invalid_string" | "unauthorized" | "<exception text>"}
+    """
+    from telethon import TelegramClient
+    from telethon.sessions import StringSession
+
+    fatal_errors = fatal_session_errors()
+
+    try:
+        session = StringSession(session_string.strip())
+    except Exception:
+        return {"ok": False, "fatal": True, "error": "invalid_string"}
+
+    client = TelegramClient(session, API_ID, API_HASH)
+    try:
+        await asyncio.wait_for(client.connect(), timeout=timeout)
+
+        if not await asyncio.wait_for(client.is_user_authorized(), timeout=timeout):
+            return {"ok": False, "fatal": True, "error": "unauthorized"}
+
+        me = await asyncio.wait_for(client.get_me(), timeout=timeout)
+        if me is None:
+            return {"ok": False, "fatal": True, "error": "unauthorized"}
+
+        return {"ok": True, "user_id": int(me.id), "phone": me.phone or ""}
+
+    except asyncio.TimeoutError:
+        return {"ok": False, "fatal": False, "error": "timeout"}
+    except fatal_errors as e:
+        return {"ok": False, "fatal": True, "error": f"{type(e).__name__}: {e}"}
+    except Exception as e:
+        return {"ok": False, "fatal": False, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        try:
+            await client.disconnect()
+        except Exception:
+            pass
+
+
+async def check_sessions(
+    session_strings: List[str],
+    concurrency: int = SESSION_CHECK_CONCURRENCY,
+) -> List[Dict[str, Any]]:
+    """
+    Check many sessions concurrently (at most `concurrency` at once).
+    Results are returned in input order.
+    """
+    sem = asyncio.Semaphore(max(concurrency, 1))
+
+    async def one(s: str) -> Dict[str, Any]:
+        async with sem:
+            return await check_session(s)
+
+    return await asyncio.gather(*(one(s) for s in session_strings))
+
+
+async def sweep_sessions(sessions: List[Tuple]) -> Dict[str, Any]:
+    """
+    Health sweep over (id, session_string, ...) rows of active sessions.
+    Fatal failures are quarantined (pending links requeued).
+
+    Returns {"checked", "healthy", "quarantined": [(id, reason)],
+             "unreachable": [(id, reason)], "requeued"}.
+    """
+    results = await check_sessions([row[1] for row in sessions])
+
+    report = {
+        "checked": len(sessions),
+        "healthy": 0,
+        "quarantined": [],
+        "unreachable": [],
+        "requeued": 0,
+    }
+    for row, r in zip(sessions, results):
+        sid = row[0]
+        if r["ok"]:
+            report["healthy"] += 1
+        elif r.get("fatal"):
+            report["requeued"] += db.quarantine_session(sid, r["error"])
+            report["quarantined"].append((sid, r["error"]))
+            logger.warning("[health] Session %s quarantined: %s", sid, r["error"], extra={"session_id": sid})
+        else:
+            report["unreachable"].append((sid, r["error"]))
+            logger.warning("[health] Session %s unreachable (kept active): %s", sid, r["error"], extra={"session_id": sid})
+
+    return report
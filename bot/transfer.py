@@ -0,0 +1,145 @@
+# bot/transfer.py
+import csv
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from bot import db
+from bot.utils import extract_telegram_links, normalize_tme_link
+
+logger = logging.getLogger(__name__)
+
+# Streaming bulk import / export of links and results.
+# Files are read line by line and written chunk by chunk, so memory stays
+# bounded by IMPORT_BATCH_SIZE / EXPORT_CHUNK_SIZE regardless of file size.
+# These functions are blocking: call them via asyncio.to_thread().
+
+IMPORT_BATCH_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+
+
+# ---------------- import ----------------
+def _file_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".ndjson", ".jsonl"):
+        return "ndjson"
+    return "txt"
+
+
+def iter_links_from_file(path: str, default_source: str) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (raw_link, source_channel) from a TXT / CSV / NDJSON file.
+
+    - txt:    any text; every Telegram link found on each line
+    - csv:    every cell is scanned; a `source_channel` column is used if present
+    - ndjson: objects with `link` (or `url`) and optional `source_channel`
+    """
+    fmt = _file_format(path)
+
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        if fmt == "txt":
+            for line in f:
+                for link in extract_telegram_links(line):
+                    yield link, default_source
+            return
+
+        if fmt == "csv":
+            reader = csv.reader(f)
+            source_col: Optional[int] = None
+            for i, row in enumerate(reader):
+                if i == 0:
+                    lowered = [c.strip().lower() for c in row]
+                    if "source_channel" in lowered:
+                        source_col = lowered.index("source_channel")
+                source = default_source
+                if source_col is not None and source_col < len(row) and row[source_col].strip():
+                    source = row[source_col].strip()
+                for cell in row:
+                    for link in extract_telegram_links(cell):
+                        yield link, source
+            return
+
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                obj = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(obj, dict):
+                continue
+            # same validation as TXT / CSV: non-Telegram URLs are dropped
+            source = str(obj.get("source_channel") or default_source)
+            for link in extract_telegram_links(str(obj.get("link") or obj.get("url") or "")):
+                yield link, source
+
+
+def import_links_file(path: str, default_source: str = "file_import") -> Dict[str, int]:
+    """
+    Stream links from a file into db.add_links() in batches.
+    Returns {"seen": .., "added": ..}.
+    """
+    seen = 0
+    added = 0
+    batches: Dict[str, List[str]] = {}
+
+    def flush(source: str) -> None:
+        nonlocal added
+        batch = batches.pop(source, None)
+        if batch:
+            added += db.add_links(batch, source_channel=source)
+
+    for raw, source in iter_links_from_file(path, default_source):
+        link = normalize_tme_link(raw)
+        if not link:
+            continue
+        seen += 1
+        batch = batches.setdefault(source, [])
+        batch.append(link)
+        if len(batch) >= IMPORT_BATCH_SIZE:
+            flush(source)
+
+    for source in list(batches):
+        flush(source)
+
+    logger.info("[transfer] Imported %s: seen=%s added=%s", path, seen, added)
+    return {"seen": seen, "added": added}
+
+
+# ---------------- export ----------------
+EXPORTS = {
+    "dead": (
+        ("id", "link", "source_channel", "dead_reason", "last_checked_at"),
+        lambda **kw: db.iter_dead_links(chunk_size=EXPORT_CHUNK_SIZE),
+    ),
+    "failed": (
+        ("link_id", "link", "session_id", "join_attempts", "last_error", "assigned_at"),
+        lambda **kw: db.iter_failed_assignments(chunk_size=EXPORT_CHUNK_SIZE),
+    ),
+    "join_log": (
+        ("id", "session_id", "link", "status", "error_message", "created_at"),
+        lambda since=None, until=None: db.iter_join_log(since, until, chunk_size=EXPORT_CHUNK_SIZE),
+    ),
+}
+
+
+def export_csv(kind: str, path: str, since: Optional[str] = None, until: Optional[str] = None) -> int:
+    """
+    Write one export (dead | failed | join_log) to `path` as CSV, chunk by chunk.
+    Returns number of rows written.
+    """
+    header, source = EXPORTS[kind]
+    rows = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        for chunk in source(since=since, until=until):
+            writer.writerows(chunk)
+            rows += len(chunk)
+
+    logger.info("[transfer] Exported %s: %s rows -> %s", kind, rows, path)
+    return rows
@@ -96,6 +96,10 @@ def parse_link_type(link: str) -> tuple[str, str]:
     if not link:
         return ("unknown", "")
 
+    return _parse_normalized(link)
+
+
+def _parse_normalized(link: str) -> tuple[str, str]:
     # folder: https://t.me/addlist/<slug>
     if "/addlist/" in link:
         slug = link.split("/addlist/", 1)[-1].strip("/")
@@ -114,3 +118,60 @@ def parse_link_type(link: str) -> tuple[str, str]:
     # username: https://t.me/<username or channel>
     username = link.split("t.me/", 1)[-1].strip("/")
     return ("username", username)
+
+
+# ---------------- stored link format ----------------
+# links are stored as (kind code, bare value); the URL is derived.
+# Both invite forms (+HASH, joinchat/HASH) share one key.
+LINK_KIND_OTHER = 0  # not a t.me link: value is the link itself
+LINK_KIND_USERNAME = 1
+LINK_KIND_INVITE = 2
+LINK_KIND_FOLDER = 3
+
+LINK_KIND_NAMES = {
+    LINK_KIND_OTHER: "unknown",
+    LINK_KIND_USERNAME: "username",
+    LINK_KIND_INVITE: "invite",
+    LINK_KIND_FOLDER: "folder",
+}
+_KIND_CODES = {name: code for code, name in LINK_KIND_NAMES.items()}
+
+LINK_URL_PREFIX = {
+    LINK_KIND_USERNAME: "https://t.me/",
+    LINK_KIND_INVITE: "https://t.me/+",
+    LINK_KIND_FOLDER: "https://t.me/addlist/",
+}
+
+
+def _is_canonical(link: str) -> bool:
+    # already what normalize_tme_link() returns (the common case: stored
+    # and extracted links); urlparse is the bulk of the parsing cost
+    return (
+        link.startswith("https://t.me/")
+        and not link.endswith("/")
+        and "//" not in link[8:]
+        and not any(c in link for c in "?#; \t\n")
+    )
+
+
+def link_key(link: str) -> tuple[int, str]:
+    """
+    (kind code, value) storage key of a link.
+    """
+    link = (link or "").strip()
+    if not _is_canonical(link):
+        link = normalize_tme_link(link)
+        if not link.startswith("https://t.me/"):
+            return (LINK_KIND_OTHER, link)
+    kind, value = _parse_normalized(link)
+    if not value:
+        return (LINK_KIND_OTHER, link)
+    return (_KIND_CODES.get(kind, LINK_KIND_OTHER), value)
+
+
+def link_url(kind: int, value: str) -> str:
+    """
+    Canonical URL of a stored (kind, value) link.
+    """
+    prefix = LINK_URL_PREFIX.get(kind)
+    return prefix + value if prefix else value